@@ -7,7 +7,6 @@ import sys
 from typing import Dict, List
 
 ANSIBLE_TEMPLATE_MODULE_NAME = "template"
-ANSIBLE_RSYNC_MODULE_NAME = "synchronize"
 
 _ANSIBLE_LOCATION = shutil.which("ansible")
 _ANSIBLE_MODULE_FLAG = "-m"
@@ -1,7 +1,11 @@
+import json
+import logging
 import os
-from tempfile import TemporaryDirectory
+import sys
+from tempfile import TemporaryDirectory, mkstemp
+from typing import Optional, Dict, Any
 
-from git import Repo
+_logger = logging.getLogger(__name__)
 
 
 def is_subdirectory(subdirectory: str, directory: str) -> bool:
@@ -14,6 +18,67 @@ def is_subdirectory(subdirectory: str, directory: str) -> bool:
     return ".." not in os.path.relpath(subdirectory, directory)
 
 
+def intern(value: Optional[str]) -> Optional[str]:
+    """
+    Interns the given string, so that equal strings used by many objects (e.g. the same path in the synchronisations of
+    thousands of repositories) share the same copy.
+    :param value: the string to intern (or `None`)
+    :return: the interned string
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
+def get_size(location: str) -> int:
+    """
+    Gets the size of the files in the given directory.
+    :param location: location of the directory
+    :return: the total size (in bytes)
+    """
+    size = 0
+    for directory, _, file_names in os.walk(location):
+        for name in file_names:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def read_json(location: str) -> Optional[Any]:
+    """
+    Reads the JSON in the given file.
+    :param location: location of the file
+    :return: the value in the file or `None` if the file does not exist or does not contain valid JSON (e.g. if it was
+    left partially written by an earlier version)
+    """
+    try:
+        with open(location, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        _logger.warning(f"Ignoring invalid JSON in {location}: {e}")
+        return None
+
+
+def write_json(location: str, value: Any):
+    """
+    Writes the given value as JSON to the given file, replacing the file atomically so that it is never seen (or left)
+    partially written.
+    :param location: location of the file
+    :param value: the value to write
+    """
+    file_descriptor, temporary = mkstemp(dir=os.path.dirname(os.path.abspath(location)),
+                                         prefix=f".{os.path.basename(location)}.")
+    try:
+        with open(file_descriptor, "w") as file:
+            json.dump(value, file)
+        os.replace(temporary, location)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
 def get_head_commit(location: str, branch: str) -> str:
     """
     Gets the ID of the head commit for the given branch in the Git repository accessible at the given location.
@@ -21,10 +86,27 @@ def get_head_commit(location: str, branch: str) -> str:
     :param branch: the branch of interest
     :return: the (short) ID of the head commit
     """
+    from git import Repo
+
     with TemporaryDirectory() as temp_directory:
         subrepo_remote = Repo.init(temp_directory)
         origin = subrepo_remote.create_remote("origin", location)
         fetch_infos = origin.fetch()
         for fetch_info in fetch_infos:
             if fetch_info.name == f"origin/{branch}":
-                return fetch_info.commit.hexsha[0:7]
\ No newline at end of file
+                return fetch_info.commit.hexsha[0:7]
+
+
+def get_remote_head_commit(location: str, branch: str, environment: Dict[str, str]=None) -> Optional[str]:
+    """
+    Gets the ID of the head commit for the given branch in the Git repository accessible at the given location, without
+    fetching it.
+    :param location: the location of the repository
+    :param branch: the branch of interest
+    :param environment: additional environment variables to set when calling git (e.g. `GIT_SSH_COMMAND`)
+    :return: the (full) ID of the head commit or `None` if the branch does not exist
+    """
+    from git import Git
+
+    output = Git().ls_remote(location, f"refs/heads/{branch}", env=environment)
+    return output.split()[0] if len(output) > 0 else None
@@ -0,0 +1,253 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from collections import ChainMap
+from tempfile import mkdtemp
+from typing import Any, Dict, List, Mapping
+
+from ansible import constants
+from ansible.parsing.mod_args import ModuleArgsParser
+from ansible.plugins.action import ActionBase
+
+from gitcommonsync.ansible_module import generate_output_information, generate_repositories_output_information, \
+    PARALLELISM_PROPERTY, REPOSITORIES_RETURN_PROPERTY, SYNCHRONISED_RETURN_PROPERTY, DEFAULT_PARALLELISM, \
+    _ARGUMENT_SPEC
+from gitcommonsync.batching import synchronise_hosts, Job
+from gitcommonsync.copying import StagingArea
+from gitcommonsync.rendering import RenderCache
+from gitcommonsync.specification import REPOSITORY_URL_PROPERTY, REPOSITORIES_PROPERTY, parse_jobs
+
+HOSTS_RETURN_PROPERTY = "hosts"
+
+_LOCAL_TRANSPORT = "local"
+_BATCH_FILE_PREFIX = "gitcommonsync-batch-"
+_RENDER_CACHE_FILE_NAME = "render-cache.db"
+
+
+class ActionModule(ActionBase):
+    """
+    Runs the `gitcommonsync` module for every host in the play batch at once, on the controller.
+
+    The module's arguments are collected from each host (by templating the task with each host's variables) and merged,
+    so that each distinct repository is checked out, synchronised and pushed once, with identical synchronisations
+    applied once, using a render cache and staging area shared by all of the repositories. Each host then gets the
+    result that the module would have given it.
+
+    The batch is made of the hosts in the play batch for which the task's conditional (`when`) holds. The first host to
+    reach the task runs the batch; the other hosts take their result from it. If the task is run once (`run_once`), the
+    result of every host is instead returned in `hosts`.
+
+    Batching only applies when the task runs on the controller (i.e. with a local connection, as the sources and
+    repositories are then accessed from the controller anyway) and is not looped or asynchronous: otherwise, the module
+    is run as normal. To use, create `action_plugins/gitcommonsync.py` (next to the playbook or in a role) containing
+    `from gitcommonsync.ansible_action import ActionModule`.
+    """
+    TRANSFERS_FILES = False
+
+    def run(self, tmp=None, task_vars=None):
+        task_vars = task_vars if task_vars is not None else {}
+        result = super().run(tmp, task_vars)
+
+        if self._connection.transport != _LOCAL_TRANSPORT or "ansible_loop_var" in task_vars \
+                or self._task.async_val:
+            result.update(self._execute_module(module_name=self._task.action, module_args=self._task.args,
+                                               task_vars=task_vars))
+            return result
+
+        host = task_vars["inventory_hostname"]
+        hosts = self._get_batch_hosts(host, task_vars)
+
+        if self._task.run_once:
+            host_results = self._synchronise_batch(hosts, host, task_vars)
+            result[HOSTS_RETURN_PROPERTY] = host_results
+            result["changed"] = any(host_result.get("changed", False) for host_result in host_results.values())
+            failed = [name for name, host_result in host_results.items() if host_result.get("failed", False)]
+            if len(failed) > 0:
+                result["failed"] = True
+                result["msg"] = f"Failed to synchronise the repositories of {len(failed)} of {len(hosts)} hosts: " \
+                                f"{', '.join(failed)}"
+            return result
+
+        result.update(self._take_batch_result(hosts, host, task_vars))
+        return result
+
+    def _get_batch_hosts(self, host: str, task_vars: Dict[str, Any]) -> List[str]:
+        """
+        Gets the hosts in the batch, which are the hosts in the play batch that run the task.
+        :param host: the host running the task
+        :param task_vars: the variables of the host running the task
+        :return: the hosts in the batch
+        """
+        hosts = []
+        for name in task_vars.get("ansible_play_batch", [host]):
+            if name == host:
+                hosts.append(name)
+                continue
+            try:
+                included = self._evaluate_conditional(self._get_host_variables(name, task_vars))
+            except Exception as e:
+                # The host fails the task itself, without running it
+                included = False
+                self._display.vvv(f"Cannot evaluate conditional of {name}: {e}")
+            if included:
+                hosts.append(name)
+        if host not in hosts:
+            hosts.append(host)
+        return hosts
+
+    def _evaluate_conditional(self, variables: Mapping[str, Any]) -> bool:
+        """
+        Evaluates the task's conditional (`when`) with the given variables.
+        :param variables: the variables of the host to evaluate the conditional for
+        :return: whether the host runs the task
+        """
+        previous_variables = self._templar.available_variables
+        self._templar.available_variables = variables
+        try:
+            if hasattr(self._task, "evaluate_conditional"):
+                return self._task.evaluate_conditional(self._templar, variables)
+            # Ansible 2.19 onwards
+            return self._task._resolve_conditional(self._task.when, variables)
+        finally:
+            self._templar.available_variables = previous_variables
+
+    def _take_batch_result(self, hosts: List[str], host: str, task_vars: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Takes the given host's result from the batch of the given hosts, running the batch if no other host has yet.
+        :param hosts: the hosts in the batch
+        :param host: the host running the task
+        :param task_vars: the variables of the host running the task
+        :return: the host's result
+        """
+        # The task's ID is the same for every host, and the batch is identified by its hosts (e.g. as `serial` plays
+        # run the task for different batches). The files are kept in the run's private temporary directory (made with
+        # `mkdtemp` by the controller before forking the hosts' processes and removed when the run exits)
+        batch = hashlib.sha1(json.dumps(sorted(hosts)).encode("utf-8")).hexdigest()
+        prefix = os.path.join(constants.DEFAULT_LOCAL_TMP, f"{_BATCH_FILE_PREFIX}{self._task._uuid}-{batch}")
+        lock_location, results_location = f"{prefix}.lock", f"{prefix}.json"
+
+        with open(lock_location, "a") as lock_file:
+            # Hosts run the task in separate processes
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if os.path.exists(results_location):
+                with open(results_location, "r") as file:
+                    host_results = json.load(file)
+            else:
+                host_results = self._synchronise_batch(hosts, host, task_vars)
+
+            host_result = host_results.pop(host)
+            if len(host_results) > 0:
+                with open(results_location, "w") as file:
+                    json.dump(host_results, file)
+            else:
+                # The last host of the batch removes the files
+                for location in (results_location, lock_location):
+                    if os.path.exists(location):
+                        os.remove(location)
+        return host_result
+
+    def _synchronise_batch(self, hosts: List[str], host: str, task_vars: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Synchronises the repositories of all of the given hosts.
+        :param hosts: the hosts
+        :param host: the host running the task
+        :param task_vars: the variables of the host running the task
+        :return: the result of each host, indexed by host name
+        """
+        host_results: Dict[str, Dict[str, Any]] = {}
+        arguments_by_host: Dict[str, Dict[str, Any]] = {}
+        jobs_by_host: Dict[str, List[Job]] = {}
+        for name in hosts:
+            try:
+                arguments = self._get_arguments(name, host, task_vars)
+                jobs = parse_jobs(arguments)
+            except Exception as e:
+                host_results[name] = {"failed": True, "changed": False, "msg": str(e)}
+                continue
+            arguments_by_host[name] = arguments
+            jobs_by_host[name] = jobs
+
+        parallelism = max((arguments[PARALLELISM_PROPERTY] for arguments in arguments_by_host.values()),
+                          default=DEFAULT_PARALLELISM)
+        cache_directory = mkdtemp(prefix=_BATCH_FILE_PREFIX)
+        render_cache = RenderCache(os.path.join(cache_directory, _RENDER_CACHE_FILE_NAME))
+        staging_area = StagingArea(os.path.join(cache_directory, "staging"))
+        try:
+            results_by_host = synchronise_hosts(
+                jobs_by_host, dry_run=self._task.check_mode, parallelism=parallelism,
+                render_cache=render_cache, staging_area=staging_area)
+        finally:
+            shutil.rmtree(cache_directory, ignore_errors=True)
+
+        for name, results in results_by_host.items():
+            if arguments_by_host[name][REPOSITORIES_PROPERTY] is None:
+                result = results[0]
+                host_results[name] = {"changed": result.changed,
+                                      SYNCHRONISED_RETURN_PROPERTY: generate_output_information(result.synchronised)} \
+                    if result.succeeded else {"failed": True, "changed": False, "msg": str(result.error)}
+                continue
+            changed = any(result.changed for result in results)
+            host_result = {"changed": changed,
+                           REPOSITORIES_RETURN_PROPERTY: generate_repositories_output_information(results)}
+            failures = [result for result in results if not result.succeeded]
+            if len(failures) > 0:
+                host_result["failed"] = True
+                host_result["msg"] = f"Failed to synchronise {len(failures)} of {len(results)} repositories"
+            host_results[name] = host_result
+        return host_results
+
+    def _get_arguments(self, name: str, host: str, task_vars: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Gets the module arguments of the given host, with defaults set.
+        :param name: the host to get the arguments of
+        :param host: the host running the task
+        :param task_vars: the variables of the host running the task
+        :return: the module arguments
+        :raises ValueError: if the arguments are not valid
+        """
+        if name == host:
+            arguments = dict(self._task.args)
+        else:
+            # The raw arguments are templated with the other host's variables
+            _, raw_arguments, _ = ModuleArgsParser(task_ds=self._task.get_ds(),
+                                                   collection_list=self._task.collections).parse()
+            previous_variables = self._templar.available_variables
+            self._templar.available_variables = self._get_host_variables(name, task_vars)
+            try:
+                arguments = self._templar.template(raw_arguments)
+            finally:
+                self._templar.available_variables = previous_variables
+        return _set_defaults(arguments)
+
+    def _get_host_variables(self, name: str, task_vars: Dict[str, Any]) -> Mapping[str, Any]:
+        """
+        Gets the variables of the given host, falling back to those of the host running the task for the variables that
+        are not specific to a host (e.g. those of the play and roles).
+        :param name: the host to get the variables of
+        :param task_vars: the variables of the host running the task
+        :return: the variables
+        """
+        return ChainMap(task_vars["hostvars"][name], task_vars)
+
+
+def _set_defaults(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates the given module arguments and sets defaults, as the module does.
+    :param arguments: the module arguments
+    :return: the arguments with defaults set
+    :raises ValueError: if the arguments are not valid
+    """
+    unknown = set(arguments.keys()) - set(_ARGUMENT_SPEC.keys())
+    if len(unknown) > 0:
+        raise ValueError(f"Unsupported parameters: {', '.join(sorted(unknown))}")
+    if (arguments.get(REPOSITORY_URL_PROPERTY) is None) == (arguments.get(REPOSITORIES_PROPERTY) is None):
+        raise ValueError(f"One of {REPOSITORY_URL_PROPERTY} or {REPOSITORIES_PROPERTY} is required (but not both)")
+    arguments = {**{name: specification.get("default") for name, specification in _ARGUMENT_SPEC.items()},
+                 **{name: value for name, value in arguments.items() if value is not None}}
+    if int(arguments[PARALLELISM_PROPERTY]) < 1:
+        raise ValueError(f"{PARALLELISM_PROPERTY} must be at least 1 (given: {arguments[PARALLELISM_PROPERTY]})")
+    arguments[PARALLELISM_PROPERTY] = int(arguments[PARALLELISM_PROPERTY])
+    return arguments
+
@@ -11,6 +11,9 @@ EXAMPLES = """
         overwrite: false
       - src: /example/directory/
         dest: config
+        exclude:
+          - .cache/
+          - "*.pyc"
     templates:
       - src: /example/ansible-groups.sh.j2
         dest: ci/before_scripts.d/start.sh
@@ -22,13 +25,31 @@ EXAMPLES = """
         dest: subrepos/other-repository
         branch: master
         overwrite: true
+
+- gitcommonsync:
+    repositories:
+      - git@gitlab.example.com:user/repository-1.git
+      - repository: git@gitlab.example.com:user/repository-2.git
+        branch: develop
+        key_file: /custom/other_id_rsa
+        variables:
+          message: "Hello other world"
+    parallelism: 8
+    templates:
+      - src: /example/ansible-groups.sh.j2
+        dest: ci/before_scripts.d/start.sh
+        variables:
+          message: "Hello world"
+        overwrite: true
 """
 
 try:
+    # Note: these imports are cheap - the heavy dependencies (e.g. GitPython) are only imported when they are used
     from gitcommonsync.synchronisers import TemplateSynchroniser, Synchronisable
     from gitcommonsync.repository import GitRepository, GitCheckout
     from gitcommonsync.models import TemplateSynchronisation, FileSynchronisation, SubrepoSynchronisation
-    from gitcommonsync.helpers import synchronise
+    from gitcommonsync.helpers import synchronise, synchronise_repositories, RepositorySynchronisationResult
+    from gitcommonsync.specification import parse_configuration, parse_repositories_configuration
     _HAS_DEPENDENCIES = True
 except ImportError as e:
     _HAS_DEPENDENCIES = False
@@ -36,42 +57,45 @@ except ImportError as e:
 
 import sys
 import traceback
+from importlib.util import find_spec
 from typing import Any, Dict, Tuple, List, Type, DefaultDict
 
 from ansible.module_utils.basic import AnsibleModule
 
+_REQUIRED_PYTHON_MODULES = ["git"]
+_REQUIRED_SUBREPO_PYTHON_MODULES = ["gitsubrepo"]
 
+# Defined here (with the same names as in `specification`) so that the arguments can be parsed, and a missing
+# dependency reported, without importing anything else from this package
 REPOSITORY_URL_PROPERTY = "repository"
 REPOSITORY_BRANCH_PROPERTY = "branch"
 REPOSITORY_AUTHOR_NAME_PROPERTY = "author_name"
 REPOSITORY_AUTHOR_EMAIL_PROPERTY = "author_email"
 REPOSITORY_KEY_FILE_PROPERTY = "key_file"
-
+REPOSITORIES_PROPERTY = "repositories"
 TEMPLATES_PROPERTY = "templates"
 FILES_PROPERTY = "files"
 SUBREPOS_PROPERTY = "subrepos"
-
-TEMPLATE_SOURCE_PROPERTY = "src"
-TEMPLATE_DESTINATION_PROPERTY = "dest"
-TEMPLATE_OVERWRITE_PROPERTY = "overwrite"
-TEMPLATE_VARIABLES_PROPERTY = "variables"
-
-FILE_SOURCE_PROPERTY = "src"
-FILE_DESTINATION_PROPERTY = "dest"
-FILE_OVERWRITE_PROPERTY = "overwrite"
-
-SUBREPO_URL_PROPERTY = "src"
-SUBREPO_BRANCH_PROPERTY = "branch"
-SUBREPO_COMMIT_PROPERTY = "commit"
-SUBREPO_DIRECTORY_PROPERTY = "dest"
-SUBREPO_OVERWRITE_PROPERTY = "overwrite"
+PARALLELISM_PROPERTY = "parallelism"
 
 CHANGED_TEMPLATES_RETURN_PROPERTY = "templates"
 CHANGED_FILES_RETURN_PROPERTY = "files"
 CHANGED_SUBREPOS_RETURN_PROPERTY = "subrepos"
 
+REPOSITORIES_RETURN_PROPERTY = "repositories"
+REPOSITORY_URL_RETURN_PROPERTY = "repository"
+REPOSITORY_BRANCH_RETURN_PROPERTY = "branch"
+REPOSITORY_CHANGED_RETURN_PROPERTY = "changed"
+REPOSITORY_FAILED_RETURN_PROPERTY = "failed"
+REPOSITORY_MESSAGE_RETURN_PROPERTY = "msg"
+SYNCHRONISED_RETURN_PROPERTY = "synchronised"
+
+DEFAULT_PARALLELISM = 1
+
 _ARGUMENT_SPEC = {
-    REPOSITORY_URL_PROPERTY: dict(required=True, type="str"),
+    REPOSITORY_URL_PROPERTY: dict(required=False, type="str"),
+    REPOSITORIES_PROPERTY: dict(required=False, type="list"),
+    PARALLELISM_PROPERTY: dict(required=False, default=DEFAULT_PARALLELISM, type="int"),
     REPOSITORY_BRANCH_PROPERTY: dict(required=False, default="master", type="str"),
     REPOSITORY_AUTHOR_NAME_PROPERTY: dict(required=False, type="str"),
     REPOSITORY_AUTHOR_EMAIL_PROPERTY: dict(required=False, type="str"),
@@ -80,6 +104,8 @@ _ARGUMENT_SPEC = {
     FILES_PROPERTY: dict(required=False, default=[], type="list"),
     SUBREPOS_PROPERTY: dict(required=False, default=[], type="list")
 }
+_MUTUALLY_EXCLUSIVE_ARGUMENTS = [[REPOSITORY_URL_PROPERTY, REPOSITORIES_PROPERTY]]
+_REQUIRED_ONE_OF_ARGUMENTS = [[REPOSITORY_URL_PROPERTY, REPOSITORIES_PROPERTY]]
 
 
 def fail_if_missing_dependencies(module: AnsibleModule):
@@ -94,59 +120,13 @@ def fail_if_missing_dependencies(module: AnsibleModule):
         module.fail_json(msg="A required Python module is not installed: %s" % traceback.format_exception(
             type(_IMPORT_ERROR), _IMPORT_ERROR, _IMPORT_ERROR.__traceback__))
 
-
-def parse_configuration(arguments: Dict[str, Any]) -> Tuple["GitRepository", List["Synchronisable"]]:
-    """
-    Parses the configuration defined in Ansible.
-    :param arguments: the arguments passed to this module by Ansible
-    :return: tuple where the first element is the git repository that is to be synchronised and the seocnd is the
-    configuration that defines how it is to be synchronised
-    """
-    repository_location = arguments[REPOSITORY_URL_PROPERTY]
-    branch = arguments[REPOSITORY_BRANCH_PROPERTY]
-    author_name = arguments[REPOSITORY_AUTHOR_NAME_PROPERTY]
-    author_email = arguments[REPOSITORY_AUTHOR_EMAIL_PROPERTY]
-    private_key_file = arguments[REPOSITORY_KEY_FILE_PROPERTY]
-
-    repository = GitRepository(remote=repository_location, branch=branch, private_key_file=private_key_file,
-                               author_name=author_name, author_email=author_email)
-
-    synchronisations: List[Synchronisable] = []
-
-    synchronisations.extend([
-        TemplateSynchronisation(
-            source=configuration[TEMPLATE_SOURCE_PROPERTY],
-            destination=configuration[TEMPLATE_DESTINATION_PROPERTY],
-            overwrite=configuration[TEMPLATE_OVERWRITE_PROPERTY]
-            if TEMPLATE_OVERWRITE_PROPERTY in configuration else False,
-            variables=configuration[TEMPLATE_VARIABLES_PROPERTY]
-        )
-        for configuration in arguments[TEMPLATES_PROPERTY]
-    ])
-
-    synchronisations.extend([
-        FileSynchronisation(
-            source=configuration[FILE_SOURCE_PROPERTY],
-            destination=configuration[FILE_DESTINATION_PROPERTY],
-            overwrite=configuration[FILE_OVERWRITE_PROPERTY] if FILE_OVERWRITE_PROPERTY in configuration else False
-        )
-        for configuration in arguments[FILES_PROPERTY]
-    ])
-
-    synchronisations.extend([
-        SubrepoSynchronisation(
-            checkout=GitCheckout(
-                url=configuration[SUBREPO_URL_PROPERTY],
-                branch=configuration[SUBREPO_BRANCH_PROPERTY],
-                commit=configuration[SUBREPO_COMMIT_PROPERTY] if SUBREPO_COMMIT_PROPERTY in configuration else None,
-                directory=configuration[SUBREPO_DIRECTORY_PROPERTY]
-            ),
-            overwrite=configuration[SUBREPO_OVERWRITE_PROPERTY] if SUBREPO_OVERWRITE_PROPERTY in configuration else False
-        )
-        for configuration in arguments[SUBREPOS_PROPERTY]
-    ])
-
-    return repository, synchronisations
+    # Checks that the modules are installed without paying the cost of importing them
+    required_modules = list(_REQUIRED_PYTHON_MODULES)
+    if len(module.params[SUBREPOS_PROPERTY]) > 0:
+        required_modules += _REQUIRED_SUBREPO_PYTHON_MODULES
+    missing_modules = [name for name in required_modules if find_spec(name) is None]
+    if len(missing_modules) > 0:
+        module.fail_json(msg="A required Python module is not installed: %s" % ", ".join(missing_modules))
 
 
 def generate_output_information(
@@ -166,15 +146,44 @@ def generate_output_information(
     }
 
 
+def generate_repositories_output_information(results: List["RepositorySynchronisationResult"]) \
+        -> List[Dict[str, Any]]:
+    """
+    Generates output information about the synchronisation of multiple repositories.
+    :param results: the result of synchronising each repository
+    :return: output in the form of JSON
+    """
+    output = []
+    for result in results:
+        information = {
+            REPOSITORY_URL_RETURN_PROPERTY: result.repository.remote,
+            REPOSITORY_BRANCH_RETURN_PROPERTY: result.repository.branch,
+            REPOSITORY_CHANGED_RETURN_PROPERTY: result.changed,
+            REPOSITORY_FAILED_RETURN_PROPERTY: not result.succeeded,
+            SYNCHRONISED_RETURN_PROPERTY: generate_output_information(result.synchronised)
+        }
+        if not result.succeeded:
+            information[REPOSITORY_MESSAGE_RETURN_PROPERTY] = str(result.error)
+        output.append(information)
+    return output
+
+
 def main():
     """
     Entrypoint.
     """
     module = AnsibleModule(
         argument_spec=_ARGUMENT_SPEC,
+        mutually_exclusive=_MUTUALLY_EXCLUSIVE_ARGUMENTS,
+        required_one_of=_REQUIRED_ONE_OF_ARGUMENTS,
         supports_check_mode=True
     )
     fail_if_missing_dependencies(module)
+
+    if module.params[REPOSITORIES_PROPERTY] is not None:
+        main_for_repositories(module)
+        return
+
     repository, synchronisations = parse_configuration(module.params)
 
     synchronised_grouped_by_type = synchronise(repository, synchronisations, dry_run=module.check_mode)
@@ -187,5 +196,29 @@ def main():
         synchronised_grouped_by_type))
 
 
+def main_for_repositories(module: AnsibleModule):
+    """
+    Entrypoint when multiple repositories are to be synchronised.
+    :param module: the Ansible Module
+    """
+    parallelism = module.params[PARALLELISM_PROPERTY]
+    if parallelism < 1:
+        module.fail_json(msg=f"{PARALLELISM_PROPERTY} must be at least 1 (given: {parallelism})")
+    try:
+        jobs = parse_repositories_configuration(module.params)
+    except ValueError as e:
+        module.fail_json(msg=str(e))
+
+    results = synchronise_repositories(jobs, dry_run=module.check_mode, parallelism=parallelism)
+    changed = any(result.changed for result in results)
+    output = {REPOSITORIES_RETURN_PROPERTY: generate_repositories_output_information(results)}
+
+    failures = [result for result in results if not result.succeeded]
+    if len(failures) > 0:
+        module.fail_json(msg=f"Failed to synchronise {len(failures)} of {len(results)} repositories", changed=changed,
+                         **output)
+    module.exit_json(changed=changed, **output)
+
+
 if __name__ == "__main__":
     main()
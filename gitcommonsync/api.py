@@ -0,0 +1,609 @@
+import base64
+import json
+import logging
+import os
+import posixpath
+import stat
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple, Any, DefaultDict, TYPE_CHECKING
+from urllib.parse import urlsplit, quote, urlencode
+
+from gitcommonsync.blobs import get_blob_id, get_content_blob_id, get_object_format, SHA1_OBJECT_FORMAT
+from gitcommonsync.filters import PathFilter
+from gitcommonsync.models import FileSynchronisation, TemplateSynchronisation, Synchronisation
+from gitcommonsync.rendering import RenderCache, render_template
+from gitcommonsync.synchronisers import SynchronisationResult, SynchronisationListener
+
+# Note: `http.client` is imported when first used, as it is slow to import (which is paid by every Ansible module run)
+if TYPE_CHECKING:
+    from http.client import HTTPConnection
+    from gitcommonsync.scheduling import HostScheduler
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_MAX_IDLE_CONNECTIONS = 4
+
+REGULAR_FILE_MODE = "100644"
+EXECUTABLE_FILE_MODE = "100755"
+
+_CREATE_ACTION = "create"
+_UPDATE_ACTION = "update"
+_DELETE_ACTION = "delete"
+_CHMOD_ACTION = "chmod"
+
+_TREE_PAGE_SIZE = 100
+_NOT_FOUND_STATUS = 404
+# Methods that can be repeated without changing the outcome, so can be retried if the response is lost
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD"})
+
+# Content, mode and blob ID of a file
+_TreeEntry = Tuple[Optional[bytes], str, str]
+
+
+class ApiError(Exception):
+    """
+    Error returned by a Git hosting service's REST API.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(f"API request failed with status {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class HttpConnectionPool:
+    """
+    Thread-safe pool of persistent (keep-alive) HTTP(S) connections, which can be shared between repositories so that
+    requests to the same host reuse connections rather than each making a new one.
+    """
+    def __init__(self, max_idle_connections: int=DEFAULT_MAX_IDLE_CONNECTIONS, timeout: float=DEFAULT_TIMEOUT):
+        """
+        Constructor.
+        :param max_idle_connections: the maximum number of idle connections to keep open to each host
+        :param timeout: timeout (in seconds) of connecting and of each read from a connection
+        """
+        self.max_idle_connections = max_idle_connections
+        self.timeout = timeout
+        self.connections_made = 0
+        self._idle: DefaultDict[Tuple[str, str], List["HTTPConnection"]] = defaultdict(list)
+        self._lock = Lock()
+
+    def request(self, method: str, url: str, body: bytes=None, headers: Dict[str, str]=None) \
+            -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Makes a request, on an idle connection to the host if there is one.
+        :param method: the HTTP method
+        :param url: the URL
+        :param body: optional body of the request
+        :param headers: optional headers of the request
+        :return: tuple where the first element is the status, the second the headers and the third the body of the
+        response
+        """
+        from http.client import HTTPException
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = f"{parts.path}?{parts.query}" if parts.query != "" else parts.path
+        while True:
+            connection, reused = self._acquire(key)
+            sent = False
+            try:
+                connection.request(method, path, body=body, headers=headers if headers is not None else {})
+                sent = True
+                response = connection.getresponse()
+                content = response.read()
+            except (HTTPException, ConnectionError) as e:
+                connection.close()
+                # The server may close an idle connection at any time, in which case the request is made on a new one.
+                # Requests that are not idempotent are only retried if they failed to send, as otherwise they may have
+                # been applied
+                if reused and (not sent or method.upper() in _IDEMPOTENT_METHODS):
+                    _logger.debug(f"Reconnecting to {parts.netloc} after idle connection closed: {e}")
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            return response.status, {name.lower(): value for name, value in response.getheaders()}, content
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def _acquire(self, key: Tuple[str, str]) -> Tuple["HTTPConnection", bool]:
+        """
+        Takes an idle connection to the given host, or makes a new connection if there are none.
+        :param key: the scheme and host (with port) of the connection
+        :return: tuple where the first element is the connection and the second is whether it has been used before
+        """
+        from http.client import HTTPConnection, HTTPSConnection
+
+        with self._lock:
+            if len(self._idle[key]) > 0:
+                return self._idle[key].pop(), True
+            self.connections_made += 1
+        scheme, host = key
+        if scheme == "https":
+            return HTTPSConnection(host, timeout=self.timeout), False
+        elif scheme == "http":
+            return HTTPConnection(host, timeout=self.timeout), False
+        raise ValueError(f"Unsupported URL scheme: {scheme}")
+
+    def _release(self, key: Tuple[str, str], connection: "HTTPConnection"):
+        """
+        Returns the given connection to the pool, closing it if the pool already has enough idle connections to its
+        host.
+        :param key: the scheme and host (with port) of the connection
+        :param connection: the connection
+        """
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle_connections:
+                self._idle[key].append(connection)
+                return
+        connection.close()
+
+
+class ApiRepository:
+    """
+    Branch of a repository on a Git hosting service that is changed with the service's REST API (GitLab's v4 API)
+    rather than by checking it out, so synchronising a few small files takes a few requests rather than a clone.
+
+    Can be used in place of a `GitRepository` with `helpers.synchronise` and `helpers.synchronise_repositories` for
+    file and template synchronisations (see `ApiSynchroniser`).
+    """
+    def __init__(self, api_url: str, project: str, branch: str, *, token: str=None, author_name: str=None,
+                 author_email: str=None, create_branch: bool=True, pool: HttpConnectionPool=None,
+                 scheduler: "HostScheduler"=None):
+        """
+        Constructor.
+        :param api_url: URL of the API, e.g. https://gitlab.example.com/api/v4
+        :param project: ID or path (e.g. `group/name`) of the project
+        :param branch: the branch to change
+        :param token: optional access token
+        :param author_name: the commit author's name (defaults to the owner of the token)
+        :param author_email: the commit author's email address (defaults to the owner of the token)
+        :param create_branch: whether the branch should be created (from the project's default branch) if it does not
+        exist
+        :param pool: optional pool of connections, shared with other repositories (a pool is made for the repository
+        if not given)
+        :param scheduler: optional scheduler, shared with other repositories, that limits the rate of the requests made
+        to the service's host
+        """
+        self.api_url = api_url.rstrip("/")
+        self.project = project
+        self.branch = branch
+        self.token = token
+        self.author_name = author_name
+        self.author_email = author_email
+        self.create_branch = create_branch
+        self.pool = pool if pool is not None else HttpConnectionPool()
+        self.scheduler = scheduler
+        self.remote = f"{self.api_url}/projects/{quote(project, safe='')}"
+        # Never checked out, and changes are committed (and so pushed) by a single request
+        self.checkout_location = None
+        self.defer_pushes = False
+        self._head: Optional[str] = None
+
+    def tear_down(self):
+        """
+        Does nothing, as the repository is never checked out.
+        """
+
+    def push_deferred(self) -> bool:
+        """
+        Does nothing, as changes are committed directly on the remote.
+        :return: `False`
+        """
+        return False
+
+    def get_head(self) -> Optional[str]:
+        """
+        Gets the ID of the commit at the head of the branch when last read or committed to.
+        :return: the (full) ID of the head commit or `None` if not known (or the branch does not exist)
+        """
+        return self._head
+
+    def get_remote_head(self) -> Optional[str]:
+        """
+        Gets the ID of the commit at the head of the branch.
+        :return: the (full) ID of the head commit or `None` if the branch does not exist
+        """
+        if self.scheduler is not None:
+            self.scheduler.wait_to_fetch(self.remote)
+        branch = self._request("GET", f"/repository/branches/{quote(self.branch, safe='')}", missing_ok=True)
+        self._head = branch["commit"]["id"] if branch is not None else None
+        return self._head
+
+    def get_tree(self) -> Dict[str, Tuple[str, str]]:
+        """
+        Gets the files at the head of the branch or, if the branch does not exist and is to be created, the files at the
+        head of the project's default branch (from which it is created on commit).
+        :return: the mode and blob ID of each file, where keys are paths relative to the root of the repository (empty
+        if the branch does not exist and is not created from another branch)
+        """
+        tree = self._get_tree(self.branch)
+        if tree is None and self.create_branch:
+            default_branch = self._get_default_branch()
+            if default_branch is not None and default_branch != self.branch:
+                tree = self._get_tree(default_branch)
+        return tree if tree is not None else {}
+
+    def commit(self, commit_message: str, actions: List[Dict[str, Any]]):
+        """
+        Commits the given changes to the branch, in a single request.
+        :param commit_message: the message to associate to the commit
+        :param actions: the changes, as GitLab commit actions
+        """
+        payload: Dict[str, Any] = {"branch": self.branch, "commit_message": commit_message, "actions": actions}
+        if self.author_name is not None and self.author_email is not None:
+            payload.update(author_name=self.author_name, author_email=self.author_email)
+        if self.get_remote_head() is None:
+            if not self.create_branch:
+                raise ValueError(f"Branch {self.branch} does not exist in {self.remote}")
+            default_branch = self._get_default_branch()
+            if default_branch is not None and default_branch != self.branch:
+                payload["start_branch"] = default_branch
+        if self.scheduler is not None:
+            self.scheduler.wait_to_push(self.remote)
+        self._head = self._request("POST", "/repository/commits", payload)["id"]
+
+    def _get_tree(self, ref: str) -> Optional[Dict[str, Tuple[str, str]]]:
+        """
+        Gets the files at the given ref.
+        :param ref: the branch (or other ref)
+        :return: see `get_tree` or `None` if the ref does not exist
+        """
+        if self.scheduler is not None:
+            self.scheduler.wait_to_fetch(self.remote)
+        tree: Dict[str, Tuple[str, str]] = {}
+        page = "1"
+        while page != "":
+            query = urlencode({"ref": ref, "recursive": "true", "per_page": _TREE_PAGE_SIZE, "page": page})
+            status, headers, content = self._request_raw("GET", f"/repository/tree?{query}")
+            if status == _NOT_FOUND_STATUS:
+                return None
+            for entry in _parse_response(status, content):
+                if entry["type"] == "blob":
+                    tree[entry["path"]] = (entry["mode"], entry["id"])
+            page = headers.get("x-next-page", "")
+        return tree
+
+    def _get_default_branch(self) -> Optional[str]:
+        """
+        Gets the project's default branch.
+        :return: the default branch or `None` if the project has no branches
+        """
+        return self._request("GET", "")["default_branch"]
+
+    def _request(self, method: str, path: str, payload: Dict[str, Any]=None, missing_ok: bool=False) -> Any:
+        """
+        Makes a request to the project's API.
+        :param method: the HTTP method
+        :param path: the path of the endpoint, relative to the project
+        :param payload: optional JSON payload
+        :param missing_ok: whether to return `None`, rather than raise, if what was requested does not exist
+        :return: the (decoded JSON) response
+        :raises ApiError: if the request failed
+        """
+        status, _, content = self._request_raw(method, path, payload)
+        if missing_ok and status == _NOT_FOUND_STATUS:
+            return None
+        return _parse_response(status, content)
+
+    def _request_raw(self, method: str, path: str, payload: Dict[str, Any]=None) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Makes a request to the project's API, without checking the response.
+        :param method: the HTTP method
+        :param path: the path of the endpoint, relative to the project
+        :param payload: optional JSON payload
+        :return: see `HttpConnectionPool.request`
+        """
+        headers = {"Accept": "application/json"}
+        if self.token is not None:
+            headers["PRIVATE-TOKEN"] = self.token
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        return self.pool.request(method, f"{self.remote}{path}", body, headers)
+
+
+class ApiSynchroniser:
+    """
+    Synchroniser of files and templates that changes a repository through its hosting service's REST API.
+
+    The blob IDs of the files on the branch are compared with those of the content to synchronise, so only files that
+    change are uploaded, and all changes are made in one commit. Files are synchronised with the same semantics as
+    `FileSynchroniser` (apart from symlinks, which cannot be created through the API) and templates must be renderable
+    without Ansible (see `rendering.render_template`).
+    """
+    def __init__(self, repository: ApiRepository, render_cache: RenderCache=None):
+        """
+        Constructor.
+        :param repository: the repository to synchronise
+        :param render_cache: optional cache of rendered templates
+        """
+        self.repository = repository
+        self.render_cache = render_cache
+
+    def synchronise(self, synchronisables: List[Synchronisation], dry_run: bool=False,
+                    listener: SynchronisationListener=None) -> List[Synchronisation]:
+        """
+        Synchronises the repository with the given synchronisations.
+        :param synchronisables: the file and template synchronisations to apply
+        :param dry_run: will not commit the changes if `True`
+        :param listener: optional listener that is given the result of each synchronisation, once the changes have been
+        committed
+        :return: the synchronisations that have been applied
+        """
+        original = self.repository.get_tree()
+        tree: Dict[str, _TreeEntry] = {path: (None, mode, blob_id) for path, (mode, blob_id) in original.items()}
+        object_format = get_object_format(next(iter(original.values()))[1]) if len(original) > 0 \
+            else SHA1_OBJECT_FORMAT
+
+        synchronised: List[Synchronisation] = []
+        outcomes: List[Tuple[Synchronisation, bool, str, float]] = []
+        for synchronisable in synchronisables:
+            started = time.monotonic()
+            destination = _normalise_destination(synchronisable.destination)
+            if not synchronisable.overwrite and _exists(tree, destination):
+                outcomes.append((synchronisable, False, f"{synchronisable.source} != {destination} (overwrite=False)",
+                                 time.monotonic() - started))
+                continue
+            before = dict(tree)
+            if isinstance(synchronisable, TemplateSynchronisation):
+                self._synchronise_template(synchronisable, destination, tree, object_format)
+            elif isinstance(synchronisable, FileSynchronisation):
+                _synchronise_path(synchronisable.source, destination, tree, object_format,
+                                  synchronisable.path_filter)
+            else:
+                raise ValueError(f"{type(synchronisable).__name__} cannot be synchronised through the API")
+            changed = tree != before
+            if changed:
+                synchronised.append(synchronisable)
+            outcomes.append((synchronisable, changed, f"{synchronisable.source} {'=>' if changed else '=='} "
+                                                      f"{destination}", time.monotonic() - started))
+
+        actions = _get_actions(original, tree)
+        committed = len(actions) > 0 and not dry_run
+        if committed:
+            self.repository.commit(f"Synchronised {len(synchronised)} file{'' if len(synchronised) == 1 else 's'} "
+                                   f"with {type(self).__name__} synchroniser.", actions)
+        if listener is not None:
+            for synchronisable, changed, reason, duration in outcomes:
+                listener(SynchronisationResult(self.repository, synchronisable, changed, reason, duration,
+                                               self.repository.get_head() if changed and committed else None))
+        return synchronised
+
+    def _synchronise_template(self, synchronisation: TemplateSynchronisation, destination: str,
+                              tree: Dict[str, _TreeEntry], object_format: str):
+        """
+        Renders the given template into the given tree.
+        :param synchronisation: the template synchronisation
+        :param destination: the normalised destination
+        :param tree: the tree to change
+        :param object_format: the object format of the repository
+        """
+        if not os.path.isfile(synchronisation.source):
+            raise FileNotFoundError(synchronisation.source)
+        if self.render_cache is not None:
+            rendered = self.render_cache.render(synchronisation.source, synchronisation.variables)
+            content = rendered.content if rendered is not None else None
+        else:
+            content = render_template(synchronisation.source, synchronisation.variables)
+        if content is None:
+            raise ValueError(f"Template {synchronisation.source} cannot be rendered without Ansible")
+        existing = tree.get(destination)
+        mode = existing[1] if existing is not None else REGULAR_FILE_MODE
+        _set_file(tree, destination, content, mode, get_content_blob_id(content, object_format))
+
+
+def _synchronise_path(source: str, destination: str, tree: Dict[str, _TreeEntry], object_format: str,
+                      path_filter: PathFilter):
+    """
+    Synchronises the given destination in the given tree with the given source (see `copying.synchronise_path`).
+    :param source: location of the file or directory to synchronise
+    :param destination: the normalised destination
+    :param tree: the tree to change
+    :param object_format: the object format of the repository
+    :param path_filter: rules for the files to synchronise in a directory source
+    """
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if not os.path.isabs(source):
+        raise ValueError(f"Sources cannot be relative: {source}")
+    if os.path.isdir(source):
+        if not source.endswith(os.sep):
+            destination = _join_path(destination, os.path.basename(source))
+        desired: Dict[str, str] = {}
+        _walk(source, "", path_filter, desired)
+        prefix = f"{destination}/" if destination != "" else ""
+        for path in [path for path in tree if path == destination or path.startswith(prefix)]:
+            if path != destination:
+                relative_path = path[len(prefix):]
+                if relative_path in desired or (path_filter and _is_kept(path_filter, relative_path)):
+                    continue
+            del tree[path]
+        for relative_path, location in desired.items():
+            _synchronise_file(location, _join_path(destination, relative_path), tree, object_format)
+    else:
+        if _is_directory(tree, destination):
+            destination = _join_path(destination, os.path.basename(source))
+        _synchronise_file(source, destination, tree, object_format)
+
+
+def _walk(directory: str, path: str, path_filter: PathFilter, files: Dict[str, str]):
+    """
+    Finds the files to synchronise in the given directory.
+    :param directory: location of the directory
+    :param path: path of the directory relative to the directory being synchronised
+    :param path_filter: rules for the files to synchronise
+    :param files: the location of each file to synchronise, where keys are paths relative to the directory being
+    synchronised (added to)
+    """
+    for name in sorted(os.listdir(directory)):
+        location, entry_path = os.path.join(directory, name), _join_path(path, name)
+        entry_stat = os.lstat(location)
+        if stat.S_ISDIR(entry_stat.st_mode):
+            if not (path_filter and path_filter.is_excluded(entry_path, True)):
+                _walk(location, entry_path, path_filter, files)
+        elif not path_filter or path_filter.is_included(entry_path):
+            files[entry_path] = location
+
+
+def _synchronise_file(source: str, destination: str, tree: Dict[str, _TreeEntry], object_format: str):
+    """
+    Synchronises the given file in the given tree with the given source file.
+    :param source: location of the source file
+    :param destination: the normalised destination
+    :param tree: the tree to change
+    :param object_format: the object format of the repository
+    """
+    source_stat = os.lstat(source)
+    if stat.S_ISLNK(source_stat.st_mode):
+        raise ValueError(f"Symbolic links cannot be synchronised through the API: {source}")
+    if not stat.S_ISREG(source_stat.st_mode):
+        _logger.info(f"Skipping non-regular file: {source}")
+        return
+    mode = EXECUTABLE_FILE_MODE if source_stat.st_mode & stat.S_IXUSR else REGULAR_FILE_MODE
+    blob_id = get_blob_id(source, object_format)
+    existing = tree.get(destination)
+    if existing is not None and existing[2] == blob_id:
+        if existing[1] != mode:
+            tree[destination] = (existing[0], mode, blob_id)
+        return
+    with open(source, "rb") as file:
+        _set_file(tree, destination, file.read(), mode, blob_id)
+
+
+def _set_file(tree: Dict[str, _TreeEntry], path: str, content: bytes, mode: str, blob_id: str):
+    """
+    Sets the given file in the given tree, removing any files that it replaces (i.e. a directory at its path or a file
+    at the path of one of its parent directories).
+    :param tree: the tree to change
+    :param path: path of the file
+    :param content: the content of the file
+    :param mode: the mode of the file
+    :param blob_id: the blob ID of the content
+    """
+    existing = tree.get(path)
+    if existing is not None and existing[1:] == (mode, blob_id):
+        return
+    for replaced in [entry for entry in tree if entry.startswith(f"{path}/")]:
+        del tree[replaced]
+    components = path.split("/")
+    for i in range(1, len(components)):
+        tree.pop("/".join(components[0:i]), None)
+    tree[path] = (content, mode, blob_id)
+
+
+def _get_actions(original: Dict[str, Tuple[str, str]], tree: Dict[str, _TreeEntry]) -> List[Dict[str, Any]]:
+    """
+    Gets the commit actions that change the given original tree into the given tree.
+    :param original: the mode and blob ID of each file in the original tree
+    :param tree: the changed tree
+    :return: the actions (deletions first, so that files can replace deleted directories)
+    """
+    actions: List[Dict[str, Any]] = [{"action": _DELETE_ACTION, "file_path": path}
+                                     for path in sorted(set(original) - set(tree))]
+    for path in sorted(tree):
+        content, mode, blob_id = tree[path]
+        executable = mode == EXECUTABLE_FILE_MODE
+        if path not in original:
+            action = _CREATE_ACTION
+        elif original[path][1] != blob_id:
+            action = _UPDATE_ACTION
+        elif original[path][0] != mode:
+            actions.append({"action": _CHMOD_ACTION, "file_path": path, "execute_filemode": executable})
+            continue
+        else:
+            continue
+        actions.append({"action": action, "file_path": path, "encoding": "base64",
+                        "content": base64.b64encode(content).decode("ascii"), "execute_filemode": executable})
+    return actions
+
+
+def _exists(tree: Dict[str, _TreeEntry], path: str) -> bool:
+    """
+    Whether there is a file or directory at the given path in the given tree.
+    :param tree: the tree
+    :param path: the path
+    :return: whether there is something at the path
+    """
+    return path in tree or _is_directory(tree, path)
+
+
+def _is_directory(tree: Dict[str, _TreeEntry], path: str) -> bool:
+    """
+    Whether there is a directory at the given path in the given tree.
+    :param tree: the tree
+    :param path: the path
+    :return: whether there is a directory at the path
+    """
+    prefix = f"{path}/" if path != "" else ""
+    return any(entry.startswith(prefix) for entry in tree)
+
+
+def _is_kept(path_filter: PathFilter, path: str) -> bool:
+    """
+    Whether the given file, which is not in the source, is left in the destination as it is filtered out (see
+    `copying._remove_filtered`).
+    :param path_filter: the filter
+    :param path: path of the file relative to the directory being synchronised
+    :return: whether the file is kept
+    """
+    components = path.split("/")
+    return any(path_filter.is_excluded("/".join(components[0:i]), True) for i in range(1, len(components))) \
+        or not path_filter.is_included(path)
+
+
+def _normalise_destination(destination: str) -> str:
+    """
+    Normalises the given destination into a path relative to the root of the repository.
+    :param destination: the destination
+    :return: the normalised path (empty for the root)
+    :raises ValueError: if the destination is not inside of the repository
+    """
+    path = posixpath.normpath(destination.replace(os.sep, "/"))
+    if path == ".." or path.startswith("../") or os.path.isabs(destination):
+        raise ValueError(f"Destination {destination} not inside of repository")
+    return "" if path == "." else path
+
+
+def _join_path(path: str, name: str) -> str:
+    """
+    Joins the given name onto the given path.
+    :param path: the path (empty for the root)
+    :param name: the name
+    :return: the joined path
+    """
+    return f"{path}/{name}" if path != "" else name
+
+
+def _parse_response(status: int, content: bytes) -> Any:
+    """
+    Parses the given API response.
+    :param status: the status of the response
+    :param content: the body of the response
+    :return: the decoded JSON body
+    :raises ApiError: if the status is not successful
+    """
+    if not 200 <= status < 300:
+        try:
+            message = json.loads(content.decode("utf-8")).get("message", "")
+        except (ValueError, AttributeError):
+            message = content.decode("utf-8", errors="replace")
+        raise ApiError(status, str(message))
+    return json.loads(content.decode("utf-8")) if len(content) > 0 else None
@@ -0,0 +1,79 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Hashable, List, Tuple
+
+from gitcommonsync.helpers import synchronise_repositories, RepositorySynchronisationResult
+from gitcommonsync.models import Synchronisation
+from gitcommonsync.repository import GitRepository
+
+_logger = logging.getLogger(__name__)
+
+Job = Tuple[GitRepository, List[Synchronisation]]
+
+
+def get_repository_key(repository: GitRepository) -> Hashable:
+    """
+    Gets the key that identifies the given repository when merging jobs, so that the same repository (with the same
+    credentials and author) given for different hosts is synchronised once.
+    :param repository: the repository
+    :return: the key
+    """
+    return (repository.remote, repository.branch, repository.private_key_file, repository.author_name,
+            repository.author_email)
+
+
+def merge_jobs(jobs_by_host: Dict[str, List[Job]]) -> Tuple[List[Job], Dict[str, List[int]]]:
+    """
+    Merges the jobs of each host into one job for each distinct repository, in which identical synchronisations are
+    applied once.
+    :param jobs_by_host: the jobs of each host, indexed by host name
+    :return: tuple where the first element is the merged jobs and the second is, for each host, the index of the merged
+    job that each of its jobs is part of
+    """
+    merged: Dict[Hashable, Tuple[GitRepository, Dict[Synchronisation, None]]] = {}
+    indices: Dict[Hashable, int] = {}
+    assignments: Dict[str, List[int]] = {}
+    for host, jobs in jobs_by_host.items():
+        assignments[host] = []
+        for repository, synchronisations in jobs:
+            key = get_repository_key(repository)
+            if key not in merged:
+                indices[key] = len(merged)
+                merged[key] = (repository, {})
+            # Kept ordered and unique, as synchronisations are equal if they have the same configuration
+            for synchronisation in synchronisations:
+                merged[key][1].setdefault(synchronisation, None)
+            assignments[host].append(indices[key])
+
+    given = sum(len(jobs) for jobs in jobs_by_host.values())
+    if given > len(merged):
+        _logger.info(f"Merged {given} repository jobs from {len(jobs_by_host)} hosts into {len(merged)}")
+    return [(repository, list(synchronisations)) for repository, synchronisations in merged.values()], assignments
+
+
+def synchronise_hosts(jobs_by_host: Dict[str, List[Job]], **synchronise_kwargs: Any) \
+        -> Dict[str, List[RepositorySynchronisationResult]]:
+    """
+    Synchronises the repositories of all of the given hosts in a single run, in which each distinct repository is
+    synchronised once (see `merge_jobs`), then maps the results back to each host.
+    :param jobs_by_host: the jobs of each host, indexed by host name
+    :param synchronise_kwargs: arguments passed to `helpers.synchronise_repositories`
+    :return: the result of synchronising each of the jobs of each host, in the order they were given, indexed by host
+    name. Only the synchronisations that a host asked for are included in its results
+    """
+    jobs, assignments = merge_jobs(jobs_by_host)
+    results = synchronise_repositories(jobs, **synchronise_kwargs)
+
+    results_by_host: Dict[str, List[RepositorySynchronisationResult]] = {}
+    for host, host_jobs in jobs_by_host.items():
+        results_by_host[host] = []
+        for (repository, synchronisations), index in zip(host_jobs, assignments[host]):
+            result = results[index]
+            requested = set(synchronisations)
+            synchronised = defaultdict(list)
+            for synchronisation_type, applied in result.synchronised.items():
+                synchronised[synchronisation_type] = [synchronisation for synchronisation in applied
+                                                      if synchronisation in requested]
+            results_by_host[host].append(RepositorySynchronisationResult(
+                repository, synchronised, error=result.error, commit=result.commit, duration=result.duration))
+    return results_by_host
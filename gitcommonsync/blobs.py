@@ -0,0 +1,180 @@
+import hashlib
+import mmap
+import os
+import stat
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from git import Git
+
+SHA1_OBJECT_FORMAT = "sha1"
+SHA256_OBJECT_FORMAT = "sha256"
+REGULAR_FILE_MODES = {"100644", "100755"}
+
+# Files at least this size are hashed from a memory map rather than read into memory
+MMAP_THRESHOLD = 1024 * 1024
+
+_OBJECT_FORMATS_BY_ID_LENGTH = {40: SHA1_OBJECT_FORMAT, 64: SHA256_OBJECT_FORMAT}
+_BLOB_ID_CACHE_SIZE = 64 * 1024
+
+
+def get_blob_id(location: str, object_format: str=SHA1_OBJECT_FORMAT) -> str:
+    """
+    Gets the ID that git would give to a blob of the content of the given file, without adding it to a repository.
+
+    IDs are cached against the status of the file, so the same source compared against many checkouts is read once.
+    :param location: location of the (regular) file
+    :param object_format: the object format of the repository the ID is for
+    :return: the blob ID
+    """
+    file_stat = os.stat(location)
+    return _get_blob_id(location, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ctime_ns,
+                        object_format)
+
+
+def get_object_format(object_id: str, default: str=SHA1_OBJECT_FORMAT) -> str:
+    """
+    Gets the object format of a repository from the length of one of its object IDs.
+    :param object_id: the (full) object ID
+    :param default: the format to return if the length of the ID is not that of a known format
+    :return: the object format
+    """
+    return _OBJECT_FORMATS_BY_ID_LENGTH.get(len(object_id), default)
+
+
+def get_content_blob_id(content: bytes, object_format: str=SHA1_OBJECT_FORMAT) -> str:
+    """
+    Gets the ID that git would give to a blob of the given content.
+    :param content: the content
+    :param object_format: the object format of the repository the ID is for
+    :return: the blob ID
+    """
+    hasher = hashlib.new(object_format)
+    hasher.update(b"blob %d\0" % len(content))
+    hasher.update(content)
+    return hasher.hexdigest()
+
+
+@lru_cache(maxsize=_BLOB_ID_CACHE_SIZE)
+def _get_blob_id(location: str, inode: int, size: int, modified: int, changed: int, object_format: str) -> str:
+    """
+    Gets the blob ID of the given file (see `get_blob_id`), where the status arguments are only used as the cache key.
+    """
+    with open(location, "rb") as file:
+        if size < MMAP_THRESHOLD:
+            return get_content_blob_id(file.read(), object_format)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            hasher = hashlib.new(object_format)
+            hasher.update(b"blob %d\0" % len(content))
+            hasher.update(content)
+            return hasher.hexdigest()
+
+
+class IndexSnapshot:
+    """
+    Snapshot of the blobs in the index of a checkout whose files are unmodified in the working tree, used to find out if
+    a file's content would change without reading (or rewriting) the file in the working tree.
+    """
+    @staticmethod
+    def load(checkout_location: str, git: "Git"=None) -> "IndexSnapshot":
+        """
+        Loads a snapshot of the index of the given checkout, as listed by `git ls-files --stage`.
+
+        Files that are modified or deleted in the working tree (according to the cached status of the files, so without
+        reading them) are left out of the snapshot.
+        :param checkout_location: location of the checkout
+        :param git: the `git` command wrapper of the checkout to use (e.g. that of its session), if not a new one
+        :return: the snapshot
+        """
+        if git is None:
+            from git import Repo
+            git = Repo(checkout_location).git
+        modified = set(git.ls_files("-z", modified=True, deleted=True).split("\0"))
+        entries: Dict[str, Tuple[str, str]] = {}
+        object_format = SHA1_OBJECT_FORMAT
+        for line in git.ls_files("-z", stage=True).split("\0"):
+            if line == "":
+                continue
+            information, path = line.split("\t", 1)
+            mode, blob_id, merge_stage = information.split(" ")
+            object_format = get_object_format(blob_id, object_format)
+            if merge_stage == "0" and path not in modified:
+                entries[path] = (mode, blob_id)
+        return IndexSnapshot(checkout_location, entries, object_format)
+
+    def __init__(self, checkout_location: str, entries: Dict[str, Tuple[str, str]],
+                 object_format: str=SHA1_OBJECT_FORMAT):
+        """
+        Constructor.
+        :param checkout_location: location of the checkout
+        :param entries: mode and blob ID of each unmodified file, where keys are paths relative to the checkout (with
+        `/` separators)
+        :param object_format: the object format of the repository
+        """
+        self.checkout_location = checkout_location
+        self.object_format = object_format
+        self._entries = entries
+
+    def get(self, location: str) -> Optional[Tuple[str, str]]:
+        """
+        Gets the mode and blob ID of the given file.
+        :param location: location of the file in the checkout
+        :return: tuple where the first element is the mode and the second the blob ID, or `None` if the file is not in
+        the snapshot
+        """
+        return self._entries.get(self._get_path(location))
+
+    def is_same_content(self, source: str, location: str) -> Optional[bool]:
+        """
+        Whether the given file in the checkout has the same content as the given source file.
+        :param source: location of the source file
+        :param location: location of the file in the checkout
+        :return: whether the content is the same, or `None` if it cannot be determined from the snapshot
+        """
+        entry = self.get(location)
+        if entry is None:
+            return None
+        mode, blob_id = entry
+        return mode in REGULAR_FILE_MODES and stat.S_ISREG(os.stat(source).st_mode) \
+            and get_blob_id(source, self.object_format) == blob_id
+
+    def is_same_rendered_content(self, content: bytes, location: str, blob_id: str=None) -> Optional[bool]:
+        """
+        Whether the given file in the checkout has the given content.
+        :param content: the content
+        :param location: location of the file in the checkout
+        :param blob_id: the blob ID of the content in the snapshot's object format, if already known
+        :return: whether the content is the same, or `None` if it cannot be determined from the snapshot
+        """
+        entry = self.get(location)
+        if entry is None:
+            return None
+        mode, index_blob_id = entry
+        if blob_id is None:
+            blob_id = get_content_blob_id(content, self.object_format)
+        return mode in REGULAR_FILE_MODES and blob_id == index_blob_id
+
+    def discard(self, location: str):
+        """
+        Removes the given file, or the files in the given directory, from the snapshot, e.g. after they are written to.
+        :param location: location of the file or directory in the checkout
+        """
+        path = self._get_path(location)
+        if path is None:
+            return
+        prefix = f"{path}/"
+        for discarded in [entry_path for entry_path in self._entries
+                          if entry_path == path or entry_path.startswith(prefix) or path == "."]:
+            del self._entries[discarded]
+
+    def _get_path(self, location: str) -> Optional[str]:
+        """
+        Gets the path of the given location in the index.
+        :param location: the location in the checkout
+        :return: the path relative to the checkout (with `/` separators) or `None` if outside of the checkout
+        """
+        path = os.path.relpath(os.path.abspath(location), os.path.abspath(self.checkout_location))
+        if path == ".." or path.startswith(f"..{os.sep}"):
+            return None
+        return path.replace(os.sep, "/")
@@ -0,0 +1,401 @@
+import logging
+import sys
+from argparse import ArgumentParser, Namespace
+from itertools import chain
+from typing import List, TextIO, Iterable, Tuple, Union
+
+from gitcommonsync.helpers import synchronise_repositories, RepositorySynchronisationResult, PipelineStages
+from gitcommonsync.models import FileSynchronisation, TemplateSynchronisation, SubrepoSynchronisation, \
+    Synchronisation
+from gitcommonsync.copying import StagingArea
+from gitcommonsync.distributed import SqliteWorkQueue, Worker, RepositoryReport, submit, wait_for_run, \
+    DEFAULT_SHARD_SIZE, DEFAULT_LEASE_DURATION
+from gitcommonsync.journal import Journal
+from gitcommonsync.pipeline import DEFAULT_QUEUE_SIZE
+from gitcommonsync.planning import create_plan, PlanConflictError
+from gitcommonsync.rendering import RenderCache, DEFAULT_RENDER_CACHE_SIZE
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.scheduling import HostScheduler, HostLimits
+from gitcommonsync.scratch import ScratchSpacePolicy, DEFAULT_MEMORY_CAP, DEFAULT_SIZE_THRESHOLD, \
+    DEFAULT_MEMORY_DIRECTORY
+from gitcommonsync.specification import load_specification, parse_jobs, InvalidSpecificationError, iterate_jobs
+from gitcommonsync.ssh import SshMultiplexer
+from gitcommonsync.subrepo_engine import NativeSubrepoEngine
+from gitcommonsync.state import SynchronisationStateStore
+from gitcommonsync.watching import SourceWatcher, DEFAULT_DEBOUNCE
+from gitcommonsync.worktrees import WorktreePool
+
+_logger = logging.getLogger(__name__)
+
+SUCCESS_EXIT_CODE = 0
+FAILURE_EXIT_CODE = 1
+INVALID_SPECIFICATION_EXIT_CODE = 2
+
+DEFAULT_JOBS = 1
+
+_SYNCHRONISATION_SUMMARY_NAMES = [
+    (FileSynchronisation, "files"),
+    (TemplateSynchronisation, "templates"),
+    (SubrepoSynchronisation, "subrepos")
+]
+
+
+def parse_arguments(arguments: List[str]) -> Namespace:
+    """
+    Parses the given command line arguments.
+    :param arguments: the command line arguments (excluding the program name)
+    :return: the parsed arguments
+    """
+    parser = ArgumentParser(description="Synchronises common files between Git repositories")
+    parser.add_argument("specification", nargs="?",
+                        help="location of the YAML synchronisation specification (not given with --work)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help="maximum number of repositories to synchronise at the same time")
+    parser.add_argument("-s", "--state",
+                        help="location of a database in which to record the state of repositories after they are "
+                             "synchronised, which is used to skip repositories that are unchanged since the last run")
+    parser.add_argument("--worktrees",
+                        help="directory in which to keep working trees between runs, instead of cloning repositories "
+                             "each time")
+    parser.add_argument("--worktrees-quota", type=int,
+                        help="size (in MB) of working trees to keep, beyond which the least recently used are removed")
+    parser.add_argument("--in-memory", metavar="DIRECTORY", nargs="?", const=DEFAULT_MEMORY_DIRECTORY,
+                        help="check out small repositories into the given memory backed directory (default: "
+                             f"{DEFAULT_MEMORY_DIRECTORY}), falling back to disk for larger ones")
+    parser.add_argument("--in-memory-threshold", type=int, default=DEFAULT_SIZE_THRESHOLD // (1024 * 1024),
+                        help="estimated size (in MB) that a repository must be under to be checked out in memory")
+    parser.add_argument("--in-memory-cap", type=int, default=DEFAULT_MEMORY_CAP // (1024 * 1024),
+                        help="total size (in MB) of the repositories that can be checked out in memory at once")
+    parser.add_argument("--size-estimates",
+                        help="location of a file in which to record the size of repositories, which is used to "
+                             "decide whether to check them out in memory on the next run")
+    parser.add_argument("--ssh-masters", type=int,
+                        help="share SSH connections between git operations against the same host, using up to the "
+                             "given number of master connections")
+    parser.add_argument("--native-subrepos", metavar="CACHE_DIRECTORY", nargs="?", const="",
+                        help="synchronise subrepos without `git subrepo`, updating them in place from the objects "
+                             "fetched into the given cache directory (a temporary directory if not given)")
+    parser.add_argument("--host-concurrency", type=int,
+                        help="maximum number of repositories on the same host to synchronise at the same time")
+    parser.add_argument("--host-fetch-rate", type=float,
+                        help="maximum number of clones, fetches and queries per second made against each host")
+    parser.add_argument("--host-push-rate", type=float,
+                        help="maximum number of pushes per second made to each host")
+    parser.add_argument("--durations",
+                        help="location of a file in which to record how long each repository takes to synchronise, "
+                             "which is used to synchronise the slowest repositories first on the next run")
+    parser.add_argument("--hardlink-staging", metavar="STAGING_DIRECTORY", nargs="?", const="",
+                        help="hardlink synchronised files into checkouts from copies staged in the given directory (a "
+                             "temporary directory if not given), which should be on the same file system as the "
+                             "checkouts")
+    parser.add_argument("--render-cache",
+                        help="location of a database in which to cache rendered templates between runs, so that "
+                             "templates whose content and variables are unchanged are not rendered again")
+    parser.add_argument("--render-cache-size", type=int, default=DEFAULT_RENDER_CACHE_SIZE // (1024 * 1024),
+                        help="size (in MB) of rendered templates to cache, beyond which the least recently used are "
+                             "evicted")
+    parser.add_argument("--pipeline", metavar="CHECKOUT,SYNCHRONISE,PUSH",
+                        help="synchronise repositories in a pipeline, where the given numbers of repositories are "
+                             "checked out, synchronised and pushed at the same time (instead of --jobs)")
+    parser.add_argument("--pipeline-queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="number of checked out repositories that can wait for each later stage of the pipeline")
+    parser.add_argument("--journal",
+                        help="location of a journal in which to record the progress of each repository, so that an "
+                             "interrupted run can be resumed")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume the last run recorded in the journal, skipping the repositories that it completed")
+    parser.add_argument("-w", "--watch", action="store_true",
+                        help="after synchronising, keep running and synchronise again when the source of a file or "
+                             "template changes (only the affected synchronisations are applied)")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help="time (in seconds) to wait for changes to stop before synchronising when watching")
+    parser.add_argument("--coordinate", metavar="QUEUE",
+                        help="instead of synchronising, shard the repositories into units of work on the given queue "
+                             "(a SQLite database) for workers to synchronise, then wait for and report their results")
+    parser.add_argument("--work", metavar="QUEUE",
+                        help="instead of synchronising the repositories of a specification, synchronise those in the "
+                             "units of work on the given queue until none are left")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="maximum number of repositories in each unit of work when coordinating")
+    parser.add_argument("--lease-duration", type=float, default=DEFAULT_LEASE_DURATION,
+                        help="time (in seconds) before a unit of work leased by a worker that has stopped is leased "
+                             "by another")
+    parser.add_argument("-p", "--plan", action="store_true",
+                        help="only show the plan (and its estimated cost) for synchronising each repository, without "
+                             "checking out any repository")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="do not push changes")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress")
+    parsed = parser.parse_args(arguments)
+    if parsed.jobs < 1:
+        parser.error(f"--jobs must be at least 1 (given: {parsed.jobs})")
+    if parsed.resume and parsed.journal is None:
+        parser.error("--resume requires --journal")
+    if parsed.coordinate is not None and parsed.work is not None:
+        parser.error("--coordinate cannot be used with --work")
+    if (parsed.specification is None) == (parsed.work is None):
+        parser.error("a specification is required (unless using --work, which cannot be given one)")
+    if (parsed.coordinate is not None or parsed.work is not None) and (parsed.plan or parsed.watch):
+        parser.error("--coordinate and --work cannot be used with --plan or --watch")
+    if parsed.shard_size < 1:
+        parser.error(f"--shard-size must be at least 1 (given: {parsed.shard_size})")
+    if parsed.lease_duration <= 0:
+        parser.error(f"--lease-duration must be positive (given: {parsed.lease_duration})")
+    if parsed.plan and parsed.watch:
+        parser.error("--plan cannot be used with --watch")
+    if parsed.in_memory is not None and parsed.worktrees is not None:
+        parser.error("--in-memory cannot be used with --worktrees")
+    if parsed.ssh_masters is not None and parsed.ssh_masters < 1:
+        parser.error(f"--ssh-masters must be at least 1 (given: {parsed.ssh_masters})")
+    if parsed.render_cache_size < 1:
+        parser.error(f"--render-cache-size must be at least 1 (given: {parsed.render_cache_size})")
+    if parsed.host_concurrency is not None and parsed.host_concurrency < 1:
+        parser.error(f"--host-concurrency must be at least 1 (given: {parsed.host_concurrency})")
+    for option, rate in (("--host-fetch-rate", parsed.host_fetch_rate), ("--host-push-rate", parsed.host_push_rate)):
+        if rate is not None and rate <= 0:
+            parser.error(f"{option} must be positive (given: {rate})")
+    if parsed.pipeline is not None:
+        try:
+            parsed.pipeline = [int(workers) for workers in parsed.pipeline.split(",")]
+        except ValueError:
+            parsed.pipeline = []
+        if len(parsed.pipeline) != 3 or any(workers < 1 for workers in parsed.pipeline):
+            parser.error("--pipeline must be three numbers of at least 1, separated by commas")
+        if any(option is not None for option in (parsed.host_concurrency, parsed.host_fetch_rate,
+                                                 parsed.host_push_rate, parsed.durations)):
+            parser.error("--pipeline cannot be used with --host-concurrency, --host-fetch-rate, --host-push-rate or "
+                         "--durations")
+    if parsed.pipeline_queue_size < 1:
+        parser.error(f"--pipeline-queue-size must be at least 1 (given: {parsed.pipeline_queue_size})")
+    return parsed
+
+
+def write_plans(jobs: Iterable[Tuple[GitRepository, List[Synchronisation]]], output: TextIO) -> bool:
+    """
+    Writes a human readable description of the plan for synchronising each of the given repositories.
+    :param jobs: the repositories and the synchronisations to apply to them
+    :param output: where to write the plans to
+    :return: whether all of the synchronisations could be planned
+    """
+    planned = True
+    for repository, synchronisations in jobs:
+        name = f"{repository.remote} ({repository.branch})"
+        try:
+            plan = create_plan(synchronisations)
+        except PlanConflictError as e:
+            output.write(f"conflict\t{name}: {e}\n")
+            planned = False
+            continue
+        cost = plan.estimate_cost()
+        output.write(f"plan\t{name}: {cost.steps} steps ({plan.duplicates} duplicates removed), "
+                     f"{cost.subrepo_fetches} subrepo fetches, {cost.source_bytes} source bytes, "
+                     f"at most {cost.max_commits} commits\n")
+        for step in plan.steps:
+            output.write(f"\t{type(step.synchronisation).__name__}\t{step.synchronisation.destination}\n")
+    output.flush()
+    return planned
+
+
+def write_summary(results: List[Union[RepositorySynchronisationResult, RepositoryReport]], output: TextIO):
+    """
+    Writes a human readable summary of the results of synchronising each repository.
+    :param results: the result (or report of the result) of synchronising each repository
+    :param output: where to write the summary to
+    """
+    for result in results:
+        write_result(result, output)
+
+    failed = len([result for result in results if not result.succeeded])
+    changed = len([result for result in results if result.succeeded and result.changed])
+    output.write(f"{len(results)} repositories: {changed} changed, {failed} failed\n")
+
+
+def write_result(result: Union[RepositorySynchronisationResult, RepositoryReport], output: TextIO):
+    """
+    Writes a human readable summary of the result of synchronising a repository.
+    :param result: the result (or report of the result) of synchronising the repository
+    :param output: where to write the summary to
+    """
+    report = result if isinstance(result, RepositoryReport) else RepositoryReport.from_result(result)
+    repository = f"{report.remote} ({report.branch})"
+    if not report.succeeded:
+        output.write(f"failed\t{repository}: {report.error}\n")
+    else:
+        counts = ", ".join(f"{report.synchronised.get(synchronisation_type.__name__, 0)} {name}"
+                           for synchronisation_type, name in _SYNCHRONISATION_SUMMARY_NAMES)
+        output.write(f"{'changed' if report.changed else 'ok'}\t{repository}: {counts}\n")
+    output.flush()
+
+
+def _configure_jobs(jobs: Iterable[Tuple[GitRepository, List[Synchronisation]]], worktree_pool: WorktreePool=None,
+                    ssh_multiplexer: SshMultiplexer=None) -> Iterable[Tuple[GitRepository, List[Synchronisation]]]:
+    """
+    Configures the repositories of the given jobs to use the given shared resources.
+    :param jobs: the jobs, which are configured as they are iterated if not a list
+    :param worktree_pool: optional pool of worktrees for the repositories to check out into
+    :param ssh_multiplexer: optional multiplexer of the repositories' SSH connections
+    :return: the configured jobs (a list if given a list)
+    """
+    def configure(job: Tuple[GitRepository, List[Synchronisation]]) -> Tuple[GitRepository, List[Synchronisation]]:
+        repository, _ = job
+        if worktree_pool is not None:
+            repository.worktree_pool = worktree_pool
+        if ssh_multiplexer is not None:
+            repository.ssh_multiplexer = ssh_multiplexer
+        return job
+
+    if isinstance(jobs, list):
+        return [configure(job) for job in jobs]
+    return (configure(job) for job in jobs)
+
+
+def coordinate(arguments: Namespace) -> int:
+    """
+    Shards the repositories of the specification into units of work on the queue, then waits for workers to
+    synchronise them and writes a summary of their results.
+    :param arguments: the parsed command line arguments
+    :return: the exit code
+    """
+    try:
+        specification = load_specification(arguments.specification)
+        # Validated before any unit of work is submitted
+        parse_jobs(specification)
+    except (InvalidSpecificationError, OSError) as e:
+        sys.stderr.write(f"Invalid specification: {e}\n")
+        return INVALID_SPECIFICATION_EXIT_CODE
+
+    queue = SqliteWorkQueue(arguments.coordinate)
+    run = submit(specification, queue, shard_size=arguments.shard_size)
+    _logger.info(f"Submitted run {run} to {arguments.coordinate}")
+    reports = wait_for_run(queue, run)
+    write_summary(reports, sys.stdout)
+    return SUCCESS_EXIT_CODE if all(report.succeeded for report in reports) else FAILURE_EXIT_CODE
+
+
+def main(arguments: List[str]=None) -> int:
+    """
+    Entrypoint.
+    :param arguments: the command line arguments (defaults to those given to the process)
+    :return: the exit code
+    """
+    arguments = parse_arguments(arguments if arguments is not None else sys.argv[1:])
+    if arguments.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if arguments.coordinate is not None:
+        return coordinate(arguments)
+
+    try:
+        if arguments.work is not None:
+            # The jobs are taken from the queue
+            jobs = iter(())
+        elif arguments.watch:
+            # Watching requires all of the jobs to be kept
+            jobs = parse_jobs(load_specification(arguments.specification))
+        else:
+            # Streamed, so that large specifications are not held in memory. The first job is read so that the shared
+            # properties of the specification are validated before any repository is synchronised
+            jobs = iterate_jobs(arguments.specification)
+            first_job = next(jobs, None)
+            jobs = chain([first_job], jobs) if first_job is not None else iter(())
+    except (InvalidSpecificationError, OSError) as e:
+        sys.stderr.write(f"Invalid specification: {e}\n")
+        return INVALID_SPECIFICATION_EXIT_CODE
+
+    if arguments.plan:
+        try:
+            return SUCCESS_EXIT_CODE if write_plans(jobs, sys.stdout) else FAILURE_EXIT_CODE
+        except InvalidSpecificationError as e:
+            sys.stderr.write(f"Invalid specification: {e}\n")
+            return INVALID_SPECIFICATION_EXIT_CODE
+
+    worktree_pool = None
+    if arguments.worktrees is not None:
+        quota = arguments.worktrees_quota * 1024 * 1024 if arguments.worktrees_quota is not None else None
+        worktree_pool = WorktreePool(arguments.worktrees, quota=quota)
+
+    ssh_multiplexer = None
+    if arguments.ssh_masters is not None:
+        ssh_multiplexer = SshMultiplexer(arguments.ssh_masters)
+    jobs = _configure_jobs(jobs, worktree_pool=worktree_pool, ssh_multiplexer=ssh_multiplexer)
+
+    subrepo_engine = None
+    if arguments.native_subrepos is not None:
+        subrepo_engine = NativeSubrepoEngine(arguments.native_subrepos or None)
+
+    scratch_space_policy = None
+    if arguments.in_memory is not None:
+        scratch_space_policy = ScratchSpacePolicy(
+            arguments.in_memory, size_threshold=arguments.in_memory_threshold * 1024 * 1024,
+            memory_cap=arguments.in_memory_cap * 1024 * 1024, estimates_location=arguments.size_estimates)
+
+    scheduler = None
+    if any(option is not None for option in (arguments.host_concurrency, arguments.host_fetch_rate,
+                                             arguments.host_push_rate, arguments.durations)):
+        scheduler = HostScheduler(
+            HostLimits(max_concurrency=arguments.host_concurrency, fetch_rate=arguments.host_fetch_rate,
+                       push_rate=arguments.host_push_rate), durations_location=arguments.durations)
+
+    staging_area = None
+    if arguments.hardlink_staging is not None:
+        staging_area = StagingArea(arguments.hardlink_staging or None)
+
+    render_cache = None
+    if arguments.render_cache is not None:
+        render_cache = RenderCache(arguments.render_cache, max_size=arguments.render_cache_size * 1024 * 1024)
+
+    pipeline = None
+    if arguments.pipeline is not None:
+        pipeline = PipelineStages(*arguments.pipeline, queue_size=arguments.pipeline_queue_size)
+
+    journal = Journal(arguments.journal, resume=arguments.resume) if arguments.journal is not None else None
+
+    try:
+        state_store = SynchronisationStateStore(arguments.state) if arguments.state is not None else None
+        options = dict(dry_run=arguments.dry_run, parallelism=arguments.jobs, state_store=state_store,
+                       scratch_space_policy=scratch_space_policy, subrepo_engine=subrepo_engine, scheduler=scheduler,
+                       journal=journal, staging_area=staging_area, render_cache=render_cache, pipeline=pipeline)
+        if arguments.work is not None:
+            worker = Worker(
+                SqliteWorkQueue(arguments.work), lease_duration=arguments.lease_duration,
+                configure_jobs=lambda unit_jobs: _configure_jobs(
+                    unit_jobs, worktree_pool=worktree_pool, ssh_multiplexer=ssh_multiplexer),
+                **options)
+            reports = worker.run()
+            write_summary(reports, sys.stdout)
+            return SUCCESS_EXIT_CODE if all(report.succeeded for report in reports) else FAILURE_EXIT_CODE
+
+        try:
+            results = synchronise_repositories(jobs, **options)
+        except InvalidSpecificationError as e:
+            # Raised if a repository that is only reached once streamed is not valid
+            sys.stderr.write(f"Invalid specification: {e}\n")
+            return INVALID_SPECIFICATION_EXIT_CODE
+        write_summary(results, sys.stdout)
+
+        if arguments.watch:
+            watcher = SourceWatcher(
+                jobs, parallelism=arguments.jobs, debounce=arguments.debounce, dry_run=arguments.dry_run,
+                state_store=state_store, scratch_space_policy=scratch_space_policy, subrepo_engine=subrepo_engine,
+                scheduler=scheduler, journal=journal, staging_area=staging_area, render_cache=render_cache,
+                result_handler=lambda result: write_result(result, sys.stdout))
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                watcher.stop()
+    finally:
+        if worktree_pool is not None:
+            worktree_pool.close()
+        if ssh_multiplexer is not None:
+            ssh_multiplexer.close()
+        if subrepo_engine is not None:
+            subrepo_engine.close()
+        if journal is not None:
+            journal.close()
+        if staging_area is not None:
+            staging_area.close()
+
+    return SUCCESS_EXIT_CODE if all(result.succeeded for result in results) else FAILURE_EXIT_CODE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
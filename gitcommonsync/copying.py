@@ -0,0 +1,357 @@
+import errno
+import filecmp
+import logging
+import os
+import shutil
+import stat
+from tempfile import mkdtemp
+from threading import Lock, get_ident
+from typing import Dict, Tuple, Callable, Optional
+
+from gitcommonsync.filters import PathFilter
+from gitcommonsync.state import get_digest
+
+_logger = logging.getLogger(__name__)
+
+# ioctl that makes a file share the (copy on write) extents of another file, e.g. on Btrfs and XFS
+FICLONE = 0x40049409
+
+REFLINK_METHOD = "reflink"
+COPY_FILE_RANGE_METHOD = "copy_file_range"
+SENDFILE_METHOD = "sendfile"
+READ_WRITE_METHOD = "read_write"
+HARDLINK_METHOD = "hardlink"
+
+_COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# Errors raised when a copy primitive is not supported for the given files, rather than because the copy failed
+_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                       errno.EPERM, errno.ETXTBSY}
+_TEMPORARY_SUFFIX = ".gitcommonsync-tmp"
+
+# Given the locations of a source file and the destination file, returns whether their content is the same, or `None` if
+# unknown (see `blobs.IndexSnapshot.is_same_content`)
+ContentComparator = Callable[[str, str], Optional[bool]]
+
+
+class StagingArea:
+    """
+    Content addressed store of copies of source files, from which files are hardlinked into checkouts instead of copied.
+
+    Files in the staging area must not be modified, so neither must the files linked from it: they are replaced (e.g. as
+    git does) rather than written to. Files are staged once for each content and permissions, so the same source
+    synchronised into many checkouts on the same file system is copied only once.
+    """
+    def __init__(self, directory: str=None):
+        """
+        Constructor.
+        :param directory: optional directory in which to keep the staged files between runs, which is created if it
+        does not exist (and should be on the same file system as the checkouts). If `None`, a temporary directory is
+        used and removed on close
+        """
+        self._temporary = directory is None
+        self.directory = directory if directory is not None else mkdtemp(prefix="gitcommonsync-staging-")
+        os.makedirs(self.directory, exist_ok=True)
+        self._digests: Dict[Tuple[str, int, int, int, int], str] = {}
+        self._lock = Lock()
+
+    def close(self):
+        """
+        Removes the staged files, if temporary.
+        """
+        if self._temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stage(self, source: str) -> str:
+        """
+        Stages the given file, if not already staged.
+        :param source: location of the (regular) file
+        :return: location of the staged copy
+        """
+        source_stat = os.stat(source)
+        # The digest of unchanged sources is not recalculated
+        key = (source, source_stat.st_ino, source_stat.st_size, source_stat.st_mtime_ns, source_stat.st_mode)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = get_digest(source)
+            with self._lock:
+                self._digests[key] = digest
+
+        staged = os.path.join(self.directory, digest)
+        if not os.path.exists(staged):
+            # Staged under a unique name then moved, as the same content may be staged concurrently
+            temporary = f"{staged}.{get_ident()}{_TEMPORARY_SUFFIX}"
+            _copy_file_contents(source, temporary)
+            os.chmod(temporary, stat.S_IMODE(source_stat.st_mode))
+            os.replace(temporary, staged)
+        return staged
+
+
+def copy_file(source: str, destination: str, staging_area: StagingArea=None) -> str:
+    """
+    Copies the content and permissions of the given file using the cheapest method available, replacing any existing
+    file at the destination.
+
+    The methods tried, in order, are: a hardlink from the staging area (if given), a reflink (`FICLONE`),
+    `copy_file_range`, `sendfile`, then reading and writing.
+    :param source: location of the (regular) file to copy
+    :param destination: location to copy the file to
+    :param staging_area: optional staging area to hardlink the file from
+    :return: the method used
+    """
+    temporary = f"{destination}{_TEMPORARY_SUFFIX}"
+    # Left behind if a previous copy was interrupted
+    _remove(temporary)
+
+    if staging_area is not None:
+        try:
+            os.link(staging_area.stage(source), temporary)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS | {errno.EMLINK}:
+                raise
+            _logger.debug(f"Cannot hardlink {source} from staging area: {e}")
+        else:
+            os.replace(temporary, destination)
+            return HARDLINK_METHOD
+
+    try:
+        method = _copy_file_contents(source, temporary)
+        os.chmod(temporary, stat.S_IMODE(os.stat(source).st_mode))
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.lexists(temporary):
+            os.unlink(temporary)
+        raise
+    return method
+
+
+def synchronise_path(source: str, destination: str, staging_area: StagingArea=None,
+                     is_same_content: ContentComparator=None, path_filter: PathFilter=None) -> bool:
+    """
+    Synchronises the given destination with the given source, with the semantics of
+    `rsync --recursive --delete --perms --links --checksum` (without preserving times, owners or groups).
+
+    As with rsync, a directory source without a trailing separator is synchronised into a directory of the same name
+    inside the destination, whereas the contents of a directory source with a trailing separator are synchronised into
+    the destination. A file source is synchronised into the destination if it is an existing directory.
+    :param source: location of the file or directory to synchronise
+    :param destination: location to synchronise to
+    :param staging_area: optional staging area to hardlink files from (see `copy_file`)
+    :param is_same_content: optional comparator that is asked whether a destination file has the same content as its
+    source before the files are compared byte for byte (e.g. using the blob IDs in the index)
+    :param path_filter: optional rules for the files to synchronise in a directory source, where paths are relative to
+    the directory
+    :return: whether anything changed
+    """
+    if os.path.isdir(source):
+        if not source.endswith(os.sep):
+            destination = os.path.join(destination, os.path.basename(source))
+        return _synchronise_directory(source, destination, staging_area, is_same_content, path_filter)
+    if os.path.isdir(destination) and not os.path.islink(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+    return _synchronise_entry(source, destination, staging_area, is_same_content)
+
+
+def _synchronise_entry(source: str, destination: str, staging_area: StagingArea=None,
+                       is_same_content: ContentComparator=None, path_filter: PathFilter=None, path: str="") -> bool:
+    """
+    Synchronises the given destination with the given file, symlink or directory.
+    :param source: location of the file, symlink or directory
+    :param destination: location to synchronise to
+    :param staging_area: see `synchronise_path`
+    :param is_same_content: see `synchronise_path`
+    :param path_filter: see `synchronise_path`
+    :param path: path of the entry relative to the directory being synchronised
+    :return: whether anything changed
+    """
+    source_stat = os.lstat(source)
+    if stat.S_ISDIR(source_stat.st_mode):
+        return _synchronise_directory(source, destination, staging_area, is_same_content, path_filter, path)
+
+    if stat.S_ISLNK(source_stat.st_mode):
+        target = os.readlink(source)
+        if os.path.islink(destination) and os.readlink(destination) == target:
+            return False
+        _remove(destination)
+        os.symlink(target, destination)
+        return True
+
+    if not stat.S_ISREG(source_stat.st_mode):
+        _logger.info(f"Skipping non-regular file: {source}")
+        return False
+
+    same_content = is_same_content(source, destination) if is_same_content is not None else None
+    if same_content is None:
+        same_content = os.path.isfile(destination) and not os.path.islink(destination) \
+            and filecmp.cmp(source, destination, shallow=False)
+    if same_content:
+        destination_stat = os.lstat(destination)
+        if stat.S_IMODE(destination_stat.st_mode) == stat.S_IMODE(source_stat.st_mode):
+            return False
+        if staging_area is None and destination_stat.st_nlink == 1:
+            return _synchronise_permissions(source_stat, destination)
+        # Changing the permissions of a linked file would also change those of the staged file and of every other
+        # file linked to it, so the file is replaced instead
+    _remove(destination)
+    method = copy_file(source, destination, staging_area)
+    _logger.debug(f"Copied {source} to {destination} ({method})")
+    return True
+
+
+def _synchronise_directory(source: str, destination: str, staging_area: StagingArea=None,
+                           is_same_content: ContentComparator=None, path_filter: PathFilter=None,
+                           path: str="") -> bool:
+    """
+    Synchronises the given destination with the given directory, deleting anything at the destination that is not in
+    the source (unless filtered out).
+    :param source: location of the directory
+    :param destination: location to synchronise to
+    :param staging_area: see `synchronise_path`
+    :param is_same_content: see `synchronise_path`
+    :param path_filter: see `synchronise_path`
+    :param path: path of the directory relative to the directory being synchronised
+    :return: whether anything changed
+    """
+    changed = False
+    if not os.path.isdir(destination) or os.path.islink(destination):
+        _remove(destination)
+        os.makedirs(destination)
+        changed = True
+
+    # Names of entries that are filtered out are also left untouched in the destination
+    names = set(os.listdir(source))
+    for name in sorted(names):
+        entry_source, entry_path = os.path.join(source, name), _join_path(path, name)
+        if path_filter and _is_filtered_out(path_filter, entry_path, stat.S_ISDIR(os.lstat(entry_source).st_mode)):
+            continue
+        changed = _synchronise_entry(entry_source, os.path.join(destination, name), staging_area, is_same_content,
+                                     path_filter, entry_path) or changed
+    for name in sorted(set(os.listdir(destination)) - names):
+        if path_filter:
+            changed = _remove_filtered(os.path.join(destination, name), _join_path(path, name), path_filter) or changed
+        else:
+            _remove(os.path.join(destination, name))
+            changed = True
+
+    return _synchronise_permissions(os.stat(source), destination) or changed
+
+
+def _synchronise_permissions(source_stat: os.stat_result, destination: str) -> bool:
+    """
+    Sets the permissions of the given destination to those of the source.
+    :param source_stat: status of the source
+    :param destination: location of the destination
+    :return: whether the permissions changed
+    """
+    permissions = stat.S_IMODE(source_stat.st_mode)
+    if stat.S_IMODE(os.lstat(destination).st_mode) == permissions:
+        return False
+    os.chmod(destination, permissions)
+    return True
+
+
+def _is_filtered_out(path_filter: PathFilter, path: str, is_directory: bool) -> bool:
+    """
+    Whether the given entry, which is in a directory that is not excluded, is filtered out.
+    :param path_filter: the filter
+    :param path: path of the entry relative to the directory being synchronised
+    :param is_directory: whether the entry is a directory
+    :return: whether the entry is not to be synchronised
+    """
+    return path_filter.is_excluded(path, True) if is_directory else not path_filter.is_included(path)
+
+
+def _remove_filtered(location: str, path: str, path_filter: PathFilter) -> bool:
+    """
+    Removes the file, symlink or directory at the given location, apart from anything that is filtered out (and so any
+    directories that contain it).
+    :param location: the location
+    :param path: path of the entry relative to the directory being synchronised
+    :param path_filter: the filter
+    :return: whether anything was removed
+    """
+    is_directory = os.path.isdir(location) and not os.path.islink(location)
+    if _is_filtered_out(path_filter, path, is_directory):
+        return False
+    if not is_directory:
+        os.unlink(location)
+        return True
+    changed = False
+    for name in sorted(os.listdir(location)):
+        changed = _remove_filtered(os.path.join(location, name), _join_path(path, name), path_filter) or changed
+    if len(os.listdir(location)) == 0:
+        os.rmdir(location)
+        changed = True
+    return changed
+
+
+def _join_path(path: str, name: str) -> str:
+    """
+    Joins the given name onto the given relative path.
+    :param path: the path, with `/` separators (empty for the directory being synchronised)
+    :param name: the name
+    :return: the joined path
+    """
+    return f"{path}/{name}" if path != "" else name
+
+
+def _remove(location: str):
+    """
+    Removes the file, symlink or directory at the given location, if anything is there.
+    :param location: the location
+    """
+    if os.path.isdir(location) and not os.path.islink(location):
+        shutil.rmtree(location)
+    elif os.path.lexists(location):
+        os.unlink(location)
+
+
+def _copy_file_contents(source: str, destination: str) -> str:
+    """
+    Copies the content of the given file to a new file, using the cheapest method available.
+    :param source: location of the file to copy
+    :param destination: location of the new file
+    :return: the method used
+    """
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        source_fd, destination_fd = source_file.fileno(), destination_file.fileno()
+        try:
+            import fcntl
+            fcntl.ioctl(destination_fd, FICLONE, source_fd)
+            return REFLINK_METHOD
+        except (ImportError, OSError) as e:
+            if isinstance(e, OSError) and e.errno not in _UNSUPPORTED_ERRORS:
+                raise
+
+        size = os.fstat(source_fd).st_size
+        for method, copy in ((COPY_FILE_RANGE_METHOD, getattr(os, "copy_file_range", None)),
+                             (SENDFILE_METHOD, _sendfile if hasattr(os, "sendfile") else None)):
+            if copy is None:
+                continue
+            offset = 0
+            try:
+                while offset < size:
+                    copied = copy(source_fd, destination_fd, min(_COPY_CHUNK_SIZE, size - offset), offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+                return method
+            except OSError as e:
+                # Only falls back if nothing has been copied, as the file may otherwise be partially written
+                if e.errno not in _UNSUPPORTED_ERRORS or offset > 0:
+                    raise
+
+        shutil.copyfileobj(source_file, destination_file, _COPY_CHUNK_SIZE)
+        return READ_WRITE_METHOD
+
+
+def _sendfile(source_fd: int, destination_fd: int, count: int, offset: int) -> int:
+    """
+    Copies data between the given files with `sendfile`, writing at the destination's current position.
+    :param source_fd: descriptor of the file to copy from
+    :param destination_fd: descriptor of the file to copy to
+    :param count: the number of bytes to copy
+    :param offset: the position in the source to copy from
+    :return: the number of bytes copied
+    """
+    return os.sendfile(destination_fd, source_fd, offset, count)
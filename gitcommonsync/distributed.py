@@ -0,0 +1,458 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from abc import ABCMeta, abstractmethod
+from contextlib import closing
+from threading import Thread, Event
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Callable, Tuple
+
+from gitcommonsync.helpers import synchronise_repositories, RepositorySynchronisationResult
+from gitcommonsync.models import Synchronisation
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.specification import parse_jobs, REPOSITORIES_PROPERTY
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 10
+DEFAULT_LEASE_DURATION = 600.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 5.0
+
+PENDING_STATE = "pending"
+LEASED_STATE = "leased"
+DONE_STATE = "done"
+ABANDONED_STATE = "abandoned"
+
+_SPECIFICATION_KEY = "specification"
+
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS units (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL,
+        worker TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result TEXT
+    )
+"""
+_CREATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS units_run_state ON units (run, state)"
+_INSERT_SQL = "INSERT INTO units (run, payload, state) VALUES (?, ?, ?)"
+_ABANDON_EXPIRED_SQL = "UPDATE units SET state = ?, worker = NULL " \
+                       "WHERE state = ? AND lease_expires < ? AND attempts >= ?"
+_RECLAIM_EXPIRED_SQL = "UPDATE units SET state = ?, worker = NULL WHERE state = ? AND lease_expires < ?"
+_SELECT_PENDING_SQL = "SELECT id, run, payload, attempts FROM units WHERE state = ? ORDER BY id LIMIT 1"
+_LEASE_SQL = "UPDATE units SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?"
+_RENEW_SQL = "UPDATE units SET lease_expires = ? WHERE id = ? AND state = ? AND worker = ?"
+_COMPLETE_SQL = "UPDATE units SET state = ?, result = ?, lease_expires = NULL " \
+                "WHERE id = ? AND state = ? AND worker = ?"
+_COUNT_SQL = "SELECT state, COUNT(*) FROM units GROUP BY state"
+_COUNT_RUN_SQL = "SELECT state, COUNT(*) FROM units WHERE run = ? GROUP BY state"
+_SELECT_FINISHED_SQL = "SELECT payload, state, result FROM units WHERE run = ? AND state IN (?, ?) ORDER BY id"
+
+
+class WorkUnit:
+    """
+    Unit of work leased from a work queue.
+    """
+    __slots__ = ("id", "run", "payload", "attempts")
+
+    def __init__(self, id: Any, run: str, payload: Any, attempts: int):
+        """
+        Constructor.
+        :param id: the queue's identifier of the unit
+        :param run: the run the unit is part of
+        :param payload: the (JSON serialisable) description of the work
+        :param attempts: the number of times the unit has been leased, including this time
+        """
+        self.id = id
+        self.run = run
+        self.payload = payload
+        self.attempts = attempts
+
+
+class QueueProgress:
+    """
+    Number of work units in each state.
+    """
+    __slots__ = ("pending", "leased", "done", "abandoned")
+
+    def __init__(self, pending: int=0, leased: int=0, done: int=0, abandoned: int=0):
+        self.pending = pending
+        self.leased = leased
+        self.done = done
+        self.abandoned = abandoned
+
+    @property
+    def finished(self) -> bool:
+        return self.pending == 0 and self.leased == 0
+
+
+class WorkQueue(metaclass=ABCMeta):
+    """
+    Queue of work units shared by a coordinator and workers, which may be on different nodes.
+
+    Workers lease units, rather than take them, so that the units leased by a worker that dies are leased again once
+    the lease expires. A unit may therefore be worked on more than once, so the work must be idempotent (which
+    synchronising a repository is).
+    """
+    @abstractmethod
+    def put(self, run: str, payloads: Iterable[Any]):
+        """
+        Puts work units on the queue.
+        :param run: the run the units are part of
+        :param payloads: the (JSON serialisable) description of each unit of work
+        """
+
+    @abstractmethod
+    def lease(self, worker: str, duration: float) -> Optional[WorkUnit]:
+        """
+        Leases the next unit of work (from any run), including units whose lease has expired.
+        :param worker: name of the worker taking the lease
+        :param duration: the time (in seconds) before the lease expires, unless renewed
+        :return: the leased unit or `None` if there are none to lease
+        """
+
+    @abstractmethod
+    def renew(self, unit: WorkUnit, worker: str, duration: float) -> bool:
+        """
+        Renews the lease of the given unit.
+        :param unit: the unit
+        :param worker: name of the worker that holds the lease
+        :param duration: the time (in seconds) from now before the lease expires, unless renewed again
+        :return: whether the lease was renewed, which it is not if it was lost (e.g. it expired and the unit was leased
+        by another worker)
+        """
+
+    @abstractmethod
+    def complete(self, unit: WorkUnit, worker: str, result: Any) -> bool:
+        """
+        Records the result of the given unit.
+        :param unit: the unit
+        :param worker: name of the worker that holds the lease
+        :param result: the (JSON serialisable) result
+        :return: whether the result was recorded, which it is not if the lease was lost
+        """
+
+    @abstractmethod
+    def reclaim_expired(self):
+        """
+        Returns units whose lease has expired to the queue, or abandons them if they have been leased too many times.
+        """
+
+    @abstractmethod
+    def get_progress(self, run: str=None) -> QueueProgress:
+        """
+        Gets the number of units in each state.
+        :param run: the run to get the progress of (all runs if `None`)
+        :return: the progress
+        """
+
+    @abstractmethod
+    def get_finished(self, run: str) -> List[Tuple[Any, Optional[Any]]]:
+        """
+        Gets the units of the given run that are done or have been abandoned.
+        :param run: the run
+        :return: list of tuples where the first element is the payload of a unit and the second is its result (`None`
+        if abandoned)
+        """
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    Work queue backed by a SQLite database, so no external service is required.
+
+    Connections are made for each operation so that the queue can be shared between threads and processes. To be
+    shared between nodes, the database must be on a file system that supports locking.
+    """
+    def __init__(self, location: str, max_attempts: int=DEFAULT_MAX_ATTEMPTS):
+        """
+        Constructor.
+        :param location: location of the database, which is created if it does not exist
+        :param max_attempts: the number of times a unit can be leased before it is abandoned, if its lease expires
+        """
+        self.location = location
+        self.max_attempts = max_attempts
+        with closing(self._connect()) as connection:
+            connection.execute(_CREATE_TABLE_SQL)
+            connection.execute(_CREATE_INDEX_SQL)
+
+    def put(self, run: str, payloads: Iterable[Any]):
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(_INSERT_SQL, ((run, json.dumps(payload, default=str), PENDING_STATE)
+                                                 for payload in payloads))
+            connection.execute("COMMIT")
+
+    def lease(self, worker: str, duration: float) -> Optional[WorkUnit]:
+        now = time.time()
+        with closing(self._connect()) as connection:
+            # Take a write lock first, so that no other worker can lease the same unit
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._reclaim_expired(connection, now)
+                row = connection.execute(_SELECT_PENDING_SQL, (PENDING_STATE,)).fetchone()
+                if row is not None:
+                    connection.execute(_LEASE_SQL, (LEASED_STATE, worker, now + duration, row[0]))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        unit_id, run, payload, attempts = row
+        return WorkUnit(unit_id, run, json.loads(payload), attempts + 1)
+
+    def renew(self, unit: WorkUnit, worker: str, duration: float) -> bool:
+        with closing(self._connect()) as connection:
+            return connection.execute(_RENEW_SQL, (time.time() + duration, unit.id, LEASED_STATE, worker)).rowcount == 1
+
+    def complete(self, unit: WorkUnit, worker: str, result: Any) -> bool:
+        with closing(self._connect()) as connection:
+            return connection.execute(_COMPLETE_SQL, (DONE_STATE, json.dumps(result, default=str), unit.id,
+                                                      LEASED_STATE, worker)).rowcount == 1
+
+    def reclaim_expired(self):
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            self._reclaim_expired(connection, time.time())
+            connection.execute("COMMIT")
+
+    def get_progress(self, run: str=None) -> QueueProgress:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(_COUNT_SQL).fetchall() if run is None \
+                else connection.execute(_COUNT_RUN_SQL, (run,)).fetchall()
+        return QueueProgress(**dict(rows))
+
+    def get_finished(self, run: str) -> List[Tuple[Any, Optional[Any]]]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(_SELECT_FINISHED_SQL, (run, DONE_STATE, ABANDONED_STATE)).fetchall()
+        return [(json.loads(payload), json.loads(result) if state == DONE_STATE else None)
+                for payload, state, result in rows]
+
+    def _reclaim_expired(self, connection: sqlite3.Connection, now: float):
+        """
+        See `reclaim_expired`.
+        :param connection: connection with a write transaction
+        :param now: the current time
+        """
+        connection.execute(_ABANDON_EXPIRED_SQL, (ABANDONED_STATE, LEASED_STATE, now, self.max_attempts))
+        connection.execute(_RECLAIM_EXPIRED_SQL, (PENDING_STATE, LEASED_STATE, now))
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Connects to the database, in autocommit mode (so transactions are explicit).
+        :return: the database connection
+        """
+        return sqlite3.connect(self.location, timeout=60, isolation_level=None)
+
+
+class RepositoryReport:
+    """
+    Serialisable report of the result of synchronising a repository.
+    """
+    __slots__ = ("remote", "branch", "synchronised", "error", "commit", "duration")
+
+    @staticmethod
+    def from_result(result: RepositorySynchronisationResult) -> "RepositoryReport":
+        """
+        Creates a report of the given result.
+        :param result: the result
+        :return: the report
+        """
+        return RepositoryReport(
+            result.repository.remote, result.repository.branch,
+            {synchronisation_type.__name__: len(synchronised)
+             for synchronisation_type, synchronised in result.synchronised.items() if len(synchronised) > 0},
+            str(result.error) if result.error is not None else None, result.commit, result.duration)
+
+    @staticmethod
+    def from_json(value: Dict[str, Any]) -> "RepositoryReport":
+        """
+        Creates a report from its JSON representation (see `to_json`).
+        :param value: the JSON representation
+        :return: the report
+        """
+        return RepositoryReport(**value)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def changed(self) -> bool:
+        return len(self.synchronised) > 0
+
+    def __init__(self, remote: str, branch: str, synchronised: Dict[str, int]=None, error: str=None,
+                 commit: str=None, duration: float=None):
+        """
+        Constructor.
+        :param remote: url of the repository's remote
+        :param branch: the branch synchronised
+        :param synchronised: the number of synchronisations applied, indexed by synchronisation type name
+        :param error: description of the error raised whilst synchronising the repository, if any
+        :param commit: the (full) ID of the commit pushed, if any
+        :param duration: the time (in seconds) taken to synchronise the repository
+        """
+        self.remote = remote
+        self.branch = branch
+        self.synchronised = synchronised if synchronised is not None else {}
+        self.error = error
+        self.commit = commit
+        self.duration = duration
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Gets the JSON representation of the report.
+        :return: the JSON representation
+        """
+        return {name: getattr(self, name) for name in RepositoryReport.__slots__}
+
+
+def shard(specification: Dict[str, Any], shard_size: int=DEFAULT_SHARD_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Shards the repositories of the given specification into work units.
+    :param specification: the specification (see `specification.load_specification`)
+    :param shard_size: the maximum number of repositories in each unit
+    :return: iterator of the payloads of the units, each of which holds a specification of a subset of the repositories
+    """
+    if shard_size < 1:
+        raise ValueError(f"Shard size must be at least 1: {shard_size}")
+    configurations = specification[REPOSITORIES_PROPERTY]
+    if configurations is None:
+        yield {_SPECIFICATION_KEY: specification}
+        return
+    for start in range(0, len(configurations), shard_size):
+        yield {_SPECIFICATION_KEY: {**specification, REPOSITORIES_PROPERTY: configurations[start:start + shard_size]}}
+
+
+def submit(specification: Dict[str, Any], queue: WorkQueue, shard_size: int=DEFAULT_SHARD_SIZE,
+           run: str=None) -> str:
+    """
+    Puts the repositories of the given specification on the given queue, in shards, for workers to synchronise.
+    :param specification: the specification (see `specification.load_specification`). The sources of the
+    synchronisations must be at the same locations on the workers
+    :param queue: the queue
+    :param shard_size: the maximum number of repositories in each unit of work
+    :param run: the identifier of the run (generated if not given)
+    :return: the identifier of the run
+    """
+    run = run if run is not None else uuid.uuid4().hex
+    queue.put(run, shard(specification, shard_size))
+    return run
+
+
+def wait_for_run(queue: WorkQueue, run: str, poll_interval: float=DEFAULT_POLL_INTERVAL, timeout: float=None) \
+        -> List[RepositoryReport]:
+    """
+    Waits for the workers to finish the given run, then aggregates their results.
+    :param queue: the queue
+    :param run: the identifier of the run
+    :param poll_interval: the time (in seconds) between checks of the progress of the run
+    :param timeout: the maximum time (in seconds) to wait (no limit if `None`)
+    :return: the report of each repository, in the order they were submitted. The repositories in abandoned units are
+    reported as failed
+    :raises TimeoutError: if the run did not finish in time
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        queue.reclaim_expired()
+        progress = queue.get_progress(run)
+        if progress.finished:
+            break
+        _logger.info(f"Run {run}: {progress.pending} units pending, {progress.leased} leased, {progress.done} done, "
+                     f"{progress.abandoned} abandoned")
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Run {run} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+
+    reports: List[RepositoryReport] = []
+    for payload, result in queue.get_finished(run):
+        if result is not None:
+            reports.extend(RepositoryReport.from_json(report) for report in result)
+        else:
+            reports.extend(RepositoryReport(repository.remote, repository.branch,
+                                            error="Abandoned after the workers synchronising it stopped")
+                           for repository, _ in parse_jobs(payload[_SPECIFICATION_KEY]))
+    return reports
+
+
+class Worker:
+    """
+    Worker that synchronises the repositories in the units of work it leases from a queue.
+    """
+    def __init__(self, queue: WorkQueue, name: str=None, lease_duration: float=DEFAULT_LEASE_DURATION,
+                 poll_interval: float=DEFAULT_POLL_INTERVAL,
+                 configure_jobs: Callable[[List[Tuple[GitRepository, List[Synchronisation]]]],
+                                          List[Tuple[GitRepository, List[Synchronisation]]]]=None,
+                 **synchronise_kwargs: Any):
+        """
+        Constructor.
+        :param queue: the queue
+        :param name: name of the worker, which must be unique (defaults to the host name and process ID)
+        :param lease_duration: the time (in seconds) that leases last, which are renewed whilst the units are worked on
+        (so it is how long it takes for the units of a worker that dies to be leased by another)
+        :param poll_interval: the time (in seconds) to wait before trying to lease again when all units are leased
+        :param configure_jobs: optional function that configures the jobs of each unit before they are synchronised
+        (e.g. to use shared resources)
+        :param synchronise_kwargs: arguments passed to `helpers.synchronise_repositories`
+        """
+        self.queue = queue
+        self.name = name if name is not None else f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_duration = lease_duration
+        self.poll_interval = poll_interval
+        self.configure_jobs = configure_jobs
+        self.synchronise_kwargs = synchronise_kwargs
+
+    def run(self, wait: bool=True) -> List[RepositoryReport]:
+        """
+        Works on units from the queue until there are none left.
+        :param wait: whether to wait for units leased by other workers to be finished (in case their leases expire and
+        they need to be worked on), rather than stop once there are no units to lease
+        :return: the reports of the repositories synchronised by this worker
+        """
+        reports: List[RepositoryReport] = []
+        while True:
+            unit = self.queue.lease(self.name, self.lease_duration)
+            if unit is None:
+                if not wait or self.queue.get_progress().finished:
+                    return reports
+                time.sleep(self.poll_interval)
+                continue
+            reports.extend(self.work(unit))
+
+    def work(self, unit: WorkUnit) -> List[RepositoryReport]:
+        """
+        Synchronises the repositories of the given unit, renewing its lease until done, then records the result.
+        :param unit: the leased unit
+        :return: the reports of the repositories synchronised
+        """
+        _logger.info(f"Worker {self.name} working on unit {unit.id} of run {unit.run} (attempt {unit.attempts})")
+        jobs = parse_jobs(unit.payload[_SPECIFICATION_KEY])
+        if self.configure_jobs is not None:
+            jobs = self.configure_jobs(jobs)
+
+        done = Event()
+
+        def renew_lease():
+            while not done.wait(self.lease_duration / 3):
+                if not self.queue.renew(unit, self.name, self.lease_duration):
+                    _logger.warning(f"Worker {self.name} lost the lease of unit {unit.id}")
+                    return
+
+        renewer = Thread(target=renew_lease, name=f"lease-{unit.id}", daemon=True)
+        renewer.start()
+        try:
+            reports = [RepositoryReport.from_result(result)
+                       for result in synchronise_repositories(jobs, **self.synchronise_kwargs)]
+        finally:
+            done.set()
+            renewer.join()
+        if not self.queue.complete(unit, self.name, [report.to_json() for report in reports]):
+            _logger.warning(f"Result of unit {unit.id} not recorded by {self.name} as its lease was lost")
+        return reports
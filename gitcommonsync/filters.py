@@ -0,0 +1,77 @@
+from fnmatch import fnmatchcase
+from typing import Sequence, Tuple
+
+
+class PathFilter:
+    """
+    Glob based include and exclude rules for the contents of a directory that is synchronised.
+
+    Paths are relative to the directory, with `/` separators. Patterns are matched with `fnmatch` against the name of an
+    entry, or against its path if the pattern contains a `/`; patterns that end with a `/` only match directories.
+
+    Excluded entries are left untouched on both sides: excluded directories are not walked, and excluded files (or
+    directories) in the destination are not deleted. If there are include rules, only files that (or whose parent
+    directories) match one are synchronised; other files are similarly left untouched.
+    """
+    def __init__(self, include: Sequence[str]=(), exclude: Sequence[str]=()):
+        """
+        Constructor.
+        :param include: patterns of the files to synchronise (all if empty)
+        :param exclude: patterns of the files and directories not to synchronise, which take precedence over includes
+        """
+        self.include: Tuple[str, ...] = tuple(include)
+        self.exclude: Tuple[str, ...] = tuple(exclude)
+
+    def __bool__(self) -> bool:
+        return len(self.include) > 0 or len(self.exclude) > 0
+
+    def is_excluded(self, path: str, is_directory: bool) -> bool:
+        """
+        Whether the given entry is excluded (but not whether any of its parent directories are).
+        :param path: path of the entry
+        :param is_directory: whether the entry is a directory
+        :return: whether the entry is excluded
+        """
+        return _matches_any(self.exclude, path, is_directory)
+
+    def is_included(self, path: str) -> bool:
+        """
+        Whether the given file, which is in a directory that is not excluded, is to be synchronised.
+        :param path: path of the file
+        :return: whether the file is to be synchronised
+        """
+        if self.is_excluded(path, False):
+            return False
+        if len(self.include) == 0 or _matches_any(self.include, path, False):
+            return True
+        components = path.split("/")
+        return any(_matches_any(self.include, "/".join(components[0:i]), True) for i in range(1, len(components)))
+
+    def is_path_excluded(self, path: str) -> bool:
+        """
+        Whether the given path, or any of its parent directories, is excluded.
+        :param path: the path
+        :return: whether the path is excluded
+        """
+        components = path.split("/")
+        return any(self.is_excluded("/".join(components[0:i]), True) for i in range(1, len(components))) \
+            or self.is_excluded(path, False) or self.is_excluded(path, True)
+
+
+def _matches_any(patterns: Sequence[str], path: str, is_directory: bool) -> bool:
+    """
+    Whether the given entry matches any of the given patterns (see `PathFilter`).
+    :param patterns: the patterns
+    :param path: path of the entry
+    :param is_directory: whether the entry is a directory
+    :return: whether a pattern matches
+    """
+    name = path.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if not is_directory:
+                continue
+            pattern = pattern[:-1]
+        if fnmatchcase(path if "/" in pattern else name, pattern.lstrip("/")):
+            return True
+    return False
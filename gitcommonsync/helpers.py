@@ -1,10 +1,37 @@
+import logging
+import time
 from collections import defaultdict
-from typing import List, Dict, Type, DefaultDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from queue import Queue
+from threading import Thread, Event
+from typing import List, Dict, Type, DefaultDict, Iterable, Tuple, Sequence, Optional, Callable, Iterator, \
+    Union, Any
 
+from gitcommonsync.api import ApiRepository, ApiSynchroniser
+from gitcommonsync.copying import StagingArea
+from gitcommonsync.journal import Journal, STARTED_PHASE, PUSHED_PHASE, COMPLETED_PHASE, FAILED_PHASE
+from gitcommonsync.pipeline import Pipeline, Stage, DEFAULT_QUEUE_SIZE
+from gitcommonsync.planning import create_plan, SynchronisationPlan
+from gitcommonsync.rendering import RenderCache
 from gitcommonsync.repository import GitRepository
+from gitcommonsync.scheduling import HostScheduler
+from gitcommonsync.scratch import ScratchSpacePolicy
+from gitcommonsync.subrepo_engine import NativeSubrepoEngine
+from gitcommonsync.subrepos import resolve_subrepo_commits, pin_subrepo_commits
+from gitcommonsync.state import SynchronisationStateStore, SynchronisationState, get_fingerprint
 from gitcommonsync.models import FileSynchronisation, SubrepoSynchronisation, TemplateSynchronisation
 from gitcommonsync.synchronisers import FileSynchroniser, TemplateSynchroniser, SubrepoSynchroniser, Synchronisable, \
-    Synchroniser
+    SynchronisationResult, SynchronisationListener
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PIPELINE_WORKERS = 1
+
+# Maximum time to wait for another user of a scheduler to release a slot, before trying to start jobs again
+_SCHEDULER_WAIT_TIMEOUT = 1.0
+
+# Put on the queue of results once there will be no more
+_END_OF_RESULTS = object()
 
 synchronisable_to_synchroniser = {
     SubrepoSynchronisation: SubrepoSynchroniser,
@@ -13,35 +40,600 @@ synchronisable_to_synchroniser = {
 }
 
 
-def synchronise(repository: GitRepository, synchronisables: List[Synchronisable], dry_run: bool=False) \
+class RepositorySynchronisationResult:
+    """
+    Result of synchronising a single repository as part of a multi-repository run.
+    """
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def changed(self) -> bool:
+        return any(len(synchronised) > 0 for synchronised in self.synchronised.values())
+
+    def __init__(self, repository: GitRepository,
+                 synchronised: DefaultDict[Type[Synchronisable], List[Synchronisable]]=None, error: Exception=None,
+                 commit: str=None, duration: float=None):
+        """
+        Constructor.
+        :param repository: the repository that was synchronised
+        :param synchronised: the synchronisations applied, indexed by synchronisation type
+        :param error: the error raised whilst synchronising the repository, if any
+        :param commit: the (full) ID of the commit pushed, if any
+        :param duration: the time (in seconds) taken to synchronise the repository
+        """
+        self.repository = repository
+        self.synchronised = synchronised if synchronised is not None else defaultdict(list)
+        self.error = error
+        self.commit = commit
+        self.duration = duration
+
+
+ResultListener = Callable[[Union[SynchronisationResult, RepositorySynchronisationResult]], None]
+
+
+def synchronise(repository: GitRepository, synchronisables: List[Synchronisable], dry_run: bool=False,
+                state_store: SynchronisationStateStore=None, scratch_space_policy: ScratchSpacePolicy=None,
+                subrepo_engine: NativeSubrepoEngine=None, journal: Journal=None, staging_area: StagingArea=None,
+                render_cache: RenderCache=None, listener: SynchronisationListener=None) \
         -> DefaultDict[Type[Synchronisable], List[Synchronisable]]:
     """
     Performs the given synchronisations on the given repository and (by default) pushes back to the source repository.
     :param repository: the git repository
-    :param synchronisables: the synchronisations to apply
+    :param synchronisables: the synchronisations to apply, which are planned with `create_plan` (so duplicates are
+    applied once). Subrepo synchronisations that are not pinned to a commit are applied pinned to the head of their
+    branch (see `resolve_subrepo_commits`), though are reported as given
     :param dry_run: does not push changes back if set to True
+    :param state_store: optional store of the state of repositories when they were last synchronised. If the head of
+    the repository's branch and the synchronisations (including the content of their sources) are unchanged since the
+    repository was last synchronised, the repository is not checked out
+    :param scratch_space_policy: optional policy that decides where to check out the repository (see
+    `GitRepository.checkout`)
+    :param subrepo_engine: optional engine to synchronise subrepos with, instead of `git subrepo`
+    :param journal: optional journal in which to record the commit pushed once all changes have been pushed (the
+    repository must have been recorded as started)
+    :param staging_area: optional staging area to hardlink synchronised files from, rather than copying them
+    :param render_cache: optional cache of rendered templates, so that unchanged templates are not rendered again
+    :param listener: optional listener that is given the result of each synchronisation as it is applied (see
+    `Synchroniser.synchronise`)
     :return: the synchronisations applied, indexed by synchronisation type
+    :raises PlanConflictError: if the destinations of the synchronisations conflict
+    """
+    run = _RepositorySynchronisation(
+        repository, synchronisables, dry_run=dry_run, state_store=state_store,
+        scratch_space_policy=scratch_space_policy, subrepo_engine=subrepo_engine, journal=journal,
+        staging_area=staging_area, render_cache=render_cache, listener=listener)
+    run.run()
+    return run.synchronised
+
+
+class _RepositorySynchronisation:
+    """
+    Synchronisation of a single repository (see `synchronise`), split into stages so that the stages of different
+    repositories can be run at the same time (see `synchronise_repositories`).
+    """
+    def __init__(self, repository: GitRepository, synchronisables: List[Synchronisable], dry_run: bool=False,
+                 state_store: SynchronisationStateStore=None, scratch_space_policy: ScratchSpacePolicy=None,
+                 subrepo_engine: NativeSubrepoEngine=None, journal: Journal=None, staging_area: StagingArea=None,
+                 render_cache: RenderCache=None, listener: SynchronisationListener=None,
+                 resolved: Dict[Tuple[str, Optional[str]], Optional[str]]=None):
+        """
+        Constructor.
+        :param repository: see `synchronise`
+        :param synchronisables: see `synchronise`
+        :param dry_run: see `synchronise`
+        :param state_store: see `synchronise`
+        :param scratch_space_policy: see `synchronise`
+        :param subrepo_engine: see `synchronise`
+        :param journal: see `synchronise`
+        :param staging_area: see `synchronise`
+        :param render_cache: see `synchronise`
+        :param listener: see `synchronise`
+        :param resolved: optional cache of the commits that subrepos have been resolved to (see
+        `resolve_subrepo_commits`)
+        """
+        self.repository = repository
+        self.synchronisables = synchronisables
+        self.dry_run = dry_run
+        self.state_store = state_store
+        self.scratch_space_policy = scratch_space_policy
+        self.subrepo_engine = subrepo_engine
+        self.journal = journal
+        self.staging_area = staging_area
+        self.render_cache = render_cache
+        self.listener = listener
+        self.resolved = resolved
+        self.synchronised: DefaultDict[Type[Synchronisable], List[Synchronisable]] = defaultdict(list)
+        self.commit: Optional[str] = None
+        self._plan: Optional[SynchronisationPlan] = None
+        self._state: Optional[SynchronisationState] = None
+        # The synchronisations given, indexed by the copies of them that were pinned to a commit
+        self._unpinned: Dict[Synchronisable, Synchronisable] = {}
+
+    @property
+    def changed(self) -> bool:
+        return any(len(applied) > 0 for applied in self.synchronised.values())
+
+    def run(self):
+        """
+        Runs all of the stages of the synchronisation.
+        """
+        if self.prepare():
+            try:
+                self.check_out()
+                self.apply()
+                self.push()
+            finally:
+                self.tear_down()
+            self.finish()
+
+    def prepare(self) -> bool:
+        """
+        Plans the synchronisations, without checking out the repository.
+        :return: whether the repository is to be synchronised, which it is not if unchanged since it was last
+        synchronised (according to the state store)
+        :raises PlanConflictError: if the destinations of the synchronisations conflict
+        """
+        if self.repository.checkout_location is not None:
+            raise ValueError("Repository must not already be checked out")
+
+        # Validated before anything is fetched, so conflicting synchronisations fail fast
+        self._plan = create_plan(self.synchronisables)
+
+        # Pins subrepos that track a branch to its current head, so that the state recorded and the commit checked out
+        # match
+        pinned = pin_subrepo_commits(
+            self.synchronisables, resolve_subrepo_commits(self.synchronisables, resolved=self.resolved))
+        for pinned_synchronisable, synchronisable in zip(pinned, self.synchronisables):
+            if pinned_synchronisable is not synchronisable:
+                self._unpinned.setdefault(pinned_synchronisable, synchronisable)
+        if len(self._unpinned) > 0:
+            self._plan = create_plan(pinned)
+
+        if self.state_store is not None and len(pinned) > 0:
+            self._state = SynchronisationState(self.repository.get_remote_head(), get_fingerprint(pinned))
+            if self.state_store.get(self.repository.remote, self.repository.branch) == self._state:
+                _logger.info(f"Skipping {self.repository.remote} ({self.repository.branch}) as unchanged since last "
+                             f"synchronised")
+                return False
+        return True
+
+    def check_out(self):
+        """
+        Checks out the repository, if there is anything to synchronise (and it is not changed through an API).
+        """
+        if len(self._plan.steps) > 0 and not isinstance(self.repository, ApiRepository):
+            self.repository.checkout(scratch_space_policy=self.scratch_space_policy)
+
+    def apply(self):
+        """
+        Applies the planned synchronisations to the checked out repository, committing the changes (the changes are also
+        pushed, unless the repository defers its pushes).
+        """
+        if len(self._plan.steps) == 0:
+            return
+        if isinstance(self.repository, ApiRepository):
+            # All changes are made in a single commit
+            synchroniser = ApiSynchroniser(self.repository, render_cache=self.render_cache)
+            for synchronised in synchroniser.synchronise(
+                    [synchronisable for _, batch in self._plan.get_batches() for synchronisable in batch],
+                    dry_run=self.dry_run, listener=self._get_listener()):
+                self.synchronised[type(synchronised)].append(self._unpinned.get(synchronised, synchronised))
+            return
+        for synchroniser_type, batch in self._plan.get_batches():
+            if synchroniser_type == SubrepoSynchroniser:
+                synchroniser = SubrepoSynchroniser(self.repository, engine=self.subrepo_engine)
+            elif synchroniser_type == FileSynchroniser:
+                synchroniser = FileSynchroniser(self.repository, staging_area=self.staging_area)
+            elif synchroniser_type == TemplateSynchroniser:
+                synchroniser = TemplateSynchroniser(self.repository, render_cache=self.render_cache)
+            else:
+                synchroniser = synchroniser_type(self.repository)
+            applied = synchroniser.synchronise(batch, dry_run=self.dry_run, listener=self._get_listener())
+            self.synchronised[type(batch[0])].extend(
+                self._unpinned.get(synchronised, synchronised) for synchronised in applied)
+
+    def _get_listener(self) -> Optional[SynchronisationListener]:
+        """
+        Gets the listener to give to the synchronisers, which reports the synchronisations that were given rather than
+        the copies of them that were pinned to a commit.
+        :return: the listener or `None` if there is no listener
+        """
+        if self.listener is None:
+            return None
+
+        def report(result: SynchronisationResult):
+            result.synchronisation = self._unpinned.get(result.synchronisation, result.synchronisation)
+            self.listener(result)
+
+        return report
+
+    def push(self):
+        """
+        Pushes any deferred changes, then records the commit pushed (including in the journal).
+        """
+        if self.repository.checkout_location is not None:
+            self.repository.push_deferred()
+        elif not isinstance(self.repository, ApiRepository):
+            return
+        if not self.dry_run and self.changed:
+            self.commit = self.repository.get_head()
+            if self.journal is not None:
+                self.journal.record(self.repository.remote, self.repository.branch, PUSHED_PHASE, commit=self.commit)
+
+    def tear_down(self):
+        """
+        Tears down the checkout of the repository, if checked out.
+        """
+        self.repository.tear_down()
+
+    def finish(self):
+        """
+        Records the state of the repository after it has been synchronised in the state store.
+        """
+        if self.state_store is not None and self._state is not None and not self.dry_run:
+            if self.changed:
+                # The commit pushed, rather than the remote's head, which may since have moved on
+                self._state.head = self.commit
+            self.state_store.set(self.repository.remote, self.repository.branch, self._state)
+
+
+def synchronise_repositories(jobs: Iterable[Tuple[GitRepository, List[Synchronisable]]], dry_run: bool=False,
+                             parallelism: int=1, state_store: SynchronisationStateStore=None,
+                             scratch_space_policy: ScratchSpacePolicy=None, subrepo_engine: NativeSubrepoEngine=None,
+                             scheduler: HostScheduler=None, journal: Journal=None, staging_area: StagingArea=None,
+                             render_cache: RenderCache=None, pipeline: "PipelineStages"=None,
+                             listener: ResultListener=None, stop: Event=None) -> List[RepositorySynchronisationResult]:
+    """
+    Performs the given synchronisations on each of the given repositories, using a pool of workers.
+
+    A failure to synchronise one repository does not stop the synchronisation of the others: the error is instead
+    recorded in the corresponding result.
+    :param jobs: pairs where the first element is the git repository and the second is the synchronisations to apply
+    to it. The same synchronisation objects must not be shared between repositories. If not a sequence (e.g. a
+    generator, such as `specification.iterate_jobs`), jobs are only taken as workers become free (unless scheduled)
+    :param dry_run: does not push changes back if set to True
+    :param parallelism: the maximum number of repositories to synchronise at the same time
+    :param state_store: see `synchronise`
+    :param scratch_space_policy: see `synchronise`. Shared between the repositories, so the memory cap applies across
+    those synchronised at the same time
+    :param subrepo_engine: see `synchronise`
+    :param scheduler: optional scheduler that limits the repositories synchronised at the same time, and the rate of
+    git operations, for each host. Repositories are synchronised longest first, so all jobs are taken at the start
+    :param journal: optional journal in which to record the progress of each repository. Repositories recorded in the
+    journal as completed with the same synchronisations (e.g. in an interrupted run that is being resumed) are skipped
+    :param staging_area: see `synchronise`. Shared between the repositories, so each file is staged once
+    :param render_cache: see `synchronise`. Shared between the repositories, so each template is rendered once for the
+    same variables
+    :param pipeline: optional sizes of the stages of a pipeline in which to synchronise the repositories, so that the
+    checkout, local synchronisation and push of different repositories overlap. If given, the parallelism is not used
+    (the stage sizes are used instead). Cannot be used with a scheduler
+    :param listener: optional listener that is given the result of each synchronisation (see `synchronise`) and of
+    each repository as they complete. Called from the threads that synchronise the repositories
+    :param stop: optional event that, once set, stops any more repositories from being started (those already started
+    are completed)
+    :return: the result of synchronising each repository that was started, in the order in which the jobs were given
+    """
+    if parallelism < 1:
+        raise ValueError(f"Parallelism must be at least 1: {parallelism}")
+    if pipeline is not None and scheduler is not None:
+        raise ValueError("Repositories cannot be both pipelined and scheduled")
+
+    if scheduler is not None:
+        jobs = list(jobs)
+        # The schedulers of the repositories, which are restored once they have been synchronised
+        schedulers = [repository.scheduler for repository, _ in jobs]
+        for repository, _ in jobs:
+            repository.scheduler = scheduler
+
+    # Resolves each subrepo once for the whole run, so that all repositories are synchronised to the same commit
+    resolved: Dict[Tuple[str, Optional[str]], Optional[str]] = {}
+    if isinstance(jobs, Sequence):
+        resolve_subrepo_commits((synchronisable for _, synchronisables in jobs for synchronisable in synchronisables),
+                                resolved=resolved)
+
+    def start(repository: GitRepository, synchronisables: List[Synchronisable]) -> bool:
+        if journal is not None:
+            fingerprint = get_fingerprint(pin_subrepo_commits(synchronisables, resolved))
+            if journal.is_completed(repository, fingerprint):
+                _logger.info(f"Skipping {repository.remote} ({repository.branch}) as already completed")
+                return False
+            journal.record(repository.remote, repository.branch, STARTED_PHASE, fingerprint)
+        return True
+
+    def report(result: RepositorySynchronisationResult, started: float) -> RepositorySynchronisationResult:
+        result.duration = time.monotonic() - started
+        if listener is not None:
+            listener(result)
+        return result
+
+    def skip(repository: GitRepository, started: float) -> RepositorySynchronisationResult:
+        return report(RepositorySynchronisationResult(repository), started)
+
+    def complete(synchronisation: _RepositorySynchronisation, started: float) -> RepositorySynchronisationResult:
+        repository = synchronisation.repository
+        if journal is not None:
+            entry = journal.get(repository.remote, repository.branch)
+            journal.record(repository.remote, repository.branch, COMPLETED_PHASE,
+                           commit=entry.commit if entry is not None else None)
+        return report(RepositorySynchronisationResult(repository, synchronisation.synchronised,
+                                                      commit=synchronisation.commit), started)
+
+    def fail(repository: GitRepository, error: Exception, started: float) -> RepositorySynchronisationResult:
+        if journal is not None:
+            journal.record(repository.remote, repository.branch, FAILED_PHASE)
+        return report(RepositorySynchronisationResult(repository, error=error), started)
+
+    def create_synchronisation(repository: GitRepository, synchronisables: List[Synchronisable]) \
+            -> _RepositorySynchronisation:
+        return _RepositorySynchronisation(
+            repository, synchronisables, dry_run=dry_run, state_store=state_store,
+            scratch_space_policy=scratch_space_policy, subrepo_engine=subrepo_engine, journal=journal,
+            staging_area=staging_area, render_cache=render_cache, listener=listener, resolved=resolved)
+
+    def synchronise_repository(job: Tuple[GitRepository, List[Synchronisable]]) -> RepositorySynchronisationResult:
+        started = time.monotonic()
+        repository, synchronisables = job
+        try:
+            if not start(repository, synchronisables):
+                return skip(repository, started)
+            synchronisation = create_synchronisation(repository, synchronisables)
+            synchronisation.run()
+        except Exception as e:
+            return fail(repository, e, started)
+        return complete(synchronisation, started)
+
+    if scheduler is not None:
+        try:
+            return _synchronise_scheduled(jobs, synchronise_repository, parallelism, scheduler, stop)
+        finally:
+            for (repository, _), repository_scheduler in zip(jobs, schedulers):
+                repository.scheduler = repository_scheduler
+
+    if stop is not None:
+        jobs = _take_jobs_until(jobs, stop)
+
+    if pipeline is not None:
+        return _synchronise_pipelined(jobs, pipeline, resolved, start, create_synchronisation, skip, complete, fail)
+
+    results: Dict[int, RepositorySynchronisationResult] = {}
+    # Limits the jobs taken ahead of the workers, so that lazily loaded jobs are not all held at once. Waits for any
+    # job to complete (rather than the oldest), so one slow repository does not hold back the others
+    in_progress: Dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for index, job in enumerate(jobs):
+            resolve_subrepo_commits(job[1], resolved=resolved)
+            in_progress[executor.submit(synchronise_repository, job)] = index
+            if len(in_progress) >= 2 * parallelism:
+                completed, _ = wait(in_progress.keys(), return_when=FIRST_COMPLETED)
+                for future in completed:
+                    results[in_progress.pop(future)] = future.result()
+        for future, index in in_progress.items():
+            results[index] = future.result()
+    return [results[index] for index in range(len(results))]
+
+
+def iterate_synchronisation_results(jobs: Iterable[Tuple[GitRepository, List[Synchronisable]]], **kwargs: Any) \
+        -> Iterator[Union[SynchronisationResult, RepositorySynchronisationResult]]:
+    """
+    Performs the given synchronisations on each of the given repositories (see `synchronise_repositories`), yielding the
+    result of each synchronisation and of each repository as they complete (in order of completion).
+
+    The repositories are synchronised in the background. If the iterator is closed early (e.g. when a repository
+    fails), no more repositories are started but those already started are completed before it closes.
+    :param jobs: see `synchronise_repositories`
+    :param kwargs: the other arguments of `synchronise_repositories` (apart from the listener and stop event)
+    :return: iterator of the results
+    :raises Exception: any exception raised by `synchronise_repositories` (e.g. when iterating the jobs)
     """
-    if repository.checkout_location is not None:
-        raise ValueError("Repository must not already be checked out")
+    results: Queue = Queue()
+    stopped = Event()
+    errors: List[Exception] = []
+
+    def run():
+        try:
+            synchronise_repositories(jobs, listener=results.put, stop=stopped, **kwargs)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            results.put(_END_OF_RESULTS)
 
-    jobs: Dict[Type[Synchroniser], List[Synchronisable]] = defaultdict(list)
-    synchronised: Dict[Type[Synchronisable], List[Synchronisable]] = defaultdict(list)
+    thread = Thread(target=run, name="synchronise-repositories", daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result is _END_OF_RESULTS:
+                break
+            yield result
+    finally:
+        stopped.set()
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
 
-    for synchronisation in synchronisables:
-        assert type(synchronisation) in synchronisable_to_synchroniser
-        synchroniser_type = synchronisable_to_synchroniser[type(synchronisation)]
-        jobs[synchroniser_type].append(synchronisation)
 
-    if len(synchronisables) > 0:
+class PipelineStages:
+    """
+    Sizes of the stages of the pipeline in which repositories are synchronised (see `synchronise_repositories`).
+    """
+    def __init__(self, checkout_workers: int=DEFAULT_PIPELINE_WORKERS,
+                 synchronise_workers: int=DEFAULT_PIPELINE_WORKERS, push_workers: int=DEFAULT_PIPELINE_WORKERS,
+                 queue_size: int=DEFAULT_QUEUE_SIZE):
+        """
+        Constructor.
+        :param checkout_workers: the number of repositories to plan and check out (network bound) at the same time
+        :param synchronise_workers: the number of repositories to apply synchronisations to (CPU and disk bound) at the
+        same time
+        :param push_workers: the number of repositories to push (network bound) at the same time
+        :param queue_size: the number of checked out repositories that can wait for each of the later stages, beyond
+        which checkouts are held back
+        """
+        self.checkout_workers = checkout_workers
+        self.synchronise_workers = synchronise_workers
+        self.push_workers = push_workers
+        self.queue_size = queue_size
+
+
+class _PipelinedJob:
+    """
+    Job that is passed through the stages of the synchronisation pipeline.
+    """
+    def __init__(self, repository: GitRepository, synchronisables: List[Synchronisable]):
+        """
+        Constructor.
+        :param repository: the repository to synchronise
+        :param synchronisables: the synchronisations to apply to it
+        """
+        self.repository = repository
+        self.synchronisables = synchronisables
+        self.synchronisation: Optional[_RepositorySynchronisation] = None
+        self.result: Optional[RepositorySynchronisationResult] = None
+        self.started: Optional[float] = None
+        # Whether the repository deferred its pushes before it was pipelined, which is restored once it leaves the
+        # pipeline
+        self.defer_pushes: Optional[bool] = None
+
+
+def _synchronise_pipelined(
+        jobs: Iterable[Tuple[GitRepository, List[Synchronisable]]], stages: PipelineStages,
+        resolved: Dict[Tuple[str, Optional[str]], Optional[str]],
+        start: Callable[[GitRepository, List[Synchronisable]], bool],
+        create_synchronisation: Callable[[GitRepository, List[Synchronisable]], _RepositorySynchronisation],
+        skip: Callable[[GitRepository, float], RepositorySynchronisationResult],
+        complete: Callable[[_RepositorySynchronisation, float], RepositorySynchronisationResult],
+        fail: Callable[[GitRepository, Exception, float], RepositorySynchronisationResult]) \
+        -> List[RepositorySynchronisationResult]:
+    """
+    Synchronises the given repositories in a pipeline of three stages, connected by bounded queues: planning and
+    checking out, applying the synchronisations (and committing), then pushing. Pushes are deferred to the last stage.
+    :param jobs: the repositories and the synchronisations to apply to them
+    :param stages: sizes of the stages
+    :param resolved: cache of the commits that subrepos have been resolved to in this run
+    :param start: records that the given repository has been started, returning `False` if it is already completed
+    :param create_synchronisation: creates the synchronisation of the given repository
+    :param skip: gets the result of the given repository, which was already completed (given when it was started)
+    :param complete: records that the given synchronisation has been completed (given when it was started), returning
+    its result
+    :param fail: records that the given repository failed (given the error and when it was started), returning its
+    result
+    :return: the result of synchronising each repository, in the order in which the jobs were given
+    """
+    def check_out(job: _PipelinedJob) -> bool:
+        job.started = time.monotonic()
+        if not start(job.repository, job.synchronisables):
+            job.result = skip(job.repository, job.started)
+            return False
+        job.defer_pushes = job.repository.defer_pushes
+        job.repository.defer_pushes = True
+        job.synchronisation = create_synchronisation(job.repository, job.synchronisables)
+        if not job.synchronisation.prepare():
+            restore_pushes(job)
+            job.result = complete(job.synchronisation, job.started)
+            return False
+        job.synchronisation.check_out()
+        return True
+
+    def apply(job: _PipelinedJob) -> bool:
+        job.synchronisation.apply()
+        return True
+
+    def push(job: _PipelinedJob) -> bool:
         try:
-            repository.checkout()
-            for synchroniser_type, synchronisables in jobs.items():
-                assert len(synchronisables) > 0
-                synchroniser = synchroniser_type(repository)
-                synchronisable_type = type(synchronisables[0])
-                synchronised[synchronisable_type] = synchroniser.synchronise(synchronisables, dry_run=dry_run)
+            job.synchronisation.push()
         finally:
-            repository.tear_down()
+            job.synchronisation.tear_down()
+            restore_pushes(job)
+        job.synchronisation.finish()
+        job.result = complete(job.synchronisation, job.started)
+        return True
+
+    def on_error(job: _PipelinedJob, error: Exception):
+        if job.synchronisation is not None:
+            job.synchronisation.tear_down()
+        restore_pushes(job)
+        job.result = fail(job.repository, error, job.started)
+
+    def restore_pushes(job: _PipelinedJob):
+        if job.defer_pushes is not None:
+            job.repository.defer_pushes = job.defer_pushes
+            job.defer_pushes = None
+
+    pipelined_jobs: List[_PipelinedJob] = []
+
+    def take_jobs() -> Iterator[_PipelinedJob]:
+        for repository, synchronisables in jobs:
+            resolve_subrepo_commits(synchronisables, resolved=resolved)
+            pipelined_jobs.append(_PipelinedJob(repository, synchronisables))
+            yield pipelined_jobs[-1]
 
-    return synchronised
+    Pipeline([Stage("checkout", stages.checkout_workers, check_out),
+              Stage("synchronise", stages.synchronise_workers, apply),
+              Stage("push", stages.push_workers, push)], queue_size=stages.queue_size).run(take_jobs(), on_error)
+    return [job.result for job in pipelined_jobs]
+
+
+def _synchronise_scheduled(
+        jobs: List[Tuple[GitRepository, List[Synchronisable]]],
+        synchronise_repository: Callable[[Tuple[GitRepository, List[Synchronisable]]], RepositorySynchronisationResult],
+        parallelism: int, scheduler: HostScheduler, stop: Event=None) -> List[RepositorySynchronisationResult]:
+    """
+    Synchronises the given repositories in the order given by the scheduler, without exceeding any host's concurrency
+    limit, and records how long each successful synchronisation took.
+    :param jobs: the repositories and the synchronisations to apply to them
+    :param synchronise_repository: synchronises the repository of the given job
+    :param parallelism: the maximum number of repositories to synchronise at the same time
+    :param scheduler: the scheduler
+    :param stop: optional event that, once set, stops any more repositories from being started
+    :return: the result of synchronising each repository that was started, in the order in which the jobs were given
+    """
+    def timed_synchronise_repository(job: Tuple[GitRepository, List[Synchronisable]]) \
+            -> RepositorySynchronisationResult:
+        result = synchronise_repository(job)
+        if result.succeeded:
+            scheduler.record_duration(job[0].remote, job[0].branch, result.duration)
+        return result
+
+    pending = scheduler.get_order([repository for repository, _ in jobs])
+    results: List[Optional[RepositorySynchronisationResult]] = [None] * len(jobs)
+    in_progress: Dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while len(pending) > 0 or len(in_progress) > 0:
+            if stop is not None and stop.is_set():
+                pending.clear()
+            # Takes the first jobs (in scheduled order) whose hosts have capacity
+            position = 0
+            while len(in_progress) < parallelism and position < len(pending):
+                index = pending[position]
+                if scheduler.try_acquire(jobs[index][0].remote):
+                    del pending[position]
+                    in_progress[executor.submit(timed_synchronise_repository, jobs[index])] = index
+                else:
+                    position += 1
+
+            if len(in_progress) == 0:
+                if len(pending) > 0:
+                    # The hosts' slots are all taken by other users of the scheduler
+                    scheduler.wait_for_release(_SCHEDULER_WAIT_TIMEOUT)
+                continue
+            completed, _ = wait(in_progress.keys(), return_when=FIRST_COMPLETED)
+            for future in completed:
+                index = in_progress.pop(future)
+                scheduler.release(jobs[index][0].remote)
+                results[index] = future.result()
+    return [result for result in results if result is not None]
+
+
+def _take_jobs_until(jobs: Iterable[Tuple[GitRepository, List[Synchronisable]]], stop: Event) \
+        -> Iterator[Tuple[GitRepository, List[Synchronisable]]]:
+    """
+    Takes the given jobs until the given event is set.
+    :param jobs: the jobs
+    :param stop: the event
+    :return: iterator of the jobs taken
+    """
+    for job in jobs:
+        if stop.is_set():
+            return
+        yield job
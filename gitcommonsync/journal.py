@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+from threading import Lock
+from typing import Optional, Dict, Tuple, Any
+
+from gitcommonsync.repository import GitRepository
+
+_logger = logging.getLogger(__name__)
+
+NEW_RUN_PHASE = "run"
+STARTED_PHASE = "started"
+PUSHED_PHASE = "pushed"
+COMPLETED_PHASE = "completed"
+FAILED_PHASE = "failed"
+
+
+class JournalEntry:
+    """
+    Latest phase reached in synchronising a repository, as recorded in a journal.
+    """
+    def __init__(self, phase: str, fingerprint: Optional[str], commit: str=None):
+        """
+        Constructor.
+        :param phase: the phase reached
+        :param fingerprint: fingerprint of the synchronisations being applied (see `state.get_fingerprint`)
+        :param commit: the (full) ID of the commit pushed, if any
+        """
+        self.phase = phase
+        self.fingerprint = fingerprint
+        self.commit = commit
+
+
+class Journal:
+    """
+    Append-only journal of the progress of a multi-repository run, which allows an interrupted run to be resumed.
+
+    Each line is a JSON record of the phase that a repository has reached. A run that is not resumed starts a new run in
+    the journal; a resumed run takes into account the records since the start of the last run, so it can be resumed
+    repeatedly. Records are flushed to disk as they are written, so they survive the process being killed.
+    """
+    def __init__(self, location: str, resume: bool=False):
+        """
+        Constructor.
+        :param location: location of the journal, which is created if it does not exist
+        :param resume: whether to resume the last run recorded in the journal, rather than starting a new run
+        """
+        self.location = location
+        self._entries: Dict[Tuple[str, str], JournalEntry] = {}
+        self._lock = Lock()
+        if resume and os.path.exists(location):
+            self._load()
+        terminated = not os.path.exists(location) or _ends_with_newline(location)
+        self._file = open(location, "a")
+        if not terminated:
+            # Terminates a record that was partially written when the run was interrupted
+            self._file.write("\n")
+        if not resume:
+            self._write({"phase": NEW_RUN_PHASE})
+
+    def close(self):
+        """
+        Closes the journal.
+        """
+        with self._lock:
+            self._file.close()
+
+    def get(self, remote: str, branch: str) -> Optional[JournalEntry]:
+        """
+        Gets the latest phase reached in synchronising the given repository branch in the current run.
+        :param remote: url of the repository's remote
+        :param branch: the branch of the repository
+        :return: the entry or `None` if the repository has not been started in the current run
+        """
+        with self._lock:
+            return self._entries.get((remote, branch))
+
+    def record(self, remote: str, branch: str, phase: str, fingerprint: str=None, commit: str=None):
+        """
+        Records the phase reached in synchronising the given repository branch.
+        :param remote: url of the repository's remote
+        :param branch: the branch of the repository
+        :param phase: the phase reached
+        :param fingerprint: fingerprint of the synchronisations being applied. If `None`, that of the last record of the
+        repository is used
+        :param commit: the (full) ID of the commit pushed, if any
+        """
+        with self._lock:
+            if fingerprint is None and (remote, branch) in self._entries:
+                fingerprint = self._entries[(remote, branch)].fingerprint
+            self._entries[(remote, branch)] = JournalEntry(phase, fingerprint, commit)
+            self._write(
+                {"remote": remote, "branch": branch, "phase": phase, "fingerprint": fingerprint, "commit": commit})
+
+    def is_completed(self, repository: GitRepository, fingerprint: str) -> bool:
+        """
+        Whether the given repository has already been synchronised with the synchronisations of the given fingerprint in
+        the current run.
+
+        A repository whose changes were pushed before the run was interrupted (but not recorded as completed) is
+        completed only if the head of the branch on the remote is still the commit that was pushed.
+        :param repository: the repository
+        :param fingerprint: fingerprint of the synchronisations to apply
+        :return: whether the repository does not need to be synchronised again
+        """
+        entry = self.get(repository.remote, repository.branch)
+        if entry is None or entry.fingerprint != fingerprint:
+            return False
+        if entry.phase == COMPLETED_PHASE:
+            return True
+        if entry.phase == PUSHED_PHASE and entry.commit is not None and repository.get_remote_head() == entry.commit:
+            _logger.info(f"Changes to {repository.remote} ({repository.branch}) were pushed before the run was "
+                         f"interrupted")
+            self.record(repository.remote, repository.branch, COMPLETED_PHASE, fingerprint, entry.commit)
+            return True
+        return False
+
+    def _load(self):
+        """
+        Loads the records of the last run in the journal.
+        """
+        with open(self.location, "r") as file:
+            for line in file:
+                try:
+                    record: Dict[str, Any] = json.loads(line)
+                except ValueError:
+                    # The last record may have only been partially written
+                    _logger.warning(f"Ignoring invalid journal record: {line!r}")
+                    continue
+                if record["phase"] == NEW_RUN_PHASE:
+                    self._entries.clear()
+                else:
+                    self._entries[(record["remote"], record["branch"])] = JournalEntry(
+                        record["phase"], record["fingerprint"], record["commit"])
+
+    def _write(self, record: Dict[str, Any]):
+        """
+        Appends the given record to the journal, flushing it to disk.
+        :param record: the record
+        """
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def _ends_with_newline(location: str) -> bool:
+    """
+    Whether the file at the given location is empty or ends with a new line.
+    :param location: location of the file
+    :return: whether the file ends with a new line
+    """
+    with open(location, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell() == 0:
+            return True
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
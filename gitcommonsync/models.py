@@ -1,19 +1,43 @@
-from abc import ABCMeta
-from typing import Dict
+from abc import ABCMeta, abstractmethod
+from typing import Dict, Any, Tuple, Sequence
 
+from gitcommonsync._common import intern
+from gitcommonsync.filters import PathFilter
 from gitcommonsync.repository import GitCheckout
 
 
 class Synchronisation(metaclass=ABCMeta):
     """
     Synchronisation configuration.
+
+    Synchronisations are compact (slotted) and hashable, so must not be changed whilst in a set (or used as a dictionary
+    key).
     """
+    __slots__ = ()
+
+    @abstractmethod
+    def _get_key(self) -> Tuple:
+        """
+        Gets the values that identify this synchronisation.
+        :return: the values
+        """
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and other._get_key() == self._get_key()
+
+    def __hash__(self) -> int:
+        return hash(self._get_key())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}{self._get_key()!r}"
 
 
 class SubrepoSynchronisation(Synchronisation):
     """
     Subrepo synchronisation configuration.
     """
+    __slots__ = ("checkout", "overwrite")
+
     @property
     def destination(self) -> str:
         return self.checkout.directory
@@ -22,21 +46,60 @@ class SubrepoSynchronisation(Synchronisation):
         self.checkout = checkout
         self.overwrite = overwrite
 
+    def _get_key(self) -> Tuple:
+        return self.checkout, self.overwrite
+
 
 class FileSynchronisation(Synchronisation):
     """
     File synchronisation configuration.
+
+    The include and exclude patterns apply to the contents of a directory source (see `filters.PathFilter`).
     """
-    def __init__(self, source: str, destination: str, overwrite: bool=False):
-        self.source = source
-        self.destination = destination
+    __slots__ = ("source", "destination", "overwrite", "include", "exclude")
+
+    @property
+    def path_filter(self) -> PathFilter:
+        return PathFilter(self.include, self.exclude)
+
+    def __init__(self, source: str, destination: str, overwrite: bool=False, include: Sequence[str]=(),
+                 exclude: Sequence[str]=()):
+        self.source = intern(source)
+        self.destination = intern(destination)
         self.overwrite = overwrite
+        self.include = tuple(intern(pattern) for pattern in include)
+        self.exclude = tuple(intern(pattern) for pattern in exclude)
+
+    def _get_key(self) -> Tuple:
+        return self.source, self.destination, self.overwrite, self.include, self.exclude
 
 
 class TemplateSynchronisation(FileSynchronisation):
     """
     Template synchronisation configuration.
+
+    The variables may be shared with other synchronisations, so must not be changed.
     """
+    __slots__ = ("variables",)
+
     def __init__(self, source: str, destination: str, variables: Dict[str, str], overwrite: bool=False):
         super().__init__(source, destination, overwrite=overwrite)
         self.variables = variables
+
+    def _get_key(self) -> Tuple:
+        return super()._get_key() + (_freeze(self.variables),)
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Converts the given value (e.g. template variables) into an equivalent hashable value.
+    :param value: the value to convert
+    :return: the hashable value
+    """
+    if isinstance(value, dict):
+        return tuple(sorted(((key, _freeze(item)) for key, item in value.items()), key=lambda pair: repr(pair[0])))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    return value
@@ -0,0 +1,103 @@
+import logging
+from queue import Queue
+from threading import Thread, Lock
+from typing import Callable, Generic, Iterable, List, TypeVar
+
+_logger = logging.getLogger(__name__)
+
+Item = TypeVar("Item")
+
+DEFAULT_QUEUE_SIZE = 1
+
+# Put on a stage's queue (once for each of its workers) when no more items will be put on it
+_END = object()
+
+
+class Stage(Generic[Item]):
+    """
+    Stage of a pipeline, in which items are processed by a pool of workers.
+    """
+    def __init__(self, name: str, workers: int, process: Callable[[Item], bool]):
+        """
+        Constructor.
+        :param name: name of the stage (used in the names of its worker threads)
+        :param workers: the number of items to process at the same time
+        :param process: processes an item, returning whether it is to be passed on to the next stage
+        """
+        if workers < 1:
+            raise ValueError(f"A stage must have at least 1 worker: {workers}")
+        self.name = name
+        self.workers = workers
+        self.process = process
+
+
+class Pipeline(Generic[Item]):
+    """
+    Pipeline of stages connected by bounded queues, so that different items can be in different stages at the same
+    time (e.g. one repository cloned whilst another is synchronised and another pushed).
+
+    A stage whose output queue is full blocks until the next stage takes an item, so items do not pile up between
+    stages: there are at most `workers + queue_size` items in (or waiting for) each stage. The items given are also only
+    taken as the first stage can accept them.
+    """
+    def __init__(self, stages: List[Stage[Item]], queue_size: int=DEFAULT_QUEUE_SIZE):
+        """
+        Constructor.
+        :param stages: the stages, in order
+        :param queue_size: the maximum number of items waiting for each stage
+        """
+        if len(stages) == 0:
+            raise ValueError("A pipeline must have at least one stage")
+        if queue_size < 1:
+            raise ValueError(f"Queue size must be at least 1: {queue_size}")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items: Iterable[Item], on_error: Callable[[Item, Exception], None]):
+        """
+        Passes the given items through the stages of the pipeline, blocking until all have been processed.
+
+        An item whose processing raises an exception is not passed on to the next stage: the exception is instead given
+        to the error handler.
+        :param items: the items
+        :param on_error: handler of an exception raised whilst processing an item, called with the item and exception
+        (it must not raise itself)
+        :raises Exception: any exception raised by iterating the items (once the items already taken are processed)
+        """
+        queues: List[Queue] = [Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining_workers = [stage.workers for stage in self.stages]
+        lock = Lock()
+
+        def work(index: int):
+            stage = self.stages[index]
+            while True:
+                item = queues[index].get()
+                if item is _END:
+                    break
+                try:
+                    passed_on = stage.process(item)
+                except Exception as e:
+                    _logger.debug(f"Error in {stage.name} stage: {e}")
+                    on_error(item, e)
+                    continue
+                if passed_on and index + 1 < len(self.stages):
+                    queues[index + 1].put(item)
+            with lock:
+                remaining_workers[index] -= 1
+                last = remaining_workers[index] == 0
+            if last and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_END)
+
+        threads = [Thread(target=work, args=(index,), name=f"{stage.name}-{worker}", daemon=True)
+                   for index, stage in enumerate(self.stages) for worker in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_END)
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,229 @@
+import logging
+import os
+from typing import List, Tuple, Type, Dict, FrozenSet, Iterable
+
+from gitcommonsync._common import get_size
+from gitcommonsync.models import Synchronisation, SubrepoSynchronisation, FileSynchronisation, \
+    TemplateSynchronisation
+from gitcommonsync.synchronisers import Synchroniser, SubrepoSynchroniser, FileSynchroniser, TemplateSynchroniser
+
+_logger = logging.getLogger(__name__)
+
+# Subrepos are checked out first, as `git subrepo` requires a clean working tree (file based synchronisations are not
+# committed on a dry run)
+PHASES: List[Tuple[Type[Synchronisation], Type[Synchroniser]]] = [
+    (SubrepoSynchronisation, SubrepoSynchroniser),
+    (FileSynchronisation, FileSynchroniser),
+    (TemplateSynchronisation, TemplateSynchroniser)
+]
+
+
+class PlanConflictError(ValueError):
+    """
+    Raised if synchronisations cannot be planned because they write to the same (or overlapping) destinations.
+    """
+    def __init__(self, conflicts: List[Tuple[Synchronisation, Synchronisation]]):
+        """
+        Constructor.
+        :param conflicts: pairs of synchronisations whose destinations conflict
+        """
+        super().__init__("Conflicting synchronisation destinations: " + "; ".join(
+            f"{first.destination} ({type(first).__name__}) and {second.destination} ({type(second).__name__})"
+            for first, second in conflicts))
+        self.conflicts = conflicts
+
+
+class PlanStep:
+    """
+    Step of a synchronisation plan, which applies a single synchronisation.
+    """
+    __slots__ = ("synchronisation", "synchroniser_type", "dependencies")
+
+    def __init__(self, synchronisation: Synchronisation, synchroniser_type: Type[Synchroniser],
+                 dependencies: FrozenSet["PlanStep"]=frozenset()):
+        """
+        Constructor.
+        :param synchronisation: the synchronisation that the step applies
+        :param synchroniser_type: the type of synchroniser that applies the synchronisation
+        :param dependencies: the steps that must be completed before this step
+        """
+        self.synchronisation = synchronisation
+        self.synchroniser_type = synchroniser_type
+        self.dependencies = dependencies
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.synchronisation!r})"
+
+
+class PlanCost:
+    """
+    Estimated cost of executing a synchronisation plan.
+    """
+    def __init__(self, steps: int, subrepo_fetches: int, source_bytes: int, max_commits: int):
+        """
+        Constructor.
+        :param steps: number of steps
+        :param subrepo_fetches: number of subrepos that are to be fetched from their remotes
+        :param source_bytes: total size of the (local) sources of the file based synchronisations
+        :param max_commits: the most commits that could be made (if every step makes a change)
+        """
+        self.steps = steps
+        self.subrepo_fetches = subrepo_fetches
+        self.source_bytes = source_bytes
+        self.max_commits = max_commits
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(steps={self.steps}, subrepo_fetches={self.subrepo_fetches}, " \
+               f"source_bytes={self.source_bytes}, max_commits={self.max_commits})"
+
+
+class SynchronisationPlan:
+    """
+    Validated, deduplicated and ordered plan of the synchronisations to apply to a repository.
+
+    The plan is a DAG of steps, in which each step depends on the steps of the previous phase (subrepos, then
+    files and directories, then templates). The destinations of different steps never overlap, so no step rewrites the
+    output of another.
+    """
+    @property
+    def synchronisations(self) -> List[Synchronisation]:
+        return [step.synchronisation for step in self.steps]
+
+    def __init__(self, steps: List[PlanStep], duplicates: int=0):
+        """
+        Constructor.
+        :param steps: the steps, in an order that satisfies their dependencies
+        :param duplicates: the number of duplicate synchronisations that were removed
+        """
+        self.steps = steps
+        self.duplicates = duplicates
+
+    def get_batches(self) -> List[Tuple[Type[Synchroniser], List[Synchronisation]]]:
+        """
+        Gets the synchronisations to give to each synchroniser, in the order in which the synchronisers are to be run.
+        :return: tuples where the first element is the type of synchroniser and the second is its synchronisations
+        """
+        batches: List[Tuple[Type[Synchroniser], List[Synchronisation]]] = []
+        for step in self.steps:
+            if len(batches) == 0 or batches[-1][0] != step.synchroniser_type:
+                batches.append((step.synchroniser_type, []))
+            batches[-1][1].append(step.synchronisation)
+        return batches
+
+    def estimate_cost(self) -> PlanCost:
+        """
+        Estimates the cost of executing the plan, without checking out the repository or fetching any subrepo.
+        :return: the estimated cost
+        """
+        subrepos = [step for step in self.steps if isinstance(step.synchronisation, SubrepoSynchronisation)]
+        source_bytes = 0
+        for step in self.steps:
+            if isinstance(step.synchronisation, FileSynchronisation):
+                source = step.synchronisation.source
+                if os.path.isdir(source):
+                    source_bytes += get_size(source)
+                elif os.path.exists(source):
+                    source_bytes += os.path.getsize(source)
+        # Each subrepo is committed separately, whereas file based synchronisers commit once
+        file_based_batches = len([batch for batch in self.get_batches() if batch[0] != SubrepoSynchroniser])
+        subrepo_fetches = len({(step.synchronisation.checkout.url, step.synchronisation.checkout.branch)
+                               for step in subrepos})
+        return PlanCost(len(self.steps), subrepo_fetches, source_bytes, len(subrepos) + file_based_batches)
+
+
+def create_plan(synchronisations: Iterable[Synchronisation]) -> SynchronisationPlan:
+    """
+    Compiles the given synchronisations into a plan.
+
+    Identical synchronisations are applied once. Synchronisations with the same destination, or where the destination
+    of one is inside that of another (e.g. a file synchronised into a subrepo or a synchronised directory), conflict.
+    Within a phase, directories are synchronised before files and the given order is otherwise kept.
+    :param synchronisations: the synchronisations to plan
+    :return: the plan
+    :raises PlanConflictError: if any of the synchronisations conflict
+    """
+    supported_types = {synchronisation_type for synchronisation_type, _ in PHASES}
+    unique: Dict[Synchronisation, None] = {}
+    given = 0
+    for synchronisation in synchronisations:
+        given += 1
+        if type(synchronisation) not in supported_types:
+            raise TypeError(f"Unsupported synchronisation: {synchronisation!r}")
+        unique.setdefault(synchronisation, None)
+    if given > len(unique):
+        _logger.info(f"Removed {given - len(unique)} duplicate synchronisation(s)")
+
+    conflicts = _find_conflicts(list(unique.keys()))
+    if len(conflicts) > 0:
+        raise PlanConflictError(conflicts)
+
+    steps: List[PlanStep] = []
+    dependencies: FrozenSet[PlanStep] = frozenset()
+    for synchronisation_type, synchroniser_type in PHASES:
+        phase = [synchronisation for synchronisation in unique.keys() if type(synchronisation) is synchronisation_type]
+        if synchronisation_type is FileSynchronisation:
+            # Stable, so the given order is otherwise kept
+            phase.sort(key=lambda synchronisation: not os.path.isdir(synchronisation.source))
+        phase_steps = [PlanStep(synchronisation, synchroniser_type, dependencies) for synchronisation in phase]
+        steps.extend(phase_steps)
+        if len(phase_steps) > 0:
+            dependencies = frozenset(phase_steps)
+
+    return SynchronisationPlan(steps, duplicates=given - len(unique))
+
+
+def _find_conflicts(synchronisations: List[Synchronisation]) -> List[Tuple[Synchronisation, Synchronisation]]:
+    """
+    Finds the pairs of the given (distinct) synchronisations whose destinations are the same or overlap.
+    :param synchronisations: the synchronisations
+    :return: the conflicting pairs
+    """
+    # Sorted by path components, so a destination is followed by those inside of it
+    destinations = sorted(((_split_path(_get_effective_destination(synchronisation)), synchronisation)
+                           for synchronisation in synchronisations), key=lambda item: item[0])
+    conflicts: List[Tuple[Synchronisation, Synchronisation]] = []
+    open_destinations: List[Tuple[Tuple[str, ...], Synchronisation]] = []
+    for components, synchronisation in destinations:
+        while len(open_destinations) > 0 and \
+                open_destinations[-1][0] != components[0:len(open_destinations[-1][0])]:
+            open_destinations.pop()
+        conflicts.extend((containing, synchronisation) for containing_components, containing in open_destinations
+                         if not _is_filtered_out(containing, components[len(containing_components):]))
+        open_destinations.append((components, synchronisation))
+    return conflicts
+
+
+def _is_filtered_out(synchronisation: Synchronisation, components: Tuple[str, ...]) -> bool:
+    """
+    Whether the given path inside the destination of the given synchronisation is excluded from it, so that another
+    synchronisation can write to it.
+    :param synchronisation: the synchronisation
+    :param components: components of the path, relative to the effective destination of the synchronisation
+    :return: whether the path is excluded
+    """
+    if not isinstance(synchronisation, FileSynchronisation) or len(synchronisation.exclude) == 0:
+        return False
+    return len(components) > 0 and synchronisation.path_filter.is_path_excluded("/".join(components))
+
+
+def _get_effective_destination(synchronisation: Synchronisation) -> str:
+    """
+    Gets the path that the given synchronisation writes to, following the rules of `copying.synchronise_path`.
+    :param synchronisation: the synchronisation
+    :return: the path, relative to the root of the repository
+    """
+    if isinstance(synchronisation, FileSynchronisation) and not synchronisation.source.endswith(os.sep) \
+            and os.path.isdir(synchronisation.source):
+        # A directory source is synchronised into a directory of the same name inside the destination
+        return os.path.join(synchronisation.destination, os.path.basename(synchronisation.source))
+    return synchronisation.destination
+
+
+def _split_path(path: str) -> Tuple[str, ...]:
+    """
+    Splits the given path, relative to the root of a repository, into its components.
+    :param path: the path
+    :return: the components (empty for the root of the repository)
+    """
+    normalised = os.path.normpath(path)
+    return tuple(component for component in normalised.split(os.sep) if component not in ("", "."))
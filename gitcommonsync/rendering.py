@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, Optional, Any
+
+from gitcommonsync.blobs import get_blob_id, get_content_blob_id
+
+_logger = logging.getLogger(__name__)
+
+# Changed whenever the way templates are rendered changes, so that renders cached by earlier versions are not used
+RENDERER_VERSION = 2
+
+DEFAULT_RENDER_CACHE_SIZE = 64 * 1024 * 1024
+
+# Ansible templates any variable value that contains one of these (as it would a template)
+_TEMPLATE_START_STRINGS = ("{{", "{%", "{#")
+# Ansible overrides the Jinja2 environment with a first line that starts with this
+_OVERRIDE_HEADER = "#jinja2:"
+
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS renders (
+        key TEXT NOT NULL PRIMARY KEY,
+        blob_id TEXT NOT NULL,
+        content BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    )
+"""
+_CREATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS renders_last_used ON renders (last_used)"
+_SELECT_SQL = "SELECT blob_id, content FROM renders WHERE key = ?"
+_TOUCH_SQL = "UPDATE renders SET last_used = ? WHERE key = ?"
+_UPSERT_SQL = "INSERT OR REPLACE INTO renders (key, blob_id, content, size, last_used) VALUES (?, ?, ?, ?, ?)"
+_TOTAL_SIZE_SQL = "SELECT COALESCE(SUM(size), 0) FROM renders"
+_LEAST_RECENTLY_USED_SQL = "SELECT key, size FROM renders ORDER BY last_used"
+_DELETE_SQL = "DELETE FROM renders WHERE key = ?"
+
+
+class RenderedTemplate:
+    """
+    Output of rendering a template.
+    """
+    __slots__ = ("content", "blob_id")
+
+    def __init__(self, content: bytes, blob_id: str=None):
+        """
+        Constructor.
+        :param content: the rendered content
+        :param blob_id: the (SHA-1) git blob ID of the content, which is calculated if not given
+        """
+        self.content = content
+        self.blob_id = blob_id if blob_id is not None else get_content_blob_id(content)
+
+
+class RenderCache:
+    """
+    Persistent cache, backed by SQLite, of the output of rendering templates with given variables.
+
+    Renders are keyed by the content of the template, the variables and the renderer version, so a cached render is
+    used until any of them change. The least recently used renders are evicted once the cache exceeds its maximum size.
+    Connections are made for each operation so that the cache can be shared between threads and processes.
+    """
+    def __init__(self, location: str, max_size: int=DEFAULT_RENDER_CACHE_SIZE):
+        """
+        Constructor.
+        :param location: location of the SQLite database, which is created if it does not exist
+        :param max_size: maximum total size (in bytes) of the rendered content to keep
+        """
+        self.location = location
+        self.max_size = max_size
+        with closing(self._connect()) as connection, connection:
+            connection.execute(_CREATE_TABLE_SQL)
+            connection.execute(_CREATE_INDEX_SQL)
+
+    def render(self, location: str, variables: Dict[str, Any]) -> Optional[RenderedTemplate]:
+        """
+        Renders the given template (see `render_template`), using the cached render if the template and variables are
+        unchanged.
+        :param location: location of the template
+        :param variables: the template variables
+        :return: the render or `None` if the template could not be rendered without Ansible
+        """
+        key = get_render_key(location, variables)
+        rendered = self.get(key)
+        if rendered is None:
+            content = render_template(location, variables)
+            if content is None:
+                return None
+            rendered = RenderedTemplate(content)
+            self.set(key, rendered)
+        return rendered
+
+    def get(self, key: str) -> Optional[RenderedTemplate]:
+        """
+        Gets the render with the given key.
+        :param key: the key (see `get_render_key`)
+        :return: the render or `None` if not cached
+        """
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute(_SELECT_SQL, (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(_TOUCH_SQL, (time.time(), key))
+        blob_id, content = row
+        return RenderedTemplate(bytes(content), blob_id)
+
+    def set(self, key: str, rendered: RenderedTemplate):
+        """
+        Caches the given render, evicting the least recently used renders if the cache is then too large.
+        :param key: the key (see `get_render_key`)
+        :param rendered: the render
+        """
+        if len(rendered.content) > self.max_size:
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute(_UPSERT_SQL, (key, rendered.blob_id, rendered.content, len(rendered.content),
+                                             time.time()))
+            excess = connection.execute(_TOTAL_SIZE_SQL).fetchone()[0] - self.max_size
+            if excess > 0:
+                for evicted_key, size in connection.execute(_LEAST_RECENTLY_USED_SQL).fetchall():
+                    if excess <= 0:
+                        break
+                    connection.execute(_DELETE_SQL, (evicted_key,))
+                    excess -= size
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Connects to the database.
+        :return: the database connection
+        """
+        return sqlite3.connect(self.location, timeout=60)
+
+
+def get_render_key(location: str, variables: Dict[str, Any]) -> str:
+    """
+    Gets the key of the render of the given template with the given variables.
+    :param location: location of the template
+    :param variables: the template variables
+    :return: the key
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"{RENDERER_VERSION}\0{_get_jinja2_version()}\0".encode())
+    hasher.update(get_blob_id(location).encode() + b"\0")
+    hasher.update(json.dumps(variables, sort_keys=True, default=repr).encode())
+    return hasher.hexdigest()
+
+
+def render_template(location: str, variables: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Renders the given template with Jinja2, as Ansible's template module would.
+
+    Only templates that are rendered the same by Jinja2 and Ansible are rendered, so not those that use Ansible specific
+    filters, lookups or variables, that override the Jinja2 environment, or whose variables contain templates (which
+    Ansible renders recursively).
+    :param location: location of the template
+    :param variables: the template variables
+    :return: the rendered content or `None` if the template could not be rendered without Ansible
+    """
+    try:
+        from jinja2 import Environment, StrictUndefined, TemplateError
+    except ImportError:
+        return None
+
+    if _contains_template(variables):
+        _logger.debug(f"Cannot render template {location} without Ansible: variables contain templates")
+        return None
+
+    environment = Environment(trim_blocks=True, keep_trailing_newline=True, undefined=StrictUndefined)
+    try:
+        with open(location, "r", encoding="utf-8") as file:
+            source = file.read()
+        if source.startswith(_OVERRIDE_HEADER):
+            _logger.debug(f"Cannot render template {location} without Ansible: overrides the Jinja2 environment")
+            return None
+        return environment.from_string(source).render(variables).encode("utf-8")
+    except (TemplateError, ValueError, TypeError) as e:
+        _logger.debug(f"Cannot render template {location} without Ansible: {e}")
+        return None
+
+
+def _contains_template(value: Any) -> bool:
+    """
+    Whether the given variable value contains a template, at any depth.
+    :param value: the value
+    :return: whether a template is contained
+    """
+    if isinstance(value, str):
+        return any(start in value for start in _TEMPLATE_START_STRINGS)
+    if isinstance(value, dict):
+        return any(_contains_template(key) or _contains_template(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return any(_contains_template(item) for item in value)
+    return False
+
+
+def _get_jinja2_version() -> Optional[str]:
+    """
+    Gets the version of Jinja2 that templates are rendered with.
+    :return: the version or `None` if Jinja2 is not installed
+    """
+    try:
+        import jinja2
+    except ImportError:
+        return None
+    return jinja2.__version__
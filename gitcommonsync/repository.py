@@ -2,9 +2,18 @@ import os
 import shutil
 from tempfile import mkdtemp
 
-from typing import List, Callable, Any
+from typing import List, Callable, Any, Optional, TYPE_CHECKING
 
-from git import Repo, GitCommandError, IndexFile, Actor
+from gitcommonsync._common import get_remote_head_commit, get_size, intern
+from gitcommonsync.session import GitSession
+
+# Note: GitPython is imported when it is first used, as it is slow to import (it runs `git` on import)
+if TYPE_CHECKING:
+    from git import IndexFile, Repo
+    from gitcommonsync.scheduling import HostScheduler
+    from gitcommonsync.scratch import ScratchSpacePolicy, ScratchSpace
+    from gitcommonsync.ssh import SshMultiplexer
+    from gitcommonsync.worktrees import WorktreePool
 
 DEFAULT_BRANCH = "master"
 SSH_COMMAND = "ssh"
@@ -26,11 +35,15 @@ def requires_checkout(func):
 class GitCheckout:
     """
     Git checkout.
+
+    Hashable, so must not be changed whilst in a set (or used as a dictionary key).
     """
+    __slots__ = ("url", "branch", "directory", "commit")
+
     def __init__(self, url: str, branch: str, directory: str, *, commit: str=None):
-        self.url = url
-        self.branch = branch
-        self.directory = directory
+        self.url = intern(url)
+        self.branch = intern(branch)
+        self.directory = intern(directory)
         self.commit = commit
 
     def __eq__(self, other: Any) -> bool:
@@ -40,6 +53,12 @@ class GitCheckout:
                and other.commit == self.commit \
                and other.directory == self.directory
 
+    def __hash__(self) -> int:
+        return hash((self.url, self.branch, self.directory, self.commit))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.url!r}, {self.branch!r}, {self.directory!r}, commit={self.commit!r})"
+
 
 class GitRepository:
     """
@@ -49,7 +68,8 @@ class GitRepository:
 
     def __init__(self, remote: str, branch: str, *, checkout_location: str=None,
                  author_name: str=None, author_email: str=None, private_key_file: str=None, create_branch: bool=True,
-                 host_key_checking: bool=True):
+                 host_key_checking: bool=True, worktree_pool: "WorktreePool"=None,
+                 ssh_multiplexer: "SshMultiplexer"=None, scheduler: "HostScheduler"=None, defer_pushes: bool=False):
         """
         Constructor.
         :param remote: url of the remote which this repository tracks
@@ -61,6 +81,14 @@ class GitRepository:
         :param private_key_file: the private key to use when cloning the repository
         :param create_branch: whether the branch should be created if it does not exist
         :param host_key_checking: `False` for -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no
+        :param worktree_pool: optional pool of working trees to check out the repository from (and release to on tear
+        down), instead of cloning into a new directory
+        :param ssh_multiplexer: optional manager of SSH master connections, shared with other repositories, which is
+        used to avoid making a new SSH connection for each git operation
+        :param scheduler: optional scheduler, shared with other repositories, that limits the rate of the git operations
+        made against the remote's host
+        :param defer_pushes: whether pushes are deferred until `push_deferred` is called (e.g. so that they are made in
+        a separate stage of a pipeline), rather than made immediately
         """
         self.remote = remote
         self.branch = branch
@@ -70,51 +98,162 @@ class GitRepository:
         self.private_key_file = private_key_file
         self.create_branch = create_branch
         self.host_key_checking = host_key_checking
+        self.worktree_pool = worktree_pool
+        self.ssh_multiplexer = ssh_multiplexer
+        self.scheduler = scheduler
+        self.defer_pushes = defer_pushes
+        self._push_pending = False
+        self._session: Optional[GitSession] = None
+        self._scratch_space: Optional["ScratchSpace"] = None
+        self._scratch_space_policy: Optional["ScratchSpacePolicy"] = None
 
     def tear_down(self):
         """
         Tears down any repository files on the local machine.
         """
-        if self.checkout_location is not None and os.path.exists(self.checkout_location):
+        # Changes that have not been pushed are discarded with the checkout
+        self._push_pending = False
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        if self.checkout_location is not None and self.worktree_pool is not None:
+            self.worktree_pool.release(self.checkout_location, self.remote, self.branch)
+            self.checkout_location = None
+        elif self.checkout_location is not None and self._scratch_space is not None:
+            size = get_size(self.checkout_location) if os.path.exists(self.checkout_location) else None
+            shutil.rmtree(self.checkout_location, ignore_errors=True)
+            self._scratch_space_policy.release(self._scratch_space, self.remote, size)
+            self._scratch_space = None
+            self._scratch_space_policy = None
+            self.checkout_location = None
+        elif self.checkout_location is not None and os.path.exists(self.checkout_location):
             shutil.rmtree(self.checkout_location)
             self.checkout_location = None
 
-    def checkout(self, parent_directory: str=None) -> str:
+    def checkout(self, parent_directory: str=None, scratch_space_policy: "ScratchSpacePolicy"=None) -> str:
         """
         Checks out the repository into the given parent directory or temporary directory if not given.
         :param parent_directory: optional parent directory in which the repository is checked out into (in a
         sub-directory)
+        :param scratch_space_policy: optional policy that decides where to check out the repository (e.g. in memory if
+        it is small). Cannot be used with a parent directory or worktree pool
         :return: the checkout directory
         """
         if self.checkout_location is not None:
             raise IsADirectoryError(f"Repository already checked out in {self.checkout_location}")
+        if scratch_space_policy is not None and (parent_directory is not None or self.worktree_pool is not None):
+            raise ValueError("Scratch space policy cannot be used with a parent directory or worktree pool")
 
-        checkout_location = mkdtemp(dir=parent_directory)
-        try:
-            repository = Repo.clone_from(
-                url=self.remote, to_path=checkout_location, env={"GIT_SSH_COMMAND": self._get_ssh_command()})
-        except Exception as e:
-            if os.path.exists(checkout_location):
-                os.removedirs(checkout_location)
-            raise e
+        from git import Repo
+
+        environment = {"GIT_SSH_COMMAND": self._get_ssh_command()}
+        if self.scheduler is not None:
+            self.scheduler.wait_to_fetch(self.remote)
+        if self.worktree_pool is not None:
+            if parent_directory is not None:
+                raise ValueError("Parent directory cannot be given when checking out from a worktree pool")
+            checkout_location, reused = self.worktree_pool.acquire(self.remote, self.branch, environment)
+            repository = Repo(checkout_location)
+        elif scratch_space_policy is not None:
+            scratch_space = scratch_space_policy.reserve(self.remote)
+            try:
+                Repo.clone_from(url=self.remote, to_path=scratch_space.directory, env=environment)
+                if not scratch_space_policy.resize(scratch_space, get_size(scratch_space.directory)):
+                    scratch_space = scratch_space_policy.spill(scratch_space)
+            except Exception as e:
+                shutil.rmtree(scratch_space.directory, ignore_errors=True)
+                scratch_space_policy.release(scratch_space)
+                raise e
+            self._scratch_space = scratch_space
+            self._scratch_space_policy = scratch_space_policy
+            checkout_location = scratch_space.directory
+            repository = Repo(checkout_location)
+            reused = False
+        else:
+            checkout_location = mkdtemp(dir=parent_directory)
+            try:
+                repository = Repo.clone_from(url=self.remote, to_path=checkout_location, env=environment)
+            except Exception as e:
+                if os.path.exists(checkout_location):
+                    os.removedirs(checkout_location)
+                raise e
+            reused = False
         self.checkout_location = checkout_location
+        self._session = GitSession(checkout_location, repository)
 
-        if self.branch not in repository.heads and self.create_branch:
+        if self.branch in repository.remotes.origin.refs and (reused or self.branch not in repository.heads):
+            # Creates (or resets) a local branch that tracks the existing remote branch
+            repository.git.checkout(self.branch, f"origin/{self.branch}", B=True)
+        elif self.branch not in repository.heads and self.create_branch:
             # It doesn't appear that `create_head` can be used to create branches without basing them off a commit (i.e.
             # if it is a new repository)
             repository.git.checkout(self.branch, b=True)
+        elif reused and self.create_branch:
+            # Recreates the branch, as it was created in a previous use of the working tree
+            repository.git.checkout(self.branch, "origin/HEAD", B=True)
         else:
             repository.heads[self.branch].checkout()
 
         return self.checkout_location
 
+    def get_remote_head(self) -> Optional[str]:
+        """
+        Gets the ID of the commit at the head of the branch on the remote, without checking out the repository.
+        :return: the (full) ID of the head commit or `None` if the branch does not exist on the remote
+        """
+        if self.scheduler is not None:
+            self.scheduler.wait_to_fetch(self.remote)
+        return get_remote_head_commit(self.remote, self.branch, {"GIT_SSH_COMMAND": self._get_ssh_command()})
+
+    @property
+    @requires_checkout
+    def session(self) -> GitSession:
+        """
+        The session with the checkout, which is shared by the operations on it until the repository is torn down.
+        """
+        if self._session is None or self._session.checkout_location != self.checkout_location:
+            self._session = GitSession(self.checkout_location)
+        return self._session
+
+    @requires_checkout
+    def get_head(self) -> Optional[str]:
+        """
+        Gets the ID of the commit at the head of the checked out branch.
+        :return: the (full) ID of the head commit or `None` if the branch has no commits
+        """
+        repository = self.session.repository
+        return repository.head.commit.hexsha if repository.head.is_valid() else None
+
     @requires_checkout
     def push(self):
         """
-        Commits then pushes changes to the repository.
+        Commits then pushes changes to the repository (unless pushes are deferred).
+        """
+        if self.defer_pushes:
+            self._push_pending = True
+            return
+        self._push()
+
+    @requires_checkout
+    def push_deferred(self) -> bool:
         """
-        repository = Repo(self.checkout_location)
+        Pushes the changes whose push was deferred, if any.
+        :return: whether anything was pushed
+        """
+        if not self._push_pending:
+            return False
+        self._push()
+        self._push_pending = False
+        return True
+
+    def _push(self):
+        """
+        Pushes changes to the repository.
+        """
+        repository = self.session.repository
         repository.git.update_environment(GIT_SSH_COMMAND=self._get_ssh_command())
+        if self.scheduler is not None:
+            self.scheduler.wait_to_push(self.remote)
         repository.remotes.origin.push(refspec=f"{self.branch}:{self.branch}")
 
     @requires_checkout
@@ -125,10 +264,10 @@ class GitRepository:
         :param changed_files: the specific files to commit. If left as `None`, all files will be committed
         """
         if changed_files is None or len(changed_files) > 0:
-            repository = Repo(self.checkout_location)
+            repository = self.session.repository
 
-            index = repository.index
             if changed_files is not None:
+                index = repository.index
                 added = {changed_file for changed_file in changed_files if os.path.exists(changed_file)}
                 removed = set(changed_files) - added
                 if len(added) > 0:
@@ -137,24 +276,27 @@ class GitRepository:
                     index.remove(removed, r=True)
             else:
                 repository.git.add(A=True)
+                index = repository.index
 
-            if len(repository.refs) == 0 or len(repository.index.diff(repository.head.commit)) > 0:
+            # Compares trees rather than diffing (in a new process): the head commit is read through the session's
+            # persistent `cat-file` process and the index's tree is written as part of committing anyway
+            if not repository.head.is_valid() or index.write_tree().hexsha != repository.head.commit.tree.hexsha:
                 self._commit(index, commit_message)
 
-    def _commit(self, index: IndexFile, commit_message: str):
+    def _commit(self, index: "IndexFile", commit_message: str):
         """
         Commits the changes to the given index with the given commit message.
         :param index: the repository index with changes to commit
         :param commit_message: the message to associate with the commit
         """
+        from git import Actor
+
         if self.author_name is not None and self.author_email is not None:
             author = Actor(self.author_name, self.author_email)
         else:
             for config in GitRepository._REQUIRED_USER_CONFIG_PARAMETERS:
-                try:
-                    index.repo.git.config(config)
-                except GitCommandError as e:
-                    raise RuntimeError(f"`git config --global {config}` must be set") from e
+                if self.session.get_config(config) is None:
+                    raise RuntimeError(f"`git config --global {config}` must be set")
             author = None
         index.commit(commit_message, author=author)
 
@@ -168,4 +310,7 @@ class GitRepository:
             arguments += ["-o", "UserKnownHostsFile=/dev/null", "-o", "StrictHostKeyChecking=no"]
         if self.private_key_file is not None:
             arguments += ["-i", self.private_key_file]
+        if self.ssh_multiplexer is not None:
+            arguments += self.ssh_multiplexer.get_ssh_arguments(
+                self.remote, private_key_file=self.private_key_file, host_key_checking=self.host_key_checking)
         return " ".join(arguments)
@@ -0,0 +1,221 @@
+import logging
+import time
+from threading import Lock, Condition
+from typing import Optional, Dict, List, Callable
+from urllib.parse import urlsplit
+
+from gitcommonsync._common import read_json, write_json
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.ssh import get_ssh_destination
+
+_logger = logging.getLogger(__name__)
+
+LOCAL_HOST = "localhost"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, which limits the rate of operations whilst allowing short bursts.
+    """
+    def __init__(self, rate: float, capacity: float=None):
+        """
+        Constructor.
+        :param rate: the number of tokens added per second (i.e. the sustained rate of operations)
+        :param capacity: the maximum number of tokens that can be held (i.e. the largest burst). Defaults to a second's
+        worth of tokens (and at least one)
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive: {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """
+        Takes a token, blocking until one is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimits:
+    """
+    Limits on the git operations made against a single host.
+    """
+    def __init__(self, max_concurrency: int=None, fetch_rate: float=None, push_rate: float=None):
+        """
+        Constructor.
+        :param max_concurrency: the maximum number of repositories on the host to synchronise at the same time
+        (unlimited if `None`)
+        :param fetch_rate: the maximum number of clones, fetches and remote queries per second (unlimited if `None`)
+        :param push_rate: the maximum number of pushes per second (unlimited if `None`)
+        """
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f"Maximum concurrency must be at least 1: {max_concurrency}")
+        self.max_concurrency = max_concurrency
+        self.fetch_rate = fetch_rate
+        self.push_rate = push_rate
+
+
+class HostScheduler:
+    """
+    Schedules the synchronisation of repositories so that the limits of each remote host are respected, and orders the
+    repositories longest first (by their duration in previous runs) to shorten the total run time.
+
+    Limits apply to each host separately: the default limits are not shared between hosts.
+    """
+    def __init__(self, default_limits: HostLimits=None, host_limits: Dict[str, HostLimits]=None,
+                 durations_location: str=None):
+        """
+        Constructor.
+        :param default_limits: limits for hosts without their own limits (unlimited if `None`)
+        :param host_limits: limits for specific hosts, indexed by host name (see `get_remote_host`)
+        :param durations_location: optional location of a file in which to keep the time taken to synchronise each
+        repository between runs
+        """
+        self.default_limits = default_limits if default_limits is not None else HostLimits()
+        self.host_limits = host_limits if host_limits is not None else {}
+        self.durations_location = durations_location
+        self._durations: Dict[str, Dict[str, float]] = {}
+        if durations_location is not None:
+            self._durations = read_json(durations_location) or {}
+        self._active: Dict[str, int] = {}
+        self._fetch_buckets: Dict[str, TokenBucket] = {}
+        self._push_buckets: Dict[str, TokenBucket] = {}
+        self._lock = Lock()
+        self._released = Condition(self._lock)
+
+    def get_limits(self, host: str) -> HostLimits:
+        """
+        Gets the limits that apply to the given host.
+        :param host: the host
+        :return: the limits
+        """
+        return self.host_limits.get(host, self.default_limits)
+
+    def get_order(self, repositories: List[GitRepository]) -> List[int]:
+        """
+        Gets the order in which to synchronise the given repositories: longest first (longest processing time first),
+        where repositories that have not been timed are assumed to be the longest.
+        :param repositories: the repositories
+        :return: the indices of the repositories, in the order in which they should be synchronised
+        """
+        def get_key(index: int) -> float:
+            duration = self.get_duration(repositories[index].remote, repositories[index].branch)
+            return -duration if duration is not None else float("-inf")
+
+        return sorted(range(len(repositories)), key=get_key)
+
+    def get_duration(self, remote: str, branch: str) -> Optional[float]:
+        """
+        Gets the time taken to synchronise the given repository when last timed.
+        :param remote: url of the repository's remote
+        :param branch: the synchronised branch
+        :return: the duration (in seconds) or `None` if not timed
+        """
+        with self._lock:
+            return self._durations.get(remote, {}).get(branch)
+
+    def record_duration(self, remote: str, branch: str, duration: float):
+        """
+        Records the time taken to synchronise the given repository.
+        :param remote: url of the repository's remote
+        :param branch: the synchronised branch
+        :param duration: the duration (in seconds)
+        """
+        with self._lock:
+            self._durations.setdefault(remote, {})[branch] = duration
+            if self.durations_location is not None:
+                write_json(self.durations_location, self._durations)
+
+    def try_acquire(self, remote: str) -> bool:
+        """
+        Takes a slot to synchronise a repository with the given remote, if the host's concurrency limit allows.
+        :param remote: url of the remote
+        :return: whether the slot was taken, in which case it must be released with `release`
+        """
+        host = get_remote_host(remote)
+        max_concurrency = self.get_limits(host).max_concurrency
+        with self._lock:
+            active = self._active.get(host, 0)
+            if max_concurrency is not None and active >= max_concurrency:
+                return False
+            self._active[host] = active + 1
+            return True
+
+    def release(self, remote: str):
+        """
+        Releases a slot taken with `try_acquire`.
+        :param remote: url of the remote
+        """
+        host = get_remote_host(remote)
+        with self._lock:
+            self._active[host] -= 1
+            self._released.notify_all()
+
+    def wait_for_release(self, timeout: float):
+        """
+        Blocks until a slot taken with `try_acquire` is released (by any user of this scheduler) or the given timeout is
+        reached, whichever is first.
+        :param timeout: maximum time to wait (in seconds)
+        """
+        with self._released:
+            self._released.wait(timeout)
+
+    def wait_to_fetch(self, remote: str):
+        """
+        Blocks until a clone, fetch or query of the given remote is allowed by the host's rate limit.
+        :param remote: url of the remote
+        """
+        self._wait(remote, self._fetch_buckets, lambda limits: limits.fetch_rate)
+
+    def wait_to_push(self, remote: str):
+        """
+        Blocks until a push to the given remote is allowed by the host's rate limit.
+        :param remote: url of the remote
+        """
+        self._wait(remote, self._push_buckets, lambda limits: limits.push_rate)
+
+    def _wait(self, remote: str, buckets: Dict[str, TokenBucket],
+              get_rate: Callable[[HostLimits], Optional[float]]):
+        """
+        Blocks until an operation on the given remote is allowed by the host's rate limit.
+        :param remote: url of the remote
+        :param buckets: the token buckets for the type of operation, indexed by host
+        :param get_rate: gets the rate limit for the type of operation from the host's limits
+        """
+        host = get_remote_host(remote)
+        rate = get_rate(self.get_limits(host))
+        if rate is None:
+            return
+        with self._lock:
+            if host not in buckets:
+                buckets[host] = TokenBucket(rate)
+            bucket = buckets[host]
+        bucket.acquire()
+
+
+def get_remote_host(remote: str) -> str:
+    """
+    Gets the host of the given git remote.
+    :param remote: url of the remote (e.g. `git@example.com:repository.git` or `https://example.com/repository.git`)
+    :return: the host name, which is `LOCAL_HOST` for remotes on the local file system
+    """
+    ssh_destination = get_ssh_destination(remote)
+    if ssh_destination is not None:
+        return ssh_destination[1]
+    if "://" in remote:
+        hostname = urlsplit(remote).hostname
+        if hostname:
+            return hostname
+    return LOCAL_HOST
@@ -0,0 +1,181 @@
+import logging
+import os
+import shutil
+from tempfile import mkdtemp, gettempdir
+from threading import Lock
+from typing import Optional, Dict
+
+from gitcommonsync._common import get_size, read_json, write_json
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_DIRECTORY = "/dev/shm"
+DEFAULT_SIZE_THRESHOLD = 256 * 1024 * 1024
+DEFAULT_MEMORY_CAP = 1024 * 1024 * 1024
+
+
+class ScratchSpace:
+    """
+    Space reserved in which to check out a repository.
+    """
+    def __init__(self, directory: str, in_memory: bool, size: int):
+        """
+        Constructor.
+        :param directory: the directory that has been reserved
+        :param in_memory: whether the directory is backed by memory (e.g. tmpfs)
+        :param size: the size (in bytes) reserved if in memory
+        """
+        self.directory = directory
+        self.in_memory = in_memory
+        self.size = size
+
+
+class ScratchSpacePolicy:
+    """
+    Policy on where to check out repositories.
+
+    Repositories that are estimated to be small are checked out into a memory backed location (e.g. tmpfs), where the
+    metadata heavy operations involved in synchronising (clone, copy, `git add`, removal) are faster. Others, and any
+    that would take the total size of the repositories checked out in memory over a cap, are checked out on disk.
+
+    The size of a repository is estimated from its size when it was previously checked out or, if the remote is local,
+    the size of the remote. Repositories of unknown size are checked out on disk.
+    """
+    def __init__(self, memory_directory: Optional[str]=DEFAULT_MEMORY_DIRECTORY, disk_directory: str=None,
+                 size_threshold: int=DEFAULT_SIZE_THRESHOLD, memory_cap: int=DEFAULT_MEMORY_CAP,
+                 estimates_location: str=None):
+        """
+        Constructor.
+        :param memory_directory: memory backed directory to check out small repositories into. If `None` or it does
+        not exist, all repositories are checked out on disk
+        :param disk_directory: directory to check out other repositories into (defaults to the system's temporary
+        directory)
+        :param size_threshold: the estimated size (in bytes) that a repository must be under to be checked out in memory
+        :param memory_cap: the maximum total size (in bytes) of the repositories checked out in memory at the same time
+        :param estimates_location: optional location of a file in which to keep the size of repositories between runs
+        """
+        self.memory_directory = memory_directory \
+            if memory_directory is not None and os.path.isdir(memory_directory) else None
+        self.disk_directory = disk_directory
+        self.size_threshold = size_threshold
+        self.memory_cap = memory_cap
+        self.estimates_location = estimates_location
+        self._memory_reserved = 0
+        self._lock = Lock()
+        self._estimates: Dict[str, int] = {}
+        if estimates_location is not None:
+            self._estimates = read_json(estimates_location) or {}
+
+    @property
+    def memory_reserved(self) -> int:
+        """
+        The total size (in bytes) of the space currently reserved in memory.
+        """
+        return self._memory_reserved
+
+    def estimate_size(self, remote: str) -> Optional[int]:
+        """
+        Estimates the size of a checkout of the repository with the given remote.
+        :param remote: url of the remote
+        :return: the estimated size (in bytes) or `None` if unknown
+        """
+        with self._lock:
+            if remote in self._estimates:
+                return self._estimates[remote]
+        if os.path.isdir(remote):
+            return get_size(remote)
+        return None
+
+    def reserve(self, remote: str) -> ScratchSpace:
+        """
+        Reserves a new directory in which to check out the repository with the given remote.
+        :param remote: url of the remote
+        :return: the reserved space, which must be released after use
+        """
+        size = self.estimate_size(remote)
+        if self.memory_directory is not None and size is not None and size < self.size_threshold:
+            with self._lock:
+                if self._memory_reserved + size <= self.memory_cap and self._has_free_memory(size):
+                    self._memory_reserved += size
+                    return ScratchSpace(mkdtemp(dir=self.memory_directory), True, size)
+            _logger.info(f"Checking out {remote} on disk as memory cap reached")
+        return ScratchSpace(mkdtemp(dir=self.disk_directory), False, 0)
+
+    def resize(self, space: ScratchSpace, size: int) -> bool:
+        """
+        Updates the size reserved for the given space, once the actual size is known.
+        :param space: the reserved space
+        :param size: the actual size (in bytes)
+        :return: `False` if the space is in memory and no longer fits, in which case it should be moved to disk
+        """
+        if not space.in_memory:
+            return True
+        with self._lock:
+            if size >= self.size_threshold or self._memory_reserved - space.size + size > self.memory_cap:
+                return False
+            self._memory_reserved += size - space.size
+            space.size = size
+            return True
+
+    def spill(self, space: ScratchSpace) -> ScratchSpace:
+        """
+        Moves the given space, and its contents, from memory to disk.
+        :param space: the reserved space, which is released
+        :return: the new space on disk
+        """
+        disk_space = ScratchSpace(mkdtemp(dir=self.disk_directory), False, 0)
+        _logger.info(f"Spilling {space.directory} to disk ({disk_space.directory})")
+        os.rmdir(disk_space.directory)
+        if _same_device(space.directory, self.disk_directory):
+            os.rename(space.directory, disk_space.directory)
+        else:
+            shutil.copytree(space.directory, disk_space.directory, symlinks=True)
+            shutil.rmtree(space.directory)
+        self._release_memory(space)
+        return disk_space
+
+    def release(self, space: ScratchSpace, remote: str=None, size: int=None):
+        """
+        Releases the given space, which should have been emptied.
+        :param space: the reserved space
+        :param remote: url of the remote of the repository that was checked out into the space
+        :param size: the size (in bytes) of the checked out repository, which is used to estimate its size next time
+        """
+        self._release_memory(space)
+        if remote is not None and size is not None:
+            with self._lock:
+                self._estimates[remote] = size
+                if self.estimates_location is not None:
+                    write_json(self.estimates_location, self._estimates)
+
+    def _release_memory(self, space: ScratchSpace):
+        """
+        Releases any memory reserved for the given space.
+        :param space: the reserved space
+        """
+        if space.in_memory:
+            with self._lock:
+                self._memory_reserved -= space.size
+            space.in_memory = False
+            space.size = 0
+
+    def _has_free_memory(self, size: int) -> bool:
+        """
+        Whether the memory backed directory has space for the given size.
+        :param size: the required size (in bytes)
+        :return: whether there is space
+        """
+        status = os.statvfs(self.memory_directory)
+        return status.f_bavail * status.f_frsize > size
+
+
+def _same_device(location: str, other_location: Optional[str]) -> bool:
+    """
+    Whether the given locations are on the same device (and so files can be renamed between them).
+    :param location: a location
+    :param other_location: another location (the system's temporary directory if `None`)
+    :return: whether on the same device
+    """
+    other_location = other_location if other_location is not None else gettempdir()
+    return os.stat(location).st_dev == os.stat(other_location).st_dev
+
@@ -0,0 +1,66 @@
+from typing import Dict, Optional, TYPE_CHECKING
+
+# Note: GitPython is imported when it is first used, as it is slow to import (it runs `git` on import)
+if TYPE_CHECKING:
+    from git import Git, Repo
+
+
+class GitSession:
+    """
+    Long-lived session with a checkout, shared by the operations on it so that the number of `git` processes started
+    for a repository does not grow with the number of operations.
+
+    The session's `Repo` is reused, so objects are looked up through the persistent `git cat-file --batch` and
+    `--batch-check` processes that GitPython starts for it (rather than new processes for each new `Repo`), and
+    configuration values are read once.
+    """
+    def __init__(self, checkout_location: str, repository: "Repo"=None):
+        """
+        Constructor.
+        :param checkout_location: location of the checkout
+        :param repository: the checkout's repository, if already open
+        """
+        self.checkout_location = checkout_location
+        self._repository = repository
+        self._config: Dict[str, Optional[str]] = {}
+
+    @property
+    def repository(self) -> "Repo":
+        """
+        The checkout's repository, opened when first required.
+        """
+        if self._repository is None:
+            from git import Repo
+            self._repository = Repo(self.checkout_location)
+        return self._repository
+
+    @property
+    def git(self) -> "Git":
+        """
+        The `git` command wrapper of the checkout's repository.
+        """
+        return self.repository.git
+
+    def get_config(self, name: str) -> Optional[str]:
+        """
+        Gets the value of the given configuration parameter (as `git config` would, so from all levels), which is only
+        read from the configuration the first time.
+        :param name: name of the parameter, e.g. `user.name`
+        :return: the value or `None` if not set
+        """
+        if name not in self._config:
+            from git import GitCommandError
+            try:
+                self._config[name] = self.git.config(name, get=True)
+            except GitCommandError:
+                self._config[name] = None
+        return self._config[name]
+
+    def close(self):
+        """
+        Closes the session, stopping the persistent `git` processes started for it.
+        """
+        if self._repository is not None:
+            self._repository.close()
+            self._repository = None
+        self._config.clear()
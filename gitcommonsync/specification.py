@@ -0,0 +1,339 @@
+from typing import Any, Dict, Tuple, List, Iterator, Callable
+
+from gitcommonsync.models import TemplateSynchronisation, FileSynchronisation, SubrepoSynchronisation, \
+    Synchronisation
+from gitcommonsync.repository import GitRepository, GitCheckout, DEFAULT_BRANCH
+
+REPOSITORY_URL_PROPERTY = "repository"
+REPOSITORY_BRANCH_PROPERTY = "branch"
+REPOSITORY_AUTHOR_NAME_PROPERTY = "author_name"
+REPOSITORY_AUTHOR_EMAIL_PROPERTY = "author_email"
+REPOSITORY_KEY_FILE_PROPERTY = "key_file"
+REPOSITORY_VARIABLES_PROPERTY = "variables"
+
+REPOSITORIES_PROPERTY = "repositories"
+
+TEMPLATES_PROPERTY = "templates"
+FILES_PROPERTY = "files"
+SUBREPOS_PROPERTY = "subrepos"
+
+TEMPLATE_SOURCE_PROPERTY = "src"
+TEMPLATE_DESTINATION_PROPERTY = "dest"
+TEMPLATE_OVERWRITE_PROPERTY = "overwrite"
+TEMPLATE_VARIABLES_PROPERTY = "variables"
+
+FILE_SOURCE_PROPERTY = "src"
+FILE_DESTINATION_PROPERTY = "dest"
+FILE_OVERWRITE_PROPERTY = "overwrite"
+FILE_INCLUDE_PROPERTY = "include"
+FILE_EXCLUDE_PROPERTY = "exclude"
+
+SUBREPO_URL_PROPERTY = "src"
+SUBREPO_BRANCH_PROPERTY = "branch"
+SUBREPO_COMMIT_PROPERTY = "commit"
+SUBREPO_DIRECTORY_PROPERTY = "dest"
+SUBREPO_OVERWRITE_PROPERTY = "overwrite"
+
+_DEFAULTS = {
+    REPOSITORY_URL_PROPERTY: None,
+    REPOSITORIES_PROPERTY: None,
+    REPOSITORY_BRANCH_PROPERTY: DEFAULT_BRANCH,
+    REPOSITORY_AUTHOR_NAME_PROPERTY: None,
+    REPOSITORY_AUTHOR_EMAIL_PROPERTY: None,
+    REPOSITORY_KEY_FILE_PROPERTY: None,
+    TEMPLATES_PROPERTY: [],
+    FILES_PROPERTY: [],
+    SUBREPOS_PROPERTY: []
+}
+
+
+class InvalidSpecificationError(ValueError):
+    """
+    Raised if a synchronisation specification is not valid.
+    """
+
+
+def load_specification(location: str) -> Dict[str, Any]:
+    """
+    Loads the YAML synchronisation specification at the given location.
+
+    The specification has the same shape as the arguments of the Ansible module. Defaults are set for any properties
+    that are not defined.
+    :param location: location of the specification
+    :return: the specification
+    :raises InvalidSpecificationError: if the specification is not valid
+    """
+    import yaml
+
+    with open(location, "r") as file:
+        try:
+            specification = yaml.safe_load(file)
+        except yaml.YAMLError as e:
+            raise InvalidSpecificationError(f"Specification is not valid YAML: {e}") from e
+
+    if not isinstance(specification, dict):
+        raise InvalidSpecificationError(f"Specification must be a mapping: {location}")
+    return _validate_specification(specification)
+
+
+def iterate_jobs(location: str) -> Iterator[Tuple[GitRepository, List[Synchronisation]]]:
+    """
+    Lazily loads the jobs defined by the YAML synchronisation specification at the given location.
+
+    Unlike `load_specification` followed by `parse_jobs`, the list of repositories is streamed: each repository's job
+    is created only when it is reached, so memory use does not grow with the number of repositories (as long as the
+    jobs are not kept). The specification is read twice: first for the properties shared by all repositories (which may
+    be defined after the repositories) and then for the repositories.
+    :param location: location of the specification
+    :return: iterator of the jobs, see `parse_jobs`
+    :raises InvalidSpecificationError: if the specification is not valid (possibly only once reached)
+    """
+    import yaml
+
+    try:
+        specification: Dict[str, Any] = {}
+        defines_repositories = False
+        for key, load_value in _iterate_top_level_properties(location):
+            if key == REPOSITORIES_PROPERTY:
+                defines_repositories = True
+            else:
+                specification[key] = load_value()
+        arguments = _validate_specification(
+            {**specification, REPOSITORIES_PROPERTY: [] if defines_repositories else None})
+
+        if not defines_repositories:
+            yield parse_configuration(arguments)
+            return
+        for key, load_value in _iterate_top_level_properties(location, load_lazily=True):
+            if key == REPOSITORIES_PROPERTY:
+                for configuration in load_value():
+                    yield _parse_repository_configuration(arguments, configuration)
+    except KeyError as e:
+        raise InvalidSpecificationError(f"Required property missing: {e}") from e
+    except yaml.YAMLError as e:
+        raise InvalidSpecificationError(f"Specification is not valid YAML: {e}") from e
+
+
+def parse_jobs(arguments: Dict[str, Any]) -> List[Tuple[GitRepository, List[Synchronisation]]]:
+    """
+    Parses the given configuration, which defines either a single repository or multiple repositories.
+    :param arguments: the configuration
+    :return: see `parse_repositories_configuration`
+    :raises InvalidSpecificationError: if a required property is missing
+    """
+    try:
+        if arguments[REPOSITORIES_PROPERTY] is not None:
+            return parse_repositories_configuration(arguments)
+        return [parse_configuration(arguments)]
+    except KeyError as e:
+        raise InvalidSpecificationError(f"Required property missing: {e}") from e
+
+
+def parse_configuration(arguments: Dict[str, Any]) -> Tuple[GitRepository, List[Synchronisation]]:
+    """
+    Parses the given configuration.
+    :param arguments: the configuration (e.g. the arguments passed to the Ansible module)
+    :return: tuple where the first element is the git repository that is to be synchronised and the seocnd is the
+    configuration that defines how it is to be synchronised
+    """
+    repository = GitRepository(
+        remote=arguments[REPOSITORY_URL_PROPERTY], branch=arguments[REPOSITORY_BRANCH_PROPERTY],
+        private_key_file=arguments[REPOSITORY_KEY_FILE_PROPERTY],
+        author_name=arguments[REPOSITORY_AUTHOR_NAME_PROPERTY],
+        author_email=arguments[REPOSITORY_AUTHOR_EMAIL_PROPERTY])
+    return repository, parse_synchronisations(arguments)
+
+
+def parse_repositories_configuration(arguments: Dict[str, Any]) -> List[Tuple[GitRepository, List[Synchronisation]]]:
+    """
+    Parses the given configuration when multiple repositories are to be synchronised.
+
+    Each repository is given either as a URL or as a dictionary, which may override the branch and key file set for all
+    repositories and set variables that take precedence over those given for each template.
+    :param arguments: the configuration (e.g. the arguments passed to the Ansible module)
+    :return: list of tuples where the first element is a git repository that is to be synchronised and the second is
+    the configuration that defines how it is to be synchronised
+    """
+    return [_parse_repository_configuration(arguments, configuration)
+            for configuration in arguments[REPOSITORIES_PROPERTY]]
+
+
+def parse_synchronisations(arguments: Dict[str, Any], variables: Dict[str, Any]=None) -> List[Synchronisation]:
+    """
+    Parses the synchronisations defined in the given configuration.
+
+    New synchronisation objects are created on each call so that they are not shared between repositories (although
+    the values they hold may be).
+    :param arguments: the configuration (e.g. the arguments passed to the Ansible module)
+    :param variables: variables that take precedence over those defined for each template
+    :return: the configuration that defines how a repository is to be synchronised
+    """
+    variables = variables if variables is not None else {}
+    synchronisations: List[Synchronisation] = []
+
+    synchronisations.extend([
+        TemplateSynchronisation(
+            source=configuration[TEMPLATE_SOURCE_PROPERTY],
+            destination=configuration[TEMPLATE_DESTINATION_PROPERTY],
+            overwrite=configuration[TEMPLATE_OVERWRITE_PROPERTY]
+            if TEMPLATE_OVERWRITE_PROPERTY in configuration else False,
+            # Variables are only copied if overridden, so that they are otherwise shared between repositories
+            variables={**configuration[TEMPLATE_VARIABLES_PROPERTY], **variables} if len(variables) > 0
+            else configuration[TEMPLATE_VARIABLES_PROPERTY]
+        )
+        for configuration in arguments[TEMPLATES_PROPERTY]
+    ])
+
+    synchronisations.extend([
+        FileSynchronisation(
+            source=configuration[FILE_SOURCE_PROPERTY],
+            destination=configuration[FILE_DESTINATION_PROPERTY],
+            overwrite=configuration[FILE_OVERWRITE_PROPERTY] if FILE_OVERWRITE_PROPERTY in configuration else False,
+            include=_parse_patterns(configuration[FILE_INCLUDE_PROPERTY])
+            if FILE_INCLUDE_PROPERTY in configuration else (),
+            exclude=_parse_patterns(configuration[FILE_EXCLUDE_PROPERTY])
+            if FILE_EXCLUDE_PROPERTY in configuration else ()
+        )
+        for configuration in arguments[FILES_PROPERTY]
+    ])
+
+    synchronisations.extend([
+        SubrepoSynchronisation(
+            checkout=GitCheckout(
+                url=configuration[SUBREPO_URL_PROPERTY],
+                branch=configuration[SUBREPO_BRANCH_PROPERTY],
+                commit=configuration[SUBREPO_COMMIT_PROPERTY] if SUBREPO_COMMIT_PROPERTY in configuration else None,
+                directory=configuration[SUBREPO_DIRECTORY_PROPERTY]
+            ),
+            overwrite=configuration[SUBREPO_OVERWRITE_PROPERTY]
+            if SUBREPO_OVERWRITE_PROPERTY in configuration else False
+        )
+        for configuration in arguments[SUBREPOS_PROPERTY]
+    ])
+
+    return synchronisations
+
+
+def _parse_patterns(patterns: Any) -> Tuple[str, ...]:
+    """
+    Parses the given include or exclude patterns of a file synchronisation.
+    :param patterns: a pattern or list of patterns (or `None`)
+    :return: the patterns
+    """
+    if patterns is None:
+        return ()
+    if isinstance(patterns, str):
+        return (patterns,)
+    return tuple(patterns)
+
+
+def _parse_repository_configuration(arguments: Dict[str, Any], configuration: Any) \
+        -> Tuple[GitRepository, List[Synchronisation]]:
+    """
+    Parses the configuration of one of multiple repositories (see `parse_repositories_configuration`).
+    :param arguments: the configuration shared by all repositories
+    :param configuration: the repository's configuration
+    :return: tuple where the first element is the git repository and the second is its synchronisations
+    """
+    if not isinstance(configuration, dict):
+        configuration = {REPOSITORY_URL_PROPERTY: configuration}
+    if REPOSITORY_URL_PROPERTY not in configuration:
+        raise InvalidSpecificationError(
+            f"Repository configuration missing \"{REPOSITORY_URL_PROPERTY}\": {configuration}")
+
+    repository = GitRepository(
+        remote=configuration[REPOSITORY_URL_PROPERTY],
+        branch=configuration.get(REPOSITORY_BRANCH_PROPERTY, arguments[REPOSITORY_BRANCH_PROPERTY]),
+        private_key_file=configuration.get(REPOSITORY_KEY_FILE_PROPERTY, arguments[REPOSITORY_KEY_FILE_PROPERTY]),
+        author_name=arguments[REPOSITORY_AUTHOR_NAME_PROPERTY],
+        author_email=arguments[REPOSITORY_AUTHOR_EMAIL_PROPERTY])
+    return repository, parse_synchronisations(arguments, variables=configuration.get(REPOSITORY_VARIABLES_PROPERTY, {}))
+
+
+def _validate_specification(specification: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates the given specification and sets defaults for any properties that are not defined.
+    :param specification: the specification
+    :return: the specification with defaults set
+    :raises InvalidSpecificationError: if the specification is not valid
+    """
+    unknown_properties = set(specification.keys()) - set(_DEFAULTS.keys())
+    if len(unknown_properties) > 0:
+        raise InvalidSpecificationError(f"Unknown properties in specification: {sorted(unknown_properties)}")
+    if (specification.get(REPOSITORY_URL_PROPERTY) is None) == (specification.get(REPOSITORIES_PROPERTY) is None):
+        raise InvalidSpecificationError(
+            f"Exactly one of \"{REPOSITORY_URL_PROPERTY}\" or \"{REPOSITORIES_PROPERTY}\" must be defined")
+    return {**_DEFAULTS, **specification}
+
+
+def _iterate_top_level_properties(location: str, load_lazily: bool=False) \
+        -> Iterator[Tuple[str, Callable[[], Any]]]:
+    """
+    Iterates over the top level properties of the YAML mapping at the given location, without loading their values
+    unless requested.
+    :param location: location of the YAML
+    :param load_lazily: whether sequences are loaded item by item (as an iterator) when requested
+    :return: iterator of tuples where the first element is the property's key and the second loads its value. If the
+    value is not loaded before the iterator is advanced, it is skipped
+    :raises InvalidSpecificationError: if the YAML is not a mapping
+    """
+    import yaml
+
+    with open(location, "r") as file:
+        loader = yaml.SafeLoader(file)
+        try:
+            loader.get_event()
+            if not loader.check_event(yaml.DocumentStartEvent):
+                raise InvalidSpecificationError(f"Specification must be a mapping: {location}")
+            loader.get_event()
+            if not loader.check_event(yaml.MappingStartEvent):
+                raise InvalidSpecificationError(f"Specification must be a mapping: {location}")
+            loader.get_event()
+
+            while not loader.check_event(yaml.MappingEndEvent):
+                key = loader.construct_document(loader.compose_node(None, None))
+                state = {"loaded": False}
+
+                def load_value() -> Any:
+                    state["loaded"] = True
+                    if load_lazily and loader.check_event(yaml.SequenceStartEvent):
+                        return _iterate_sequence(loader)
+                    return loader.construct_document(loader.compose_node(None, None))
+
+                yield key, load_value
+                if not state["loaded"]:
+                    _skip_node(loader)
+        finally:
+            loader.dispose()
+
+
+def _iterate_sequence(loader: "yaml.SafeLoader") -> Iterator[Any]:
+    """
+    Iterates over the items of the YAML sequence that the given loader is at, loading each item only when reached.
+    :param loader: the loader, positioned at the start of a sequence
+    :return: iterator of the loaded items
+    """
+    import yaml
+
+    loader.get_event()
+    while not loader.check_event(yaml.SequenceEndEvent):
+        yield loader.construct_document(loader.compose_node(None, None))
+    loader.get_event()
+
+
+def _skip_node(loader: "yaml.SafeLoader"):
+    """
+    Skips over the YAML node that the given loader is at, without loading it.
+    :param loader: the loader
+    """
+    import yaml
+
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
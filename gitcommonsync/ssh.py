@@ -0,0 +1,119 @@
+import atexit
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+from tempfile import mkdtemp
+from threading import Lock
+from typing import Optional, Tuple, List, Dict
+from urllib.parse import urlsplit
+
+from gitcommonsync.repository import SSH_COMMAND
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MASTERS = 8
+DEFAULT_PERSIST = 60
+
+_SSH_URL_SCHEMES = {"ssh", "git+ssh", "ssh+git"}
+_SCP_LIKE_REMOTE_PATTERN = re.compile(r"^(?:(?P<user>[^@/]+)@)?(?P<host>[^:/]+):(?!//)")
+_CONTROL_PATH_KEY_LENGTH = 16
+
+SshDestination = Tuple[Optional[str], str, Optional[int]]
+
+
+class SshMultiplexer:
+    """
+    Manages SSH connection multiplexing (OpenSSH's `ControlMaster`), so that git operations against the same host share
+    one master connection rather than each making a new connection.
+
+    A master is used for each host, user, port and private key. Masters are started by the first SSH command to use them
+    and persist between commands until the multiplexer is closed (which happens at exit). Once the maximum number of
+    masters is reached, SSH commands for other destinations are not multiplexed.
+    """
+    def __init__(self, max_masters: int=DEFAULT_MAX_MASTERS, persist: int=DEFAULT_PERSIST, directory: str=None):
+        """
+        Constructor.
+        :param max_masters: the maximum number of master connections
+        :param persist: time (in seconds) that an idle master connection is kept open for
+        :param directory: optional parent directory of the (private) directory in which the control sockets are
+        created. Defaults to the system's temporary directory; note that paths to sockets must be short (~100 chars)
+        """
+        if max_masters < 1:
+            raise ValueError(f"Maximum number of masters must be at least 1: {max_masters}")
+        self.max_masters = max_masters
+        self.persist = persist
+        self.directory = mkdtemp(prefix="gitcommonsync-ssh-", dir=directory)
+        self._control_paths: Dict[Tuple, str] = {}
+        self._lock = Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def get_ssh_arguments(self, remote: str, private_key_file: str=None, host_key_checking: bool=True) -> List[str]:
+        """
+        Gets the SSH arguments required to multiplex connections to the given remote.
+        :param remote: url of the remote
+        :param private_key_file: the private key used to access the remote
+        :param host_key_checking: whether host key checking is enabled when accessing the remote
+        :return: the SSH arguments, which are empty if the remote is not accessed over SSH or the maximum number of
+        masters has been reached
+        """
+        destination = get_ssh_destination(remote)
+        if destination is None:
+            return []
+        key = (*destination, os.path.abspath(private_key_file) if private_key_file is not None else None,
+               host_key_checking)
+        with self._lock:
+            if self._closed:
+                return []
+            control_path = self._control_paths.get(key)
+            if control_path is None:
+                if len(self._control_paths) >= self.max_masters:
+                    _logger.debug(f"Not multiplexing connection to {destination[1]} as maximum masters reached")
+                    return []
+                digest = hashlib.sha256(repr(key).encode()).hexdigest()[:_CONTROL_PATH_KEY_LENGTH]
+                control_path = os.path.join(self.directory, digest)
+                self._control_paths[key] = control_path
+        return ["-o", "ControlMaster=auto", "-o", f"ControlPath={control_path}",
+                "-o", f"ControlPersist={self.persist}"]
+
+    def close(self):
+        """
+        Stops all master connections and removes the directory containing their control sockets.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            control_paths = list(self._control_paths.items())
+        for (user, host, port, _, _), control_path in control_paths:
+            if os.path.exists(control_path):
+                destination = f"{user}@{host}" if user is not None else host
+                try:
+                    subprocess.run([SSH_COMMAND, "-o", f"ControlPath={control_path}", "-O", "exit", destination],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    _logger.warning(f"Could not stop SSH master connection to {host}: {e}")
+        shutil.rmtree(self.directory, ignore_errors=True)
+        atexit.unregister(self.close)
+
+
+def get_ssh_destination(remote: str) -> Optional[SshDestination]:
+    """
+    Gets the SSH destination of the given git remote.
+    :param remote: url of the remote (e.g. `ssh://git@example.com:2222/repository.git` or
+    `git@example.com:repository.git`)
+    :return: tuple of the user (if any), host and port (if any) or `None` if the remote is not accessed over SSH
+    """
+    if "://" in remote:
+        url = urlsplit(remote)
+        if url.scheme not in _SSH_URL_SCHEMES or not url.hostname:
+            return None
+        return url.username, url.hostname, url.port
+    # Git treats remotes with a colon before any slash as scp-like, SSH remotes
+    match = _SCP_LIKE_REMOTE_PATTERN.match(remote)
+    if match is None:
+        return None
+    return match.group("user"), match.group("host"), None
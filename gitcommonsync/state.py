@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import sqlite3
+import stat
+from contextlib import closing
+from typing import Optional, Iterable, Any, Dict
+
+from gitcommonsync._common import get_remote_head_commit
+from gitcommonsync.filters import PathFilter
+from gitcommonsync.models import Synchronisation, SubrepoSynchronisation, FileSynchronisation, \
+    TemplateSynchronisation
+
+_FINGERPRINT_VERSION = 1
+_READ_BLOCK_SIZE = 1024 * 1024
+
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS synchronisations (
+        remote TEXT NOT NULL,
+        branch TEXT NOT NULL,
+        head TEXT,
+        fingerprint TEXT NOT NULL,
+        PRIMARY KEY (remote, branch)
+    )
+"""
+_SELECT_SQL = "SELECT head, fingerprint FROM synchronisations WHERE remote = ? AND branch = ?"
+_UPSERT_SQL = "INSERT OR REPLACE INTO synchronisations (remote, branch, head, fingerprint) VALUES (?, ?, ?, ?)"
+_DELETE_SQL = "DELETE FROM synchronisations WHERE remote = ? AND branch = ?"
+
+
+class SynchronisationState:
+    """
+    State of a repository branch when it was last successfully synchronised.
+    """
+    def __init__(self, head: Optional[str], fingerprint: str):
+        """
+        Constructor.
+        :param head: the ID of the commit at the head of the branch on the remote after synchronisation (`None` if the
+        branch did not exist)
+        :param fingerprint: fingerprint of the synchronisations that were applied (see `get_fingerprint`)
+        """
+        self.head = head
+        self.fingerprint = fingerprint
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, type(self)) and other.head == self.head and other.fingerprint == self.fingerprint
+
+
+class SynchronisationStateStore:
+    """
+    Persistent store, backed by SQLite, of the state of each repository branch when it was last synchronised.
+
+    Connections are made for each operation so that the store can be shared between threads and processes.
+    """
+    def __init__(self, location: str):
+        """
+        Constructor.
+        :param location: location of the SQLite database, which is created if it does not exist
+        """
+        self.location = location
+        with closing(self._connect()) as connection, connection:
+            connection.execute(_CREATE_TABLE_SQL)
+
+    def get(self, remote: str, branch: str) -> Optional[SynchronisationState]:
+        """
+        Gets the state of the given repository branch when it was last synchronised.
+        :param remote: url of the repository's remote
+        :param branch: the branch of the repository
+        :return: the state or `None` if the branch has not been successfully synchronised
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(_SELECT_SQL, (remote, branch)).fetchone()
+        return SynchronisationState(*row) if row is not None else None
+
+    def set(self, remote: str, branch: str, state: SynchronisationState):
+        """
+        Records the state of the given repository branch after it has been successfully synchronised.
+        :param remote: url of the repository's remote
+        :param branch: the branch of the repository
+        :param state: the state after synchronisation
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(_UPSERT_SQL, (remote, branch, state.head, state.fingerprint))
+
+    def remove(self, remote: str, branch: str):
+        """
+        Removes any record of the state of the given repository branch.
+        :param remote: url of the repository's remote
+        :param branch: the branch of the repository
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(_DELETE_SQL, (remote, branch))
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Connects to the database.
+        :return: the database connection
+        """
+        return sqlite3.connect(self.location, timeout=60)
+
+
+def get_fingerprint(synchronisations: Iterable[Synchronisation]) -> str:
+    """
+    Gets a fingerprint of the given synchronisations, which changes if the synchronisations or the content of their
+    sources change.
+
+    The head commit of the branch of any subrepo that is not pinned to a specific commit is resolved to take into
+    account changes to the subrepo's remote.
+    :param synchronisations: the synchronisations
+    :return: the fingerprint
+    :raises TypeError: if a synchronisation is of an unsupported type
+    """
+    hasher = hashlib.sha256()
+    hasher.update(str(_FINGERPRINT_VERSION).encode())
+    for synchronisation in synchronisations:
+        hasher.update(json.dumps(_describe(synchronisation), sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def _describe(synchronisation: Synchronisation) -> Dict[str, Any]:
+    """
+    Describes the given synchronisation, including digests of the content it synchronises.
+    :param synchronisation: the synchronisation to describe
+    :return: JSON serialisable description
+    :raises TypeError: if the synchronisation is of an unsupported type
+    """
+    description = {"type": type(synchronisation).__name__, "overwrite": synchronisation.overwrite}
+    if isinstance(synchronisation, SubrepoSynchronisation):
+        checkout = synchronisation.checkout
+        commit = checkout.commit if checkout.commit is not None \
+            else get_remote_head_commit(checkout.url, checkout.branch)
+        description.update(url=checkout.url, branch=checkout.branch, directory=checkout.directory, commit=commit)
+    elif isinstance(synchronisation, FileSynchronisation):
+        description.update(source=synchronisation.source, destination=synchronisation.destination,
+                           digest=get_digest(synchronisation.source, synchronisation.path_filter))
+        if synchronisation.path_filter:
+            description.update(include=synchronisation.include, exclude=synchronisation.exclude)
+        if isinstance(synchronisation, TemplateSynchronisation):
+            description.update(variables=synchronisation.variables)
+    else:
+        raise TypeError(f"Unsupported synchronisation type: {type(synchronisation)}")
+    return description
+
+
+def get_digest(location: str, path_filter: PathFilter=None) -> Optional[str]:
+    """
+    Gets a digest of the file or directory at the given location, which includes the names, permissions and contents
+    of any files (or targets of symlinks) in a directory.
+    :param location: the location of the file or directory
+    :param path_filter: optional filter of the files in a directory to include in the digest (excluded directories are
+    not walked)
+    :return: the digest or `None` if nothing exists at the location
+    """
+    if not os.path.lexists(location):
+        return None
+    hasher = hashlib.sha256()
+    if os.path.isdir(location) and not os.path.islink(location):
+        for directory, directory_names, file_names in os.walk(location):
+            if path_filter:
+                directory_names[:] = [name for name in directory_names if not path_filter.is_excluded(
+                    _get_relative_path(os.path.join(directory, name), location), True)]
+            directory_names.sort()
+            for name in sorted(file_names + [name for name in directory_names
+                                             if os.path.islink(os.path.join(directory, name))]):
+                path = os.path.join(directory, name)
+                if path_filter and not path_filter.is_included(_get_relative_path(path, location)):
+                    continue
+                hasher.update(os.path.relpath(path, location).encode(errors="surrogateescape") + b"\0")
+                _update_with_file(hasher, path)
+    else:
+        _update_with_file(hasher, location)
+    return hasher.hexdigest()
+
+
+def _get_relative_path(location: str, directory: str) -> str:
+    """
+    Gets the path of the given location relative to the given directory, with `/` separators.
+    :param location: the location
+    :param directory: the directory
+    :return: the relative path
+    """
+    return os.path.relpath(location, directory).replace(os.sep, "/")
+
+
+def _update_with_file(hasher: "hashlib._Hash", location: str):
+    """
+    Updates the given hasher with the permissions and content of the file (or target of the symlink) at the given
+    location.
+    :param hasher: the hasher to update
+    :param location: location of the file
+    """
+    file_stat = os.lstat(location)
+    hasher.update(oct(file_stat.st_mode).encode() + b"\0")
+    if stat.S_ISLNK(file_stat.st_mode):
+        hasher.update(os.readlink(location).encode(errors="surrogateescape"))
+    else:
+        with open(location, "rb") as file:
+            for block in iter(lambda: file.read(_READ_BLOCK_SIZE), b""):
+                hasher.update(block)
+    hasher.update(b"\0")
@@ -0,0 +1,155 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+from tempfile import mkdtemp
+from typing import Optional
+
+from gitcommonsync.repository import GitRepository, GitCheckout
+from gitcommonsync.subrepos import GITREPO_FILE, SHORT_COMMIT_LENGTH
+
+_logger = logging.getLogger(__name__)
+
+GITREPO_VERSION = "0.4.0"
+GITREPO_METHOD = "merge"
+
+_GITREPO_HEADER = """; DO NOT EDIT (unless you know what you are doing)
+;
+; This subdirectory is a git "subrepo", and this file is maintained by the
+; git-subrepo command. See https://github.com/ingydotnet/git-subrepo#readme
+;
+"""
+_CACHE_SUFFIX = ".git"
+_LOCK_SUFFIX = ".lock"
+_SPECIAL_VALUE_CHARACTERS = set(";#\"\\")
+
+
+class NativeSubrepoEngine:
+    """
+    Creates and updates subrepos without using the `git subrepo` tool.
+
+    The subrepo's remote is fetched into a local object cache (shared between runs if a cache directory is given), from
+    which the tree of the required commit is read into the subrepo's directory with `git read-tree`. A `.gitrepo` file
+    that is compatible with `git subrepo` is written and the update is made in a single commit.
+    """
+    def __init__(self, cache_directory: str=None):
+        """
+        Constructor.
+        :param cache_directory: optional directory in which to keep the fetched objects of subrepos' remotes between
+        runs, which is created if it does not exist. If `None`, a temporary directory is used and removed on close
+        """
+        self._temporary = cache_directory is None
+        self.cache_directory = cache_directory if cache_directory is not None else mkdtemp()
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+    def close(self):
+        """
+        Removes the object cache, if temporary.
+        """
+        if self._temporary:
+            shutil.rmtree(self.cache_directory, ignore_errors=True)
+
+    def fetch(self, url: str, branch: str, commit: str=None) -> str:
+        """
+        Fetches the given commit (or the head of the given branch) from the given remote into the object cache.
+        :param url: url of the remote
+        :param branch: the branch to fetch
+        :param commit: the specific commit that is required (the head of the branch if `None`)
+        :return: the (full) ID of the commit
+        """
+        from git import Repo, GitCommandError
+
+        location = self._get_cache_location(url)
+        lock_file = os.open(f"{location}{_LOCK_SUFFIX}", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(location):
+                # Allows repositories to fetch specific commits from the cache
+                Repo.init(location, bare=True).git.config("uploadpack.allowAnySHA1InWant", "true")
+            cache = Repo(location)
+
+            if commit is not None:
+                try:
+                    return cache.git.rev_parse("--verify", f"{commit}^{{commit}}")
+                except GitCommandError:
+                    pass
+            cache.git.fetch(url, f"+refs/heads/{branch}:refs/heads/{branch}", no_tags=True)
+            if commit is None:
+                return cache.git.rev_parse("--verify", f"refs/heads/{branch}^{{commit}}")
+            try:
+                return cache.git.rev_parse("--verify", f"{commit}^{{commit}}")
+            except GitCommandError:
+                # Not on the branch, so fetches the commit directly
+                cache.git.fetch(url, commit, no_tags=True)
+                return cache.git.rev_parse("--verify", "FETCH_HEAD^{commit}")
+        finally:
+            os.close(lock_file)
+
+    def checkout(self, repository: GitRepository, checkout: GitCheckout) -> str:
+        """
+        Checks out (or updates in place) the given subrepo in the given repository and commits the change.
+        :param repository: the checked out repository containing the subrepo
+        :param checkout: the subrepo's checkout, where the directory is relative to the root of the repository
+        :return: the (full) ID of the subrepo commit that has been checked out
+        """
+        commit = self.fetch(checkout.url, checkout.branch, checkout.commit)
+
+        target = repository.session.repository
+        prefix = os.path.relpath(os.path.join(repository.checkout_location, checkout.directory),
+                                 repository.checkout_location)
+        destination = os.path.join(repository.checkout_location, prefix)
+        parent = target.head.commit.hexsha if target.head.is_valid() else ""
+        existed = os.path.exists(destination)
+
+        target.git.fetch(self._get_cache_location(checkout.url), commit, no_tags=True)
+        target.git.rm("-r", "-q", "--cached", "--ignore-unmatch", "--", prefix)
+        if existed:
+            shutil.rmtree(destination)
+        target.git.read_tree(f"--prefix={prefix}/", "-u", commit)
+        with open(os.path.join(destination, GITREPO_FILE), "w") as file:
+            file.write(_format_gitrepo(checkout.url, checkout.branch, commit, parent))
+
+        short_commit = commit[0:SHORT_COMMIT_LENGTH]
+        repository.commit(
+            f"git subrepo {'pull' if existed else 'clone'} {checkout.url} {prefix}\n\n"
+            f"subrepo:\n  subdir:   \"{prefix}\"\n  merged:   \"{short_commit}\"\n"
+            f"upstream:\n  origin:   \"{checkout.url}\"\n  branch:   \"{checkout.branch}\"\n"
+            f"  commit:   \"{short_commit}\"\n", [destination])
+        _logger.info(f"Checked out subrepo {checkout.url} ({checkout.branch}) at {commit} into {prefix}")
+        return commit
+
+    def _get_cache_location(self, url: str) -> str:
+        """
+        Gets the location of the object cache for the given remote.
+        :param url: url of the remote
+        :return: location of the (bare) cache repository
+        """
+        return os.path.join(self.cache_directory, f"{hashlib.sha256(url.encode()).hexdigest()[:32]}{_CACHE_SUFFIX}")
+
+
+def _format_gitrepo(url: str, branch: Optional[str], commit: str, parent: str) -> str:
+    """
+    Formats the content of a `.gitrepo` file.
+    :param url: url of the subrepo's remote
+    :param branch: the branch of the subrepo
+    :param commit: the (full) ID of the subrepo commit
+    :param parent: the (full) ID of the commit in the containing repository that the subrepo is based on
+    :return: the content
+    """
+    variables = [("remote", url), ("branch", branch or ""), ("commit", commit), ("parent", parent),
+                 ("method", GITREPO_METHOD), ("cmdver", GITREPO_VERSION)]
+    return _GITREPO_HEADER + "[subrepo]\n" + "".join(
+        f"\t{name} = {_format_value(value)}\n" for name, value in variables)
+
+
+def _format_value(value: str) -> str:
+    """
+    Formats a value in git's config file format, quoting it if required.
+    :param value: the value
+    :return: the formatted value
+    """
+    escaped = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n").replace("\t", "\\t")
+    if value != value.strip() or any(character in _SPECIAL_VALUE_CHARACTERS for character in value):
+        return f"\"{escaped}\""
+    return escaped
@@ -0,0 +1,223 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Optional, Iterable, List
+
+from gitcommonsync._common import get_remote_head_commit
+from gitcommonsync.models import Synchronisation, SubrepoSynchronisation
+from gitcommonsync.repository import GitCheckout
+
+_logger = logging.getLogger(__name__)
+
+GITREPO_FILE = ".gitrepo"
+GIT_DIRECTORY = ".git"
+SHORT_COMMIT_LENGTH = 7
+DEFAULT_RESOLUTION_PARALLELISM = 8
+
+_SUBREPO_SECTION = "subrepo"
+_REMOTE_KEY = "remote"
+_BRANCH_KEY = "branch"
+_COMMIT_KEY = "commit"
+
+_SECTION_PATTERN = re.compile(r"^\s*\[\s*([^\]\s\"]+)(?:\s+\"[^\"]*\")?\s*\]\s*(?:[;#].*)?$")
+_VARIABLE_PATTERN = re.compile(r"^\s*([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$")
+_ESCAPES = {"n": "\n", "t": "\t", "b": "\b", "\\": "\\", "\"": "\""}
+
+
+class NotASubrepoError(ValueError):
+    """
+    Raised when a directory is expected to contain a subrepo but does not.
+    """
+
+
+def read_subrepo(directory: str) -> GitCheckout:
+    """
+    Reads the metadata (`.gitrepo` file) of the subrepo in the given directory, without calling `git subrepo`.
+    :param directory: the directory containing the subrepo
+    :return: the checkout that the subrepo is of, with the full ID of the commit that was last pulled
+    :raises NotASubrepoError: if the directory does not contain a subrepo
+    """
+    location = os.path.join(directory, GITREPO_FILE)
+    try:
+        with open(location, "r") as file:
+            configuration = _parse_git_config(file.read())
+    except (FileNotFoundError, NotADirectoryError) as e:
+        raise NotASubrepoError(f"No subrepo in {directory}") from e
+    except ValueError as e:
+        raise NotASubrepoError(f"Invalid subrepo metadata in {location}: {e}") from e
+
+    subrepo = configuration.get(_SUBREPO_SECTION, {})
+    if _REMOTE_KEY not in subrepo:
+        raise NotASubrepoError(f"Invalid subrepo metadata in {location}: remote not defined")
+    commit = subrepo.get(_COMMIT_KEY) or None
+    return GitCheckout(subrepo[_REMOTE_KEY], subrepo.get(_BRANCH_KEY), directory, commit=commit)
+
+
+def get_subrepo_status(directory: str) -> Tuple[str, str, Optional[str]]:
+    """
+    Gets the status of the subrepo in the given directory, in the same form as `gitsubrepo.status`.
+    :param directory: the directory containing the subrepo
+    :return: tuple of the URL the subrepo tracks, the branch it tracks and the (short) ID of the commit last pulled
+    :raises NotASubrepoError: if the directory does not contain a subrepo
+    """
+    checkout = read_subrepo(directory)
+    commit = checkout.commit[0:SHORT_COMMIT_LENGTH] if checkout.commit is not None else None
+    return checkout.url, checkout.branch, commit
+
+
+def find_subrepos(location: str) -> Dict[str, GitCheckout]:
+    """
+    Finds and reads all of the subrepos in the given checkout, in a single pass of its directories.
+    :param location: location of the checkout
+    :return: the subrepos, indexed by their directory relative to the given location
+    """
+    subrepos: Dict[str, GitCheckout] = {}
+    for directory, directory_names, file_names in os.walk(location):
+        if GIT_DIRECTORY in directory_names:
+            directory_names.remove(GIT_DIRECTORY)
+        if GITREPO_FILE in file_names and directory != location:
+            relative_directory = os.path.relpath(directory, location)
+            try:
+                subrepo = read_subrepo(directory)
+            except NotASubrepoError:
+                continue
+            subrepo.directory = relative_directory
+            subrepos[relative_directory] = subrepo
+    return subrepos
+
+
+def resolve_subrepo_commits(synchronisations: Iterable[Synchronisation],
+                            parallelism: int=DEFAULT_RESOLUTION_PARALLELISM,
+                            resolved: Dict[Tuple[str, str], Optional[str]]=None) \
+        -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Resolves the head commit of the branch of each subrepo synchronisation that is not pinned to a commit (see
+    `pin_subrepo_commits` to pin the synchronisations to them).
+
+    Each distinct remote and branch is queried once (concurrently), so all synchronisations of the same subrepo use the
+    same commit. The commits of branches that do not exist, or of remotes that cannot be queried, are `None`.
+    :param synchronisations: the synchronisations, which are not changed
+    :param parallelism: the maximum number of remotes to query at the same time
+    :param resolved: optional commits already resolved, indexed by remote and branch, which are used rather than
+    querying the remotes again and are updated with those resolved. Allows synchronisations that are given in batches
+    to be resolved consistently
+    :return: the commit (full ID) resolved for each remote and branch or `None` if it could not be resolved
+    """
+    resolved = resolved if resolved is not None else {}
+    unpinned: Dict[Tuple[str, str], None] = {}
+    for synchronisation in synchronisations:
+        if isinstance(synchronisation, SubrepoSynchronisation) and synchronisation.checkout.commit is None:
+            unpinned.setdefault((synchronisation.checkout.url, synchronisation.checkout.branch), None)
+    if len(unpinned) == 0:
+        return {}
+
+    def resolve(key: Tuple[str, str]) -> Optional[str]:
+        try:
+            return get_remote_head_commit(*key)
+        except Exception as e:
+            # Left to fail when the subrepo is synchronised, so the failure is attributed to the affected repositories
+            _logger.warning(f"Could not resolve commit of subrepo {key[0]} ({key[1]}): {e}")
+            return None
+
+    unresolved = [key for key in unpinned.keys() if key not in resolved]
+    if len(unresolved) > 0:
+        with ThreadPoolExecutor(max_workers=min(parallelism, len(unresolved))) as executor:
+            for (url, branch), commit in zip(unresolved, executor.map(resolve, unresolved)):
+                if commit is not None:
+                    _logger.info(f"Resolved subrepo {url} ({branch}) to {commit}")
+                resolved[(url, branch)] = commit
+
+    return {key: resolved[key] for key in unpinned.keys()}
+
+
+def pin_subrepo_commits(synchronisations: Iterable[Synchronisation],
+                        commits: Dict[Tuple[str, str], Optional[str]]) -> List[Synchronisation]:
+    """
+    Pins each subrepo synchronisation that is not pinned to a commit to the commit of its remote and branch.
+
+    The synchronisations are hashable, so they are not changed: copies of those that are pinned are returned instead.
+    :param synchronisations: the synchronisations
+    :param commits: the commits (full IDs) to pin to, indexed by remote and branch (e.g. as returned by
+    `resolve_subrepo_commits`). Subrepos with no (or a `None`) commit are left unpinned
+    :return: the synchronisations, in the given order, with copies of the subrepo synchronisations that were pinned
+    """
+    pinned: List[Synchronisation] = []
+    for synchronisation in synchronisations:
+        if isinstance(synchronisation, SubrepoSynchronisation) and synchronisation.checkout.commit is None:
+            checkout = synchronisation.checkout
+            commit = commits.get((checkout.url, checkout.branch))
+            if commit is not None:
+                synchronisation = SubrepoSynchronisation(
+                    GitCheckout(checkout.url, checkout.branch, checkout.directory, commit=commit),
+                    overwrite=synchronisation.overwrite)
+        pinned.append(synchronisation)
+    return pinned
+
+
+def is_same_commit(commit: Optional[str], other_commit: Optional[str]) -> bool:
+    """
+    Whether the given commit IDs refer to the same commit, where either may be abbreviated (e.g. as returned by
+    `get_subrepo_status`).
+    :param commit: a commit ID
+    :param other_commit: another commit ID
+    :return: whether the same commit (`False` if either is `None`)
+    """
+    if commit is None or other_commit is None:
+        return False
+    return commit.startswith(other_commit) or other_commit.startswith(commit)
+
+
+def _parse_git_config(content: str) -> Dict[str, Dict[str, str]]:
+    """
+    Parses the given content in git's config file format (which `.gitrepo` files use).
+
+    Subsections are merged into their section and, if a variable is defined more than once, the last definition is used.
+    :param content: the content to parse
+    :return: the variables, indexed by section and then (lower case) name
+    """
+    configuration: Dict[str, Dict[str, str]] = {}
+    section: Optional[Dict[str, str]] = None
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped == "" or stripped[0] in ";#":
+            continue
+        match = _SECTION_PATTERN.match(line)
+        if match is not None:
+            section = configuration.setdefault(match.group(1).lower(), {})
+            continue
+        match = _VARIABLE_PATTERN.match(line)
+        if match is None or section is None:
+            raise ValueError(f"Invalid git config line: {line}")
+        value = match.group(2)
+        section[match.group(1).lower()] = _parse_value(value) if value is not None else "true"
+    return configuration
+
+
+def _parse_value(value: str) -> str:
+    """
+    Parses a git config value, removing quotes, escapes and trailing comments.
+    :param value: the raw value
+    :return: the parsed value
+    """
+    parsed = []
+    # Whitespace after the last quoted or escaped character is trailing whitespace, which is removed
+    preserved_length = 0
+    quoted = False
+    index = 0
+    while index < len(value):
+        character = value[index]
+        if character == "\\" and index + 1 < len(value):
+            index += 1
+            parsed.append(_ESCAPES.get(value[index], value[index]))
+            preserved_length = len(parsed)
+        elif character == "\"":
+            quoted = not quoted
+        elif character in ";#" and not quoted:
+            break
+        else:
+            parsed.append(character)
+            if quoted:
+                preserved_length = len(parsed)
+        index += 1
+    return "".join(parsed[:preserved_length]) + "".join(parsed[preserved_length:]).rstrip()
@@ -1,16 +1,21 @@
 import logging
 import os
 import shutil
+import time
 from abc import ABCMeta, abstractmethod
-from typing import List, Dict, Callable, TypeVar, Generic, Tuple
+from typing import List, Dict, Callable, TypeVar, Generic, Tuple, Optional, TYPE_CHECKING
 
-import gitsubrepo
-
-from gitcommonsync._ansible_runner import ANSIBLE_RSYNC_MODULE_NAME, ANSIBLE_TEMPLATE_MODULE_NAME, \
-    run_ansible
-from gitcommonsync._common import is_subdirectory, get_head_commit
+from gitcommonsync._ansible_runner import ANSIBLE_TEMPLATE_MODULE_NAME, run_ansible
+from gitcommonsync._common import is_subdirectory, get_head_commit, get_remote_head_commit
+from gitcommonsync.blobs import IndexSnapshot, SHA1_OBJECT_FORMAT
+from gitcommonsync.copying import StagingArea, synchronise_path
 from gitcommonsync.repository import GitRepository, GitCheckout
 from gitcommonsync.models import FileSynchronisation, SubrepoSynchronisation, TemplateSynchronisation, Synchronisation
+from gitcommonsync.rendering import RenderCache, RenderedTemplate, render_template
+from gitcommonsync.subrepos import get_subrepo_status, NotASubrepoError, is_same_commit, read_subrepo
+
+if TYPE_CHECKING:
+    from gitcommonsync.subrepo_engine import NativeSubrepoEngine
 
 _logger = logging.getLogger(__name__)
 
@@ -18,6 +23,39 @@ Synchronisable = TypeVar("Synchronisable", bound=Synchronisation)
 FileBasedSynchronisable = TypeVar("FileBasedSynchronisable", bound=FileSynchronisation)
 
 
+class SynchronisationResult:
+    """
+    Result of applying a single synchronisation to a repository.
+    """
+    __slots__ = ("repository", "synchronisation", "synchronised", "reason", "duration", "commit")
+
+    def __init__(self, repository: GitRepository, synchronisation: Synchronisation, synchronised: bool, reason: str,
+                 duration: float, commit: str=None):
+        """
+        Constructor.
+        :param repository: the repository the synchronisation was applied to
+        :param synchronisation: the synchronisation
+        :param synchronised: whether the synchronisation changed the repository
+        :param reason: human readable reason for the synchronisation changing the repository or not
+        :param duration: the time (in seconds) taken to apply the synchronisation
+        :param commit: the (full) ID of the head commit once the change was committed (so a commit that contains it), if
+        the synchronisation changed the repository and the change was committed
+        """
+        self.repository = repository
+        self.synchronisation = synchronisation
+        self.synchronised = synchronised
+        self.reason = reason
+        self.duration = duration
+        self.commit = commit
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.synchronisation!r}, synchronised={self.synchronised}, " \
+               f"reason={self.reason!r})"
+
+
+SynchronisationListener = Callable[[SynchronisationResult], None]
+
+
 class Synchroniser(Generic[Synchronisable], metaclass=ABCMeta):
     """
     Synchroniser.
@@ -37,24 +75,36 @@ class Synchroniser(Generic[Synchronisable], metaclass=ABCMeta):
         """
         self.repository = repository
 
-    def synchronise(self, synchronisables: List[Synchronisable], dry_run: bool=False) -> List[Synchronisable]:
+    def synchronise(self, synchronisables: List[Synchronisable], dry_run: bool=False,
+                    listener: SynchronisationListener=None) -> List[Synchronisable]:
         """
         Synchronise the repository with the given synchronisation.
         :param synchronisables: the synchronisations to apply
         :param dry_run: will not push changes to the repote if `True`
+        :param listener: optional listener that is given the result of each synchronisation, once the changes have been
+        saved (so that the result has the commit)
         :return: a list of the synchronisations that have been applied
         """
         synchronised: List[Synchronisable] = []
+        outcomes: List[Tuple[Synchronisable, bool, str, float]] = []
         for synchronisable in synchronisables:
+            started = time.monotonic()
             self._prepare_for_synchronise(synchronisable)
             was_synchronised, reason = self._synchronise(synchronisable)
-            # TODO: Do something useful with the reasons
+            _logger.debug(reason)
+            outcomes.append((synchronisable, was_synchronised, reason, time.monotonic() - started))
             if was_synchronised:
                 synchronised.append(synchronisable)
 
         if len(synchronised) > 0 and not dry_run:
             self._save(synchronised)
 
+        if listener is not None:
+            commit = self.repository.get_head() if len(synchronised) > 0 and not dry_run else None
+            for synchronisable, was_synchronised, reason, duration in outcomes:
+                listener(SynchronisationResult(self.repository, synchronisable, was_synchronised, reason, duration,
+                                               commit if was_synchronised else None))
+
         return synchronised
 
     def _prepare_for_synchronise(self, synchronisable: Synchronisable):
@@ -88,21 +138,45 @@ class SubrepoSynchroniser(Synchroniser[SubrepoSynchronisation]):
     """
     Subrepo synchroniser.
     """
+    def __init__(self, repository: GitRepository, engine: "NativeSubrepoEngine"=None):
+        """
+        Constructor.
+        :param repository: the git repository to synchronise
+        :param engine: optional engine that updates subrepos in place without using `git subrepo`. If `None`, `git
+        subrepo` is used
+        """
+        super().__init__(repository)
+        self.engine = engine
+
     def _synchronise(self, synchronisable: SubrepoSynchronisation) -> Tuple[bool, str]:
+        if self.engine is not None:
+            return self._synchronise_with_engine(synchronisable)
+
+        # Only imported when subrepos are synchronised
+        import gitsubrepo
+
         destination = os.path.join(self.repository.checkout_location, synchronisable.destination)
         required_checkout = synchronisable.checkout
+        # Not pinned in place, as the checkout is hashed
+        required_commit = required_checkout.commit
         force_update = False
 
         if os.path.exists(destination):
-            url, branch, commit = gitsubrepo.status(destination)
+            try:
+                # Reads the subrepo's metadata directly, rather than calling `git subrepo status`
+                url, branch, commit = get_subrepo_status(destination)
+            except NotASubrepoError as e:
+                from gitsubrepo.exceptions import NotAGitSubrepoException
+                raise NotAGitSubrepoException(destination) from e
             current_checkout = GitCheckout(url, branch, required_checkout.directory, commit=commit)
             same_url_and_branch = current_checkout.url == required_checkout.url \
                                   and current_checkout.branch == required_checkout.branch
 
-            if required_checkout.commit is None and same_url_and_branch:
-                required_checkout.commit = get_head_commit(url, branch)
+            if required_commit is None and same_url_and_branch:
+                required_commit = get_head_commit(url, branch)
 
-            if current_checkout == required_checkout:
+            # Compares commits by prefix, as the commit of the existing subrepo is abbreviated
+            if same_url_and_branch and is_same_commit(current_checkout.commit, required_commit):
                 return False, f"Subrepo at {required_checkout.directory} is synchronised"
             elif not synchronisable.overwrite:
                 return False, f"Subrepo at {required_checkout.directory} is not synchronised but not updating as " \
@@ -112,7 +186,7 @@ class SubrepoSynchroniser(Synchroniser[SubrepoSynchronisation]):
                 # TODO: We could check whether the remote's head is the commit we want before doing this as it might not
                 # pull to the correct commit
                 new_commit = gitsubrepo.pull(destination)
-                if new_commit == required_checkout.commit:
+                if is_same_commit(new_commit, required_commit):
                     return True, f"Subrepo at {required_checkout.directory}: {commit} => {new_commit}"
                 else:
                     force_update = True
@@ -127,16 +201,51 @@ class SubrepoSynchroniser(Synchroniser[SubrepoSynchronisation]):
 
         assert not os.path.exists(destination)
         new_commit = gitsubrepo.clone(
-            required_checkout.url, destination, branch=required_checkout.branch, commit=required_checkout.commit,
+            required_checkout.url, destination, branch=required_checkout.branch, commit=required_commit,
             author_name=self.repository.author_name, author_email=self.repository.author_email)
-        assert new_commit != required_checkout.commit
+        assert required_commit is None or is_same_commit(new_commit, required_commit)
         return True, f"Checked out subrepo: {required_checkout} (forced updated={force_update})"
 
+    def _synchronise_with_engine(self, synchronisable: SubrepoSynchronisation) -> Tuple[bool, str]:
+        """
+        Synchronises the given subrepo using the native engine, which updates an existing subrepo in place (in a single
+        commit) rather than removing and re-cloning it.
+        :param synchronisable: see `Synchroniser.synchronise`
+        :return: see `Synchroniser.synchronise`
+        """
+        destination = os.path.join(self.repository.checkout_location, synchronisable.destination)
+        required_checkout = synchronisable.checkout
+
+        if os.path.exists(destination):
+            current_checkout = read_subrepo(destination)
+            if current_checkout.url == required_checkout.url and current_checkout.branch == required_checkout.branch:
+                required_commit = required_checkout.commit if required_checkout.commit is not None \
+                    else get_remote_head_commit(required_checkout.url, required_checkout.branch)
+                if is_same_commit(current_checkout.commit, required_commit):
+                    return False, f"Subrepo at {required_checkout.directory} is synchronised"
+            if not synchronisable.overwrite:
+                return False, f"Subrepo at {required_checkout.directory} is not synchronised but not updating as " \
+                              f"overwrite=False"
+
+        new_commit = self.engine.checkout(self.repository, required_checkout)
+        return True, f"Checked out subrepo: {required_checkout} at {new_commit}"
+
 
 class FileBasedSynchroniser(Generic[FileBasedSynchronisable], Synchroniser[FileBasedSynchronisable], metaclass=ABCMeta):
     """
     Base class for any synchronisater that deals with individual files.
+
+    The content to synchronise is compared against the blob IDs in the checkout's index, so that files that are already
+    up to date are neither read nor rewritten in the working tree (and so not re-hashed by git when committed).
     """
+    def __init__(self, repository: GitRepository):
+        """
+        Constructor.
+        :param repository: see `Synchroniser.__init__`
+        """
+        super().__init__(repository)
+        self._index: Optional[IndexSnapshot] = None
+
     @abstractmethod
     def _synchronise_file(self, synchronisation: FileSynchronisation) -> Tuple[bool, str]:
         """
@@ -153,6 +262,12 @@ class FileBasedSynchroniser(Generic[FileBasedSynchronisable], Synchroniser[FileB
             raise ValueError(f"Sources cannot be relative: {synchronisable.source}")
         return super()._prepare_for_synchronise(synchronisable)
 
+    def synchronise(self, synchronisables: List[FileBasedSynchronisable], dry_run: bool=False,
+                    listener: SynchronisationListener=None) -> List[FileBasedSynchronisable]:
+        # The index changes when the synchronised files are committed
+        self._index = None
+        return super().synchronise(synchronisables, dry_run, listener)
+
     def _synchronise(self, synchronisable: FileSynchronisation) -> Tuple[bool, str]:
         destination = os.path.join(self.repository.checkout_location, synchronisable.destination)
         target = os.path.join(self.repository.checkout_location, destination)
@@ -160,7 +275,20 @@ class FileBasedSynchroniser(Generic[FileBasedSynchronisable], Synchroniser[FileB
         if os.path.exists(target) and not synchronisable.overwrite:
             return False, f"{synchronisable.source} != {target} (overwrite={synchronisable.overwrite})"
 
-        return self._synchronise_file(synchronisable)
+        changed, reason = self._synchronise_file(synchronisable)
+        if changed:
+            # Files in the working tree that have been written to no longer match their blob in the index
+            self._get_index().discard(target)
+        return changed, reason
+
+    def _get_index(self) -> IndexSnapshot:
+        """
+        Gets the snapshot of the checkout's index, loading it when first required.
+        :return: the index snapshot
+        """
+        if self._index is None:
+            self._index = IndexSnapshot.load(self.repository.checkout_location, self.repository.session.git)
+        return self._index
 
     def _save(self, synchronised: List[Synchronisable]):
         self.repository.commit(f"Synchronised {len(synchronised)} file{'' if len(synchronised) == 1 else 's'} "
@@ -205,16 +333,32 @@ class _AnsibleFileBasedSynchroniser(Generic[Synchronisable], FileBasedSynchronis
             return False, f"{synchronisation.source} == {target}"
 
 
-class FileSynchroniser(_AnsibleFileBasedSynchroniser[FileSynchronisation]):
+class FileSynchroniser(FileBasedSynchroniser[FileSynchronisation]):
     """
     File synchroniser.
+
+    Files are synchronised with the semantics of `rsync --recursive --delete --perms --links --checksum`, copying with
+    the cheapest method available (see `copying.copy_file`).
     """
-    _ANSIBLE_ACTION_GENERATOR = lambda synchronisation, target: (ANSIBLE_RSYNC_MODULE_NAME,
-                                dict(src=synchronisation.source, dest=target, recursive=True, delete=True,
-                                     archive=False, perms=True, links=True, checksum=True))
+    def __init__(self, repository: GitRepository, staging_area: StagingArea=None):
+        """
+        Constructor.
+        :param repository: see `Synchroniser.__init__`
+        :param staging_area: optional staging area to hardlink files from, rather than copying them
+        """
+        super().__init__(repository)
+        self.staging_area = staging_area
 
-    def __init__(self, repository: GitRepository):
-        super().__init__(repository, FileSynchroniser._ANSIBLE_ACTION_GENERATOR)
+    def _synchronise_file(self, synchronisation: FileSynchronisation) -> Tuple[bool, str]:
+        destination = os.path.join(self.repository.checkout_location, synchronisation.destination)
+        target = os.path.join(self.repository.checkout_location, destination)
+
+        if synchronise_path(synchronisation.source, target, staging_area=self.staging_area,
+                            is_same_content=self._get_index().is_same_content,
+                            path_filter=synchronisation.path_filter):
+            return True, f"{synchronisation.source} => {target} (overwrite={synchronisation.overwrite})"
+        else:
+            return False, f"{synchronisation.source} == {target}"
 
 
 class TemplateSynchroniser(_AnsibleFileBasedSynchroniser[TemplateSynchronisation]):
@@ -225,6 +369,47 @@ class TemplateSynchroniser(_AnsibleFileBasedSynchroniser[TemplateSynchronisation
                                                                  dict(src=synchronisation.source, dest=target))
     _ANSIBLE_VARIABLES_GENERATOR = lambda synchronisation: synchronisation.variables
 
-    def __init__(self, repository: GitRepository):
+    def __init__(self, repository: GitRepository, render_cache: RenderCache=None):
+        """
+        Constructor.
+        :param repository: see `Synchroniser.__init__`
+        :param render_cache: optional cache of rendered templates, used to compare unchanged templates with the files in
+        the checkout without rendering them again
+        """
         super().__init__(repository, TemplateSynchroniser._ANSIBLE_ACTION_GENERATOR,
                          TemplateSynchroniser._ANSIBLE_VARIABLES_GENERATOR)
+        self.render_cache = render_cache
+
+    def _synchronise_file(self, synchronisation: TemplateSynchronisation) -> Tuple[bool, str]:
+        destination = os.path.join(self.repository.checkout_location, synchronisation.destination)
+        target = os.path.join(self.repository.checkout_location, destination)
+
+        if self.render_cache is not None:
+            rendered = self.render_cache.render(synchronisation.source, synchronisation.variables)
+        else:
+            content = render_template(synchronisation.source, synchronisation.variables)
+            rendered = RenderedTemplate(content) if content is not None else None
+
+        if rendered is not None:
+            index = self._get_index()
+            same_content = index.is_same_rendered_content(
+                rendered.content, target, rendered.blob_id if index.object_format == SHA1_OBJECT_FORMAT else None)
+            if same_content is None:
+                same_content = _has_content(target, rendered.content)
+            if same_content:
+                return False, f"{synchronisation.source} == {target}"
+        return super()._synchronise_file(synchronisation)
+
+
+def _has_content(location: str, content: bytes) -> bool:
+    """
+    Whether the file at the given location has the given content.
+    :param location: location of the file
+    :param content: the content
+    :return: whether the file exists and has the content
+    """
+    if not os.path.isfile(location) or os.path.islink(location) or os.path.getsize(location) != len(content):
+        return False
+    with open(location, "rb") as file:
+        return file.read() == content
+
@@ -0,0 +1,183 @@
+import base64
+import hashlib
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from typing import Dict, Tuple, Optional, Any
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from gitcommonsync.blobs import get_content_blob_id
+
+REGULAR_FILE_MODE = "100644"
+EXECUTABLE_FILE_MODE = "100755"
+
+_PROJECT_PATTERN = re.compile(r"^/api/v4/projects/(?P<project>[^/]+)(?P<path>/.*)?$")
+_BRANCH_PATTERN = re.compile(r"^/repository/branches/(?P<branch>[^/]+)$")
+
+
+class StubProject:
+    """
+    In-memory project of the stub server, where each branch is a mapping from file path to mode and content.
+    """
+    def __init__(self, default_branch: Optional[str]="master"):
+        self.default_branch = default_branch
+        self.branches: Dict[str, Dict[str, Tuple[str, bytes]]] = {}
+        self.heads: Dict[str, str] = {}
+        self.commits = 0
+
+    def set_branch(self, branch: str, files: Dict[str, Tuple[str, bytes]]):
+        """
+        Sets the files on the given branch (as if committed).
+        :param branch: the branch
+        :param files: the mode and content of each file, where keys are paths
+        """
+        self.branches[branch] = dict(files)
+        self.heads[branch] = hashlib.sha1(repr(sorted(files.items())).encode()).hexdigest()
+
+
+class StubGitLabServer:
+    """
+    Local stand-in for the subset of GitLab's REST API (v4) used by `ApiRepository`, for testing offline.
+    """
+    def __init__(self, token: str=None):
+        """
+        Constructor.
+        :param token: token that requests must have (any if `None`)
+        """
+        self.token = token
+        self.projects: Dict[str, StubProject] = {}
+        self.connections = 0
+        self.requests = 0
+        self._lock = Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method: str):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length).decode("utf-8")) if length > 0 else None
+                with stub._lock:
+                    stub.requests += 1
+                    if stub.token is not None and self.headers.get("PRIVATE-TOKEN") != stub.token:
+                        status, content, headers = 401, {"message": "401 Unauthorized"}, {}
+                    else:
+                        status, content, headers = stub._route(method, self.path, body)
+                encoded = json.dumps(content).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/v4"
+
+    def start(self):
+        """
+        Starts serving requests in the background.
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _route(self, method: str, url: str, body: Any) -> Tuple[int, Any, Dict[str, str]]:
+        parts = urlsplit(url)
+        match = _PROJECT_PATTERN.match(parts.path)
+        if match is None or unquote(match.group("project")) not in self.projects:
+            return 404, {"message": "404 Project Not Found"}, {}
+        project = self.projects[unquote(match.group("project"))]
+        path = match.group("path") or ""
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        if method == "GET" and path == "":
+            return 200, {"default_branch": project.default_branch}, {}
+        branch_match = _BRANCH_PATTERN.match(path)
+        if method == "GET" and branch_match is not None:
+            branch = unquote(branch_match.group("branch"))
+            if branch not in project.branches:
+                return 404, {"message": "404 Branch Not Found"}, {}
+            return 200, {"name": branch, "commit": {"id": project.heads[branch]}}, {}
+        if method == "GET" and path == "/repository/tree":
+            return self._get_tree(project, query)
+        if method == "POST" and path == "/repository/commits":
+            return self._commit(project, body)
+        return 404, {"message": "404 Not Found"}, {}
+
+    @staticmethod
+    def _get_tree(project: StubProject, query: Dict[str, str]) -> Tuple[int, Any, Dict[str, str]]:
+        if query.get("ref") not in project.branches:
+            return 404, {"message": "404 Tree Not Found"}, {}
+        files = project.branches[query["ref"]]
+        entries = []
+        directories = sorted({"/".join(path.split("/")[0:i]) for path in files for i in range(1, path.count("/") + 1)})
+        for directory in directories:
+            entries.append({"id": "0" * 40, "name": directory.rsplit("/", 1)[-1], "type": "tree", "path": directory,
+                            "mode": "040000"})
+        for path, (mode, content) in sorted(files.items()):
+            entries.append({"id": get_content_blob_id(content), "name": path.rsplit("/", 1)[-1], "type": "blob",
+                            "path": path, "mode": mode})
+        per_page, page = int(query.get("per_page", 20)), int(query.get("page", 1))
+        headers = {"X-Next-Page": str(page + 1) if page * per_page < len(entries) else ""}
+        return 200, entries[(page - 1) * per_page:page * per_page], headers
+
+    @staticmethod
+    def _commit(project: StubProject, body: Dict[str, Any]) -> Tuple[int, Any, Dict[str, str]]:
+        branch = body["branch"]
+        if branch in project.branches:
+            files = dict(project.branches[branch])
+        elif "start_branch" in body:
+            if body["start_branch"] not in project.branches:
+                return 400, {"message": "Start branch not found"}, {}
+            files = dict(project.branches[body["start_branch"]])
+        elif len(project.branches) == 0:
+            files = {}
+        else:
+            return 400, {"message": "You can only create or edit files when you are on a branch"}, {}
+
+        for action in body["actions"]:
+            path = action["file_path"]
+            mode = EXECUTABLE_FILE_MODE if action.get("execute_filemode") else REGULAR_FILE_MODE
+            exists = path in files
+            if action["action"] == "create" and exists or action["action"] != "create" and not exists:
+                return 400, {"message": f"A file with this name {'already' if exists else 'does not'} exist"}, {}
+            if action["action"] == "delete":
+                del files[path]
+            elif action["action"] == "chmod":
+                files[path] = (mode, files[path][1])
+            else:
+                content = action["content"]
+                files[path] = (mode, base64.b64decode(content) if action.get("encoding") == "base64"
+                               else content.encode("utf-8"))
+
+        project.set_branch(branch, files)
+        project.commits += 1
+        return 201, {"id": project.heads[branch], "message": body["commit_message"]}, {}
@@ -0,0 +1,117 @@
+import os
+import re
+import unittest
+import uuid
+from typing import Any, Dict
+from unittest.mock import patch
+
+from ansible import constants
+from git import Repo
+
+from gitcommonsync.ansible_action import ActionModule, _BATCH_FILE_PREFIX
+from gitcommonsync.ansible_module import SYNCHRONISED_RETURN_PROPERTY, CHANGED_FILES_RETURN_PROPERTY
+from gitcommonsync.tests._common import TestWithGitRepository
+from gitcommonsync.tests.resources.information import MASTER_BRANCH
+
+_HOST_1 = "host-1"
+_HOST_2 = "host-2"
+_HOST_3 = "host-3"
+_VARIABLE_PATTERN = re.compile(r"{{ (\w+) }}")
+
+
+class _StubTemplar:
+    """
+    Templar that substitutes `{{ name }}` with the value of the variable.
+    """
+    def __init__(self):
+        self.available_variables: Dict[str, Any] = {}
+
+    def template(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return _VARIABLE_PATTERN.sub(lambda match: self.available_variables[match.group(1)], value)
+        if isinstance(value, list):
+            return [self.template(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.template(item) for key, item in value.items()}
+        return value
+
+
+class _StubTask:
+    """
+    Task that runs if the variable named in its conditional is true.
+    """
+    def __init__(self, args: Dict[str, Any], raw_args: Dict[str, Any]):
+        self.args = args
+        self.raw_args = raw_args
+        self.when = ["enabled"]
+        self.check_mode = False
+        self.collections = None
+        self._uuid = uuid.uuid4().hex
+
+    def get_ds(self) -> Dict[str, Any]:
+        return {"gitcommonsync": self.raw_args, "when": self.when}
+
+    def evaluate_conditional(self, templar: _StubTemplar, all_vars: Dict[str, Any]) -> bool:
+        return all(all_vars[conditional] for conditional in self.when)
+
+
+class TestActionModule(TestWithGitRepository):
+    """
+    Tests for the `gitcommonsync` action plugin.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.source, _ = self.create_test_file()
+        raw_args = {"repository": self.external_git_repository_location, "branch": MASTER_BRANCH,
+                    "files": [{"src": self.source, "dest": "{{ destination }}"}]}
+        host_variables = {_HOST_1: {"destination": f"{_HOST_1}.txt", "enabled": True},
+                          _HOST_2: {"destination": f"{_HOST_2}.txt", "enabled": True},
+                          _HOST_3: {"destination": f"{_HOST_3}.txt", "enabled": False}}
+        self.task_vars = {"inventory_hostname": _HOST_1, "ansible_play_batch": [_HOST_1, _HOST_2, _HOST_3],
+                          "hostvars": host_variables, **host_variables[_HOST_1]}
+
+        templar = _StubTemplar()
+        templar.available_variables = self.task_vars
+        self.action = object.__new__(ActionModule)
+        self.action._task = _StubTask(templar.template(raw_args), raw_args)
+        self.action._templar = templar
+        parser_patch = patch("gitcommonsync.ansible_action.ModuleArgsParser")
+        parser_patch.start().return_value.parse.return_value = ("gitcommonsync", raw_args, None)
+        self.addCleanup(parser_patch.stop)
+
+    def test_get_batch_hosts(self):
+        self.assertEqual([_HOST_1, _HOST_2], self.action._get_batch_hosts(_HOST_1, self.task_vars))
+
+    def test_synchronise_batch(self):
+        host_results = self.action._synchronise_batch([_HOST_1, _HOST_2], _HOST_1, self.task_vars)
+        self.assertEqual({_HOST_1, _HOST_2}, set(host_results.keys()))
+        for host in (_HOST_1, _HOST_2):
+            self.assertTrue(host_results[host]["changed"])
+            self.assertEqual([f"{host}.txt"],
+                             host_results[host][SYNCHRONISED_RETURN_PROPERTY][CHANGED_FILES_RETURN_PROPERTY])
+
+        head = Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit
+        self.assertIn(f"{_HOST_1}.txt", head.tree)
+        self.assertIn(f"{_HOST_2}.txt", head.tree)
+        self.assertNotIn(f"{_HOST_3}.txt", head.tree)
+        self.assertNotIn(f"{_HOST_1}.txt", head.parents[0].tree)
+
+    def test_take_batch_result(self):
+        hosts = self.action._get_batch_hosts(_HOST_1, self.task_vars)
+        head = Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit
+        host_result = self.action._take_batch_result(hosts, _HOST_1, self.task_vars)
+        self.assertTrue(host_result["changed"])
+
+        synchronised_head = Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit
+        self.assertEqual(head, synchronised_head.parents[0])
+        with patch.object(self.action, "_synchronise_batch") as synchronise_batch:
+            host_result = self.action._take_batch_result(hosts, _HOST_2, self.task_vars)
+        synchronise_batch.assert_not_called()
+        self.assertTrue(host_result["changed"])
+        self.assertEqual([], [name for name in os.listdir(constants.DEFAULT_LOCAL_TMP)
+                              if name.startswith(f"{_BATCH_FILE_PREFIX}{self.action._task._uuid}")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,244 @@
+import json
+import os
+import shutil
+import stat
+import unittest
+from http.client import RemoteDisconnected
+from tempfile import mkdtemp
+from unittest.mock import MagicMock, patch
+
+from gitcommonsync.api import ApiRepository, ApiSynchroniser, HttpConnectionPool, ApiError, REGULAR_FILE_MODE, \
+    EXECUTABLE_FILE_MODE
+from gitcommonsync.helpers import synchronise, synchronise_repositories
+from gitcommonsync.models import FileSynchronisation, TemplateSynchronisation, SubrepoSynchronisation
+from gitcommonsync.repository import GitCheckout
+from gitcommonsync.tests._api_server import StubGitLabServer, StubProject
+from gitcommonsync.tests._common import TEMPLATE, TEMPLATE_VARIABLES, NEW_FILE_1, NEW_DIRECTORY_1
+
+_PROJECT = "group/project"
+_TOKEN = "token"
+_BRANCH = "master"
+
+
+class _TestWithStubServer(unittest.TestCase):
+    """
+    Base class for tests against the stub API server.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+        self.server = StubGitLabServer(token=_TOKEN)
+        self.server.start()
+        self.project = StubProject()
+        self.project.set_branch(_BRANCH, {"README.md": (REGULAR_FILE_MODE, b"readme\n"),
+                                          f"{NEW_DIRECTORY_1}/old.txt": (REGULAR_FILE_MODE, b"old\n")})
+        self.server.projects[_PROJECT] = self.project
+        self.pool = HttpConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+        shutil.rmtree(self.temp_directory)
+
+    def create_repository(self, branch: str=_BRANCH, **kwargs) -> ApiRepository:
+        return ApiRepository(self.server.api_url, _PROJECT, branch, token=_TOKEN, pool=self.pool, **kwargs)
+
+    def create_file(self, name: str, content: str, directory: str=None) -> str:
+        location = os.path.join(directory if directory is not None else self.temp_directory, name)
+        with open(location, "w") as file:
+            file.write(content)
+        return location
+
+
+class TestApiRepository(_TestWithStubServer):
+    """
+    Tests for `ApiRepository`.
+    """
+    def test_get_tree(self):
+        self.project.set_branch(_BRANCH, {f"file-{i}": (REGULAR_FILE_MODE, b"") for i in range(250)})
+        self.assertEqual(250, len(self.create_repository().get_tree()))
+
+    def test_get_tree_of_missing_branch(self):
+        self.assertEqual({}, self.create_repository("other", create_branch=False).get_tree())
+
+    def test_get_tree_of_branch_to_create(self):
+        self.assertEqual(self.create_repository().get_tree(), self.create_repository("other").get_tree())
+
+    def test_get_remote_head(self):
+        self.assertEqual(self.project.heads[_BRANCH], self.create_repository().get_remote_head())
+        self.assertIsNone(self.create_repository("other").get_remote_head())
+
+    def test_unauthorised(self):
+        repository = ApiRepository(self.server.api_url, _PROJECT, _BRANCH, pool=self.pool)
+        with self.assertRaises(ApiError) as context:
+            repository.get_tree()
+        self.assertEqual(401, context.exception.status)
+
+    def test_connections_reused(self):
+        repository = self.create_repository()
+        for _ in range(5):
+            repository.get_remote_head()
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(1, self.pool.connections_made)
+
+
+class TestHttpConnectionPool(unittest.TestCase):
+    """
+    Tests for `HttpConnectionPool`.
+    """
+    def setUp(self):
+        self.pool = HttpConnectionPool()
+        self.closed_connection = MagicMock()
+        self.closed_connection.getresponse.side_effect = RemoteDisconnected()
+        self.connection = MagicMock()
+        self.connection.getresponse.return_value.status = 200
+        self.connection.getresponse.return_value.will_close = True
+        self.connection.getresponse.return_value.getheaders.return_value = []
+        self.connection.getresponse.return_value.read.return_value = b""
+
+    def test_idempotent_request_retried_on_closed_connection(self):
+        with patch.object(self.pool, "_acquire", side_effect=[(self.closed_connection, True),
+                                                               (self.connection, False)]):
+            self.assertEqual(200, self.pool.request("GET", "http://example.com/")[0])
+        self.connection.request.assert_called_once()
+
+    def test_request_not_retried_once_sent(self):
+        with patch.object(self.pool, "_acquire", side_effect=[(self.closed_connection, True),
+                                                               (self.connection, False)]):
+            self.assertRaises(RemoteDisconnected, self.pool.request, "POST", "http://example.com/", b"{}")
+        self.connection.request.assert_not_called()
+
+    def test_request_retried_if_not_sent(self):
+        self.closed_connection.request.side_effect = BrokenPipeError()
+        with patch.object(self.pool, "_acquire", side_effect=[(self.closed_connection, True),
+                                                               (self.connection, False)]):
+            self.assertEqual(200, self.pool.request("POST", "http://example.com/", b"{}")[0])
+        self.connection.request.assert_called_once()
+
+
+class TestApiSynchroniser(_TestWithStubServer):
+    """
+    Tests for `ApiSynchroniser`.
+    """
+    def test_synchronise_file(self):
+        source = self.create_file("source", "content")
+        os.chmod(source, os.stat(source).st_mode | stat.S_IXUSR)
+        synchronisation = FileSynchronisation(source, NEW_FILE_1)
+        synchronised = ApiSynchroniser(self.create_repository()).synchronise([synchronisation])
+        self.assertEqual([synchronisation], synchronised)
+        self.assertEqual((EXECUTABLE_FILE_MODE, b"content"), self.project.branches[_BRANCH][NEW_FILE_1])
+        self.assertEqual(1, self.project.commits)
+
+    def test_synchronise_up_to_date_file(self):
+        source = self.create_file("source", "readme\n")
+        synchronised = ApiSynchroniser(self.create_repository()).synchronise(
+            [FileSynchronisation(source, "README.md", overwrite=True)])
+        self.assertEqual([], synchronised)
+        self.assertEqual(0, self.project.commits)
+
+    def test_synchronise_without_overwrite(self):
+        source = self.create_file("source", "changed")
+        synchronised = ApiSynchroniser(self.create_repository()).synchronise(
+            [FileSynchronisation(source, "README.md", overwrite=False)])
+        self.assertEqual([], synchronised)
+        self.assertEqual(b"readme\n", self.project.branches[_BRANCH]["README.md"][1])
+
+    def test_synchronise_directory(self):
+        directory = os.path.join(self.temp_directory, NEW_DIRECTORY_1)
+        os.makedirs(os.path.join(directory, "sub"))
+        self.create_file("new.txt", "new", directory)
+        self.create_file("nested.txt", "nested", os.path.join(directory, "sub"))
+        self.create_file("ignored.log", "ignored", directory)
+        ApiSynchroniser(self.create_repository()).synchronise(
+            [FileSynchronisation(directory, "", overwrite=True, exclude=["*.log"])])
+        self.assertEqual({"README.md", f"{NEW_DIRECTORY_1}/new.txt", f"{NEW_DIRECTORY_1}/sub/nested.txt"},
+                         set(self.project.branches[_BRANCH]))
+
+    def test_synchronise_directory_keeps_filtered_out_files(self):
+        directory = os.path.join(self.temp_directory, NEW_DIRECTORY_1)
+        os.makedirs(directory)
+        self.create_file("new.txt", "new", directory)
+        ApiSynchroniser(self.create_repository()).synchronise(
+            [FileSynchronisation(directory, "", overwrite=True, exclude=["old.txt"])])
+        self.assertEqual({"README.md", f"{NEW_DIRECTORY_1}/new.txt", f"{NEW_DIRECTORY_1}/old.txt"},
+                         set(self.project.branches[_BRANCH]))
+
+    def test_synchronise_template(self):
+        source = self.create_file("template", json.dumps(TEMPLATE))
+        ApiSynchroniser(self.create_repository()).synchronise(
+            [TemplateSynchronisation(source, NEW_FILE_1, TEMPLATE_VARIABLES)])
+        self.assertEqual(TEMPLATE_VARIABLES, json.loads(self.project.branches[_BRANCH][NEW_FILE_1][1]))
+
+    def test_synchronise_template_with_templated_variables(self):
+        source = self.create_file("template", json.dumps(TEMPLATE))
+        variables = {name: f"{{{{ {name} }}}}" for name in TEMPLATE_VARIABLES.keys()}
+        self.assertRaises(ValueError, ApiSynchroniser(self.create_repository()).synchronise,
+                          [TemplateSynchronisation(source, NEW_FILE_1, variables)])
+        self.assertNotIn(NEW_FILE_1, self.project.branches[_BRANCH])
+
+    def test_synchronise_many_in_one_commit(self):
+        synchronisations = [FileSynchronisation(self.create_file(f"source-{i}", str(i)), f"file-{i}")
+                            for i in range(3)]
+        ApiSynchroniser(self.create_repository()).synchronise(synchronisations)
+        self.assertEqual(1, self.project.commits)
+
+    def test_synchronise_reports_results(self):
+        results = []
+        synchronisations = [FileSynchronisation(self.create_file("source", "content"), NEW_FILE_1),
+                            FileSynchronisation(self.create_file("readme", "readme\n"), "README.md", overwrite=True)]
+        ApiSynchroniser(self.create_repository()).synchronise(synchronisations, listener=results.append)
+        self.assertEqual([True, False], [result.synchronised for result in results])
+        self.assertEqual([self.project.heads[_BRANCH], None], [result.commit for result in results])
+
+    def test_dry_run(self):
+        synchronisation = FileSynchronisation(self.create_file("source", "content"), NEW_FILE_1)
+        synchronised = ApiSynchroniser(self.create_repository()).synchronise([synchronisation], dry_run=True)
+        self.assertEqual([synchronisation], synchronised)
+        self.assertEqual(0, self.project.commits)
+
+    def test_synchronise_new_branch(self):
+        synchronisations = [FileSynchronisation(self.create_file("source", "content"), NEW_FILE_1),
+                            FileSynchronisation(self.create_file("readme", "changed"), "README.md", overwrite=False),
+                            FileSynchronisation(self.create_file("old.txt", "changed"), NEW_DIRECTORY_1,
+                                                overwrite=True)]
+        synchronised = ApiSynchroniser(self.create_repository("other")).synchronise(synchronisations)
+        self.assertEqual([synchronisations[0], synchronisations[2]], synchronised)
+        self.assertEqual({"README.md": (REGULAR_FILE_MODE, b"readme\n"),
+                          f"{NEW_DIRECTORY_1}/old.txt": (REGULAR_FILE_MODE, b"changed"),
+                          NEW_FILE_1: (REGULAR_FILE_MODE, b"content")}, self.project.branches["other"])
+
+    def test_synchronise_subrepo(self):
+        subrepo = SubrepoSynchronisation(GitCheckout("https://example.com/repository.git", "master", "subrepo"))
+        self.assertRaises(ValueError, ApiSynchroniser(self.create_repository()).synchronise, [subrepo])
+
+    def test_destination_outside_of_repository(self):
+        synchronisation = FileSynchronisation(self.create_file("source", "content"), "../outside")
+        self.assertRaises(ValueError, ApiSynchroniser(self.create_repository()).synchronise, [synchronisation])
+
+
+class TestSynchroniseWithApi(_TestWithStubServer):
+    """
+    Tests for synchronising API repositories with `synchronise` and `synchronise_repositories`.
+    """
+    def test_synchronise(self):
+        source = self.create_file("source", "content")
+        repository = self.create_repository()
+        synchronised = synchronise(repository, [FileSynchronisation(source, NEW_FILE_1)])
+        self.assertEqual(1, len(synchronised[FileSynchronisation]))
+        self.assertEqual(self.project.heads[_BRANCH], repository.get_head())
+
+    def test_synchronise_repositories(self):
+        source = self.create_file("source", "content")
+        self.server.projects["other"] = StubProject()
+        jobs = [(self.create_repository(), [FileSynchronisation(source, NEW_FILE_1)]),
+                (ApiRepository(self.server.api_url, "other", _BRANCH, token=_TOKEN, pool=self.pool),
+                 [FileSynchronisation(source, NEW_FILE_1)]),
+                (ApiRepository(self.server.api_url, "missing", _BRANCH, token=_TOKEN, pool=self.pool),
+                 [FileSynchronisation(source, NEW_FILE_1)])]
+        results = synchronise_repositories(jobs, parallelism=2)
+        self.assertEqual([True, True, False], [result.succeeded for result in results])
+        self.assertEqual((REGULAR_FILE_MODE, b"content"), self.server.projects["other"].branches[_BRANCH][NEW_FILE_1])
+        self.assertLessEqual(self.pool.connections_made, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
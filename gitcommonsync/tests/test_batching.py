@@ -0,0 +1,85 @@
+import os
+import unittest
+
+from git import Repo
+
+from gitcommonsync.batching import merge_jobs, synchronise_hosts
+from gitcommonsync.models import FileSynchronisation, SubrepoSynchronisation
+from gitcommonsync.repository import GitRepository, GitCheckout
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, DEVELOP_BRANCH, MASTER_HEAD_COMMIT, \
+    MASTER_OLD_COMMIT
+
+_HOST_1 = "host-1"
+_HOST_2 = "host-2"
+_HOST_3 = "host-3"
+_HOST_FILE = "host-file.txt"
+
+
+class TestBatching(TestWithGitRepository):
+    """
+    Tests for batching the synchronisations of multiple hosts.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.source, _ = self.create_test_file()
+        self.jobs_by_host = {
+            _HOST_1: [(GitRepository(self.external_git_repository_location, MASTER_BRANCH),
+                       [FileSynchronisation(self.source, NEW_FILE_1)])],
+            _HOST_2: [(GitRepository(self.external_git_repository_location, DEVELOP_BRANCH),
+                       [FileSynchronisation(self.source, NEW_FILE_1)])],
+            _HOST_3: [(GitRepository(self.external_git_repository_location, MASTER_BRANCH),
+                       [FileSynchronisation(self.source, NEW_FILE_1), FileSynchronisation(self.source, _HOST_FILE)])]
+        }
+
+    def test_merge_jobs(self):
+        jobs, assignments = merge_jobs(self.jobs_by_host)
+        self.assertEqual([MASTER_BRANCH, DEVELOP_BRANCH], [repository.branch for repository, _ in jobs])
+        self.assertEqual([NEW_FILE_1, _HOST_FILE], [synchronisation.destination for synchronisation in jobs[0][1]])
+        self.assertEqual({_HOST_1: [0], _HOST_2: [1], _HOST_3: [0]}, assignments)
+
+    def test_merge_jobs_with_different_authors(self):
+        self.jobs_by_host[_HOST_3][0][0].author_name = "Other"
+        jobs, assignments = merge_jobs(self.jobs_by_host)
+        self.assertEqual(3, len(jobs))
+        self.assertEqual([2], assignments[_HOST_3])
+
+    def test_merge_jobs_with_subrepos_pinned_to_different_commits(self):
+        for host, commit in ((_HOST_1, MASTER_HEAD_COMMIT), (_HOST_3, MASTER_OLD_COMMIT)):
+            self.jobs_by_host[host][0][1].append(SubrepoSynchronisation(
+                GitCheckout(self.external_git_repository_location, MASTER_BRANCH, "subrepo", commit=commit)))
+        jobs, _ = merge_jobs(self.jobs_by_host)
+        self.assertEqual([MASTER_HEAD_COMMIT, MASTER_OLD_COMMIT],
+                         [synchronisation.checkout.commit for synchronisation in jobs[0][1]
+                          if isinstance(synchronisation, SubrepoSynchronisation)])
+
+    def test_synchronise_hosts(self):
+        results = synchronise_hosts(self.jobs_by_host, parallelism=2)
+        self.assertEqual({_HOST_1, _HOST_2, _HOST_3}, set(results.keys()))
+        self.assertEqual([NEW_FILE_1], [synchronisation.destination
+                                        for synchronisation in results[_HOST_1][0].synchronised[FileSynchronisation]])
+        self.assertEqual([NEW_FILE_1, _HOST_FILE],
+                         [synchronisation.destination
+                          for synchronisation in results[_HOST_3][0].synchronised[FileSynchronisation]])
+        self.assertIs(self.jobs_by_host[_HOST_3][0][0], results[_HOST_3][0].repository)
+        self.assertEqual(results[_HOST_1][0].commit, results[_HOST_3][0].commit)
+
+        # Each repository is synchronised in a single commit
+        repository = Repo(self.external_git_repository_location)
+        head = repository.heads[MASTER_BRANCH].commit
+        self.assertEqual(head.hexsha, results[_HOST_1][0].commit)
+        self.assertIn(_HOST_FILE, head.tree)
+        self.assertNotIn(NEW_FILE_1, head.parents[0].tree)
+
+    def test_synchronise_hosts_with_failure(self):
+        missing_repository = os.path.join(self.temp_directory, "does-not-exist")
+        self.jobs_by_host[_HOST_2] = [(GitRepository(missing_repository, MASTER_BRANCH),
+                                       [FileSynchronisation(self.source, NEW_FILE_1)])]
+        results = synchronise_hosts(self.jobs_by_host)
+        self.assertFalse(results[_HOST_2][0].succeeded)
+        self.assertTrue(results[_HOST_1][0].succeeded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import unittest
+
+from git import Repo
+
+from gitcommonsync.blobs import get_blob_id, get_content_blob_id, IndexSnapshot, MMAP_THRESHOLD
+from gitcommonsync.tests._common import TestWithGitRepository
+from gitcommonsync.tests.resources.information import FILE_1, DIRECTORY_1
+
+
+class TestGetBlobId(TestWithGitRepository):
+    """
+    Tests for `get_blob_id` and `get_content_blob_id`.
+    """
+    def test_get_blob_id(self):
+        location = os.path.join(self.git_directory, FILE_1)
+        self.assertEqual(Repo(self.git_directory).git.hash_object(location), get_blob_id(location))
+
+    def test_get_blob_id_of_large_file(self):
+        location, _ = self.create_test_file(contents="x" * (MMAP_THRESHOLD + 1))
+        self.assertEqual(Repo(self.git_directory).git.hash_object(location), get_blob_id(location))
+
+    def test_get_content_blob_id(self):
+        location, _ = self.create_test_file(contents="content")
+        self.assertEqual(get_blob_id(location), get_content_blob_id(b"content"))
+
+
+class TestIndexSnapshot(TestWithGitRepository):
+    """
+    Tests for `IndexSnapshot`.
+    """
+    def test_is_same_content(self):
+        index = IndexSnapshot.load(self.git_directory)
+        destination = os.path.join(self.git_directory, FILE_1)
+        same, _ = self.create_test_file(contents=open(destination).read())
+        different, _ = self.create_test_file(contents="different")
+        self.assertTrue(index.is_same_content(same, destination))
+        self.assertFalse(index.is_same_content(different, destination))
+        self.assertIsNone(index.is_same_content(same, os.path.join(self.git_directory, "other")))
+
+    def test_modified_files_not_in_snapshot(self):
+        destination = os.path.join(self.git_directory, FILE_1)
+        with open(destination, "a") as file:
+            file.write("modified")
+        self.assertIsNone(IndexSnapshot.load(self.git_directory).get(destination))
+
+    def test_discard(self):
+        index = IndexSnapshot.load(self.git_directory)
+        directory = os.path.join(self.git_directory, DIRECTORY_1)
+        in_directory = [path for path in Repo(self.git_directory).git.ls_files(DIRECTORY_1).splitlines()]
+        self.assertGreater(len(in_directory), 0)
+        index.discard(directory)
+        for path in in_directory:
+            self.assertIsNone(index.get(os.path.join(self.git_directory, path)))
+        self.assertIsNotNone(index.get(os.path.join(self.git_directory, FILE_1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+import yaml
+from git import Repo
+
+from gitcommonsync.cli import main, SUCCESS_EXIT_CODE, FAILURE_EXIT_CODE, INVALID_SPECIFICATION_EXIT_CODE
+from gitcommonsync.distributed import SqliteWorkQueue, submit
+from gitcommonsync.specification import load_specification
+from gitcommonsync.tests._common import TestWithGitRepository, TEMPLATE, TEMPLATE_VARIABLES, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, DEVELOP_BRANCH
+
+
+class TestCli(TestWithGitRepository):
+    """
+    Tests for the command line interface.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.template_source, _ = self.create_test_file(contents=json.dumps(TEMPLATE))
+
+    def test_invalid_specification(self):
+        self.assertEqual(INVALID_SPECIFICATION_EXIT_CODE, self._run({"templates": []}))
+
+    def test_invalid_repository_in_specification(self):
+        self.assertEqual(INVALID_SPECIFICATION_EXIT_CODE, self._run({
+            "repositories": [self.external_git_repository_location, {"branch": DEVELOP_BRANCH}]}))
+
+    def test_synchronise_repositories(self):
+        exit_code = self._run({
+            "repositories": [
+                self.external_git_repository_location,
+                {"repository": self.external_git_repository_location, "branch": DEVELOP_BRANCH}
+            ],
+            "templates": [{"src": self.template_source, "dest": NEW_FILE_1, "variables": TEMPLATE_VARIABLES}]
+        }, "--jobs", "2")
+        self.assertEqual(SUCCESS_EXIT_CODE, exit_code)
+        self.assertIn("2 repositories: 2 changed, 0 failed", self.output)
+        for branch in (MASTER_BRANCH, DEVELOP_BRANCH):
+            tree = Repo(self.external_git_repository_location).heads[branch].commit.tree
+            self.assertEqual(TEMPLATE_VARIABLES, json.loads(tree[NEW_FILE_1].data_stream.read()))
+
+    def test_synchronise_repositories_pipelined(self):
+        exit_code = self._run({
+            "repositories": [
+                self.external_git_repository_location,
+                {"repository": self.external_git_repository_location, "branch": DEVELOP_BRANCH}
+            ],
+            "templates": [{"src": self.template_source, "dest": NEW_FILE_1, "variables": TEMPLATE_VARIABLES}]
+        }, "--pipeline", "2,1,2")
+        self.assertEqual(SUCCESS_EXIT_CODE, exit_code)
+        self.assertIn("2 repositories: 2 changed, 0 failed", self.output)
+        for branch in (MASTER_BRANCH, DEVELOP_BRANCH):
+            tree = Repo(self.external_git_repository_location).heads[branch].commit.tree
+            self.assertEqual(TEMPLATE_VARIABLES, json.loads(tree[NEW_FILE_1].data_stream.read()))
+
+    def test_synchronise_with_failure(self):
+        exit_code = self._run({
+            "repositories": [os.path.join(self.temp_directory, "does-not-exist")],
+            "templates": [{"src": self.template_source, "dest": NEW_FILE_1, "variables": TEMPLATE_VARIABLES}]
+        })
+        self.assertEqual(FAILURE_EXIT_CODE, exit_code)
+        self.assertIn("1 repositories: 0 changed, 1 failed", self.output)
+
+    def test_work(self):
+        specification_location, _ = self.create_test_file(contents=yaml.safe_dump({
+            "repositories": [
+                self.external_git_repository_location,
+                {"repository": self.external_git_repository_location, "branch": DEVELOP_BRANCH}
+            ],
+            "templates": [{"src": self.template_source, "dest": NEW_FILE_1, "variables": TEMPLATE_VARIABLES}]
+        }))
+        queue_location = os.path.join(self.temp_directory, "queue.db")
+        submit(load_specification(specification_location), SqliteWorkQueue(queue_location), shard_size=1)
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            exit_code = main(["--work", queue_location])
+        self.assertEqual(SUCCESS_EXIT_CODE, exit_code)
+        self.assertIn("2 repositories: 2 changed, 0 failed", stdout.getvalue())
+        self.assertTrue(SqliteWorkQueue(queue_location).get_progress().finished)
+
+    def test_plan(self):
+        head = Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit
+        exit_code = self._run({
+            "repository": self.external_git_repository_location,
+            "templates": [{"src": self.template_source, "dest": NEW_FILE_1, "variables": TEMPLATE_VARIABLES}] * 2
+        }, "--plan")
+        self.assertEqual(SUCCESS_EXIT_CODE, exit_code)
+        self.assertIn("1 steps (1 duplicates removed)", self.output)
+        self.assertEqual(head, Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit)
+
+    def test_plan_with_conflict(self):
+        exit_code = self._run({
+            "repository": self.external_git_repository_location,
+            "templates": [{"src": self.template_source, "dest": NEW_FILE_1, "variables": TEMPLATE_VARIABLES},
+                          {"src": self.template_source, "dest": NEW_FILE_1, "variables": {}}]
+        }, "--plan")
+        self.assertEqual(FAILURE_EXIT_CODE, exit_code)
+        self.assertIn("conflict", self.output)
+
+    def _run(self,specification: dict, *arguments: str) -> int:
+        """
+        Runs the command line interface with the given specification.
+        :param specification: the synchronisation specification
+        :param arguments: additional command line arguments
+        :return: the exit code
+        """
+        specification_location, _ = self.create_test_file(contents=yaml.safe_dump(specification))
+        with patch("sys.stdout", new_callable=StringIO) as stdout, patch("sys.stderr", new_callable=StringIO):
+            exit_code = main([specification_location, *arguments])
+        self.output = stdout.getvalue()
+        return exit_code
+
+
+if __name__ == "__main__":
+    unittest.main()
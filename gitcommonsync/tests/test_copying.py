@@ -0,0 +1,127 @@
+import os
+import shutil
+import stat
+import unittest
+from tempfile import mkdtemp
+
+from gitcommonsync.filters import PathFilter
+from gitcommonsync.copying import synchronise_path, copy_file, StagingArea, HARDLINK_METHOD, REFLINK_METHOD, \
+    COPY_FILE_RANGE_METHOD, SENDFILE_METHOD, READ_WRITE_METHOD
+
+
+class TestCopying(unittest.TestCase):
+    """
+    Tests for `copy_file` and `synchronise_path`.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+        self.source = os.path.join(self.temp_directory, "source")
+        os.makedirs(os.path.join(self.source, "directory"))
+        self._write(os.path.join(self.source, "file.txt"), "file")
+        self._write(os.path.join(self.source, "directory", "nested.txt"), "nested")
+        os.symlink("file.txt", os.path.join(self.source, "link"))
+        self.destination = os.path.join(self.temp_directory, "destination")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def _write(self, location: str, content: str):
+        with open(location, "w") as file:
+            file.write(content)
+
+    def _read(self, location: str) -> str:
+        with open(location, "r") as file:
+            return file.read()
+
+    def test_copy_file(self):
+        destination = os.path.join(self.temp_directory, "copy.txt")
+        os.chmod(os.path.join(self.source, "file.txt"), 0o750)
+        method = copy_file(os.path.join(self.source, "file.txt"), destination)
+        self.assertIn(method, {REFLINK_METHOD, COPY_FILE_RANGE_METHOD, SENDFILE_METHOD, READ_WRITE_METHOD})
+        self.assertEqual("file", self._read(destination))
+        self.assertEqual(0o750, stat.S_IMODE(os.stat(destination).st_mode))
+
+    def test_copy_file_from_staging_area(self):
+        staging_area = StagingArea(os.path.join(self.temp_directory, "staging"))
+        source = os.path.join(self.source, "file.txt")
+        destinations = [os.path.join(self.temp_directory, f"copy-{i}.txt") for i in range(2)]
+        for destination in destinations:
+            self.assertEqual(HARDLINK_METHOD, copy_file(source, destination, staging_area))
+        self.assertEqual(os.stat(destinations[0]).st_ino, os.stat(destinations[1]).st_ino)
+        self.assertNotEqual(os.stat(source).st_ino, os.stat(destinations[0]).st_ino)
+        self.assertEqual(1, len(os.listdir(staging_area.directory)))
+        staging_area.close()
+        self.assertTrue(os.path.exists(staging_area.directory))
+
+    def test_synchronise_directory_contents(self):
+        self.assertTrue(synchronise_path(self.source + os.sep, self.destination))
+        self.assertEqual("nested", self._read(os.path.join(self.destination, "directory", "nested.txt")))
+        self.assertEqual("file.txt", os.readlink(os.path.join(self.destination, "link")))
+        self.assertFalse(synchronise_path(self.source + os.sep, self.destination))
+
+    def test_synchronise_directory(self):
+        os.makedirs(self.destination)
+        self.assertTrue(synchronise_path(self.source, self.destination))
+        self.assertEqual("file", self._read(os.path.join(self.destination, "source", "file.txt")))
+
+    def test_synchronise_deletes_and_replaces(self):
+        synchronise_path(self.source + os.sep, self.destination)
+        self._write(os.path.join(self.destination, "extra.txt"), "extra")
+        os.remove(os.path.join(self.destination, "directory", "nested.txt"))
+        os.makedirs(os.path.join(self.destination, "directory", "nested.txt"))
+        self._write(os.path.join(self.destination, "file.txt"), "changed")
+        self.assertTrue(synchronise_path(self.source + os.sep, self.destination))
+        self.assertFalse(os.path.exists(os.path.join(self.destination, "extra.txt")))
+        self.assertEqual("nested", self._read(os.path.join(self.destination, "directory", "nested.txt")))
+        self.assertEqual("file", self._read(os.path.join(self.destination, "file.txt")))
+
+    def test_synchronise_permissions(self):
+        synchronise_path(self.source + os.sep, self.destination)
+        os.chmod(os.path.join(self.source, "file.txt"), 0o700)
+        self.assertTrue(synchronise_path(self.source + os.sep, self.destination))
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(os.path.join(self.destination, "file.txt")).st_mode))
+
+    def test_synchronise_permissions_of_staged_file(self):
+        staging_area = StagingArea(os.path.join(self.temp_directory, "staging"))
+        source = os.path.join(self.source, "file.txt")
+        os.chmod(source, 0o644)
+        destinations = [os.path.join(self.temp_directory, name) for name in ("a", "b")]
+        for destination in destinations:
+            synchronise_path(self.source + os.sep, destination, staging_area)
+        staged = staging_area.stage(source)
+        os.chmod(source, 0o755)
+        self.assertTrue(synchronise_path(self.source + os.sep, destinations[0], staging_area))
+        self.assertEqual(0o755, stat.S_IMODE(os.stat(os.path.join(destinations[0], "file.txt")).st_mode))
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(os.path.join(destinations[1], "file.txt")).st_mode))
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(staged).st_mode))
+
+    def test_synchronise_file_into_directory(self):
+        os.makedirs(self.destination)
+        self.assertTrue(synchronise_path(os.path.join(self.source, "file.txt"), self.destination))
+        self.assertEqual("file", self._read(os.path.join(self.destination, "file.txt")))
+        self.assertFalse(synchronise_path(os.path.join(self.source, "file.txt"), self.destination))
+
+    def test_synchronise_with_exclude(self):
+        os.makedirs(os.path.join(self.destination, "directory"))
+        self._write(os.path.join(self.destination, "directory", "cache.txt"), "cache")
+        self._write(os.path.join(self.destination, "extra.txt"), "extra")
+        path_filter = PathFilter(exclude=["directory/", "extra.txt"])
+        self.assertTrue(synchronise_path(self.source + os.sep, self.destination, path_filter=path_filter))
+        self.assertEqual(["cache.txt"], os.listdir(os.path.join(self.destination, "directory")))
+        self.assertEqual("extra", self._read(os.path.join(self.destination, "extra.txt")))
+        self.assertEqual("file", self._read(os.path.join(self.destination, "file.txt")))
+
+    def test_synchronise_with_include(self):
+        os.makedirs(os.path.join(self.destination, "removed"))
+        self._write(os.path.join(self.destination, "removed", "nested.txt"), "removed")
+        self._write(os.path.join(self.destination, "kept.log"), "kept")
+        path_filter = PathFilter(include=["*.txt"])
+        self.assertTrue(synchronise_path(self.source + os.sep, self.destination, path_filter=path_filter))
+        self.assertEqual("nested", self._read(os.path.join(self.destination, "directory", "nested.txt")))
+        self.assertFalse(os.path.lexists(os.path.join(self.destination, "link")))
+        self.assertFalse(os.path.exists(os.path.join(self.destination, "removed")))
+        self.assertEqual("kept", self._read(os.path.join(self.destination, "kept.log")))
+
+
+if __name__ == "__main__":
+    unittest.main()
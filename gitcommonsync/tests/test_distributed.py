@@ -0,0 +1,150 @@
+import os
+import time
+import unittest
+
+from git import Repo
+
+from gitcommonsync.distributed import SqliteWorkQueue, Worker, RepositoryReport, submit, wait_for_run, shard
+from gitcommonsync.specification import REPOSITORIES_PROPERTY
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, DEVELOP_BRANCH
+
+_WORKER_1 = "worker-1"
+_WORKER_2 = "worker-2"
+
+
+class TestSqliteWorkQueue(TestWithGitRepository):
+    """
+    Tests for `SqliteWorkQueue`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.queue = SqliteWorkQueue(os.path.join(self.temp_directory, "queue.db"), max_attempts=2)
+
+    def test_lease_and_complete(self):
+        self.queue.put("run", [{"unit": 1}, {"unit": 2}])
+        first = self.queue.lease(_WORKER_1, 60)
+        second = self.queue.lease(_WORKER_2, 60)
+        self.assertEqual({"unit": 1}, first.payload)
+        self.assertEqual({"unit": 2}, second.payload)
+        self.assertIsNone(self.queue.lease(_WORKER_1, 60))
+
+        self.assertTrue(self.queue.complete(first, _WORKER_1, ["result"]))
+        progress = self.queue.get_progress("run")
+        self.assertEqual((0, 1, 1), (progress.pending, progress.leased, progress.done))
+        self.assertFalse(progress.finished)
+        self.assertTrue(self.queue.complete(second, _WORKER_2, None))
+        self.assertTrue(self.queue.get_progress().finished)
+        self.assertEqual([({"unit": 1}, ["result"]), ({"unit": 2}, None)], self.queue.get_finished("run"))
+
+    def test_expired_lease(self):
+        self.queue.put("run", [{"unit": 1}])
+        lost = self.queue.lease(_WORKER_1, 0)
+        time.sleep(0.01)
+        unit = self.queue.lease(_WORKER_2, 60)
+        self.assertEqual(lost.id, unit.id)
+        self.assertEqual(2, unit.attempts)
+        # The worker that lost the lease can neither renew it nor record a result
+        self.assertFalse(self.queue.renew(lost, _WORKER_1, 60))
+        self.assertFalse(self.queue.complete(lost, _WORKER_1, "late"))
+        self.assertTrue(self.queue.renew(unit, _WORKER_2, 60))
+        self.assertTrue(self.queue.complete(unit, _WORKER_2, "result"))
+        self.assertEqual([({"unit": 1}, "result")], self.queue.get_finished("run"))
+
+    def test_abandoned_after_max_attempts(self):
+        self.queue.put("run", [{"unit": 1}])
+        for _ in range(2):
+            self.assertIsNotNone(self.queue.lease(_WORKER_1, 0))
+            time.sleep(0.01)
+        self.queue.reclaim_expired()
+        progress = self.queue.get_progress("run")
+        self.assertEqual(1, progress.abandoned)
+        self.assertTrue(progress.finished)
+        self.assertIsNone(self.queue.lease(_WORKER_1, 60))
+        self.assertEqual([({"unit": 1}, None)], self.queue.get_finished("run"))
+
+    def test_runs_kept_separate(self):
+        self.queue.put("run-1", [{"unit": 1}])
+        self.queue.put("run-2", [{"unit": 2}])
+        self.assertEqual(1, self.queue.get_progress("run-1").pending)
+        self.assertEqual(2, self.queue.get_progress().pending)
+
+
+class TestDistributedSynchronisation(TestWithGitRepository):
+    """
+    Tests for distributing synchronisations between workers.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.source, _ = self.create_test_file()
+        self.queue = SqliteWorkQueue(os.path.join(self.temp_directory, "queue.db"))
+        self.missing_repository = os.path.join(self.temp_directory, "does-not-exist")
+        self.specification = {
+            REPOSITORIES_PROPERTY: [
+                self.external_git_repository_location,
+                {"repository": self.external_git_repository_location, "branch": DEVELOP_BRANCH},
+                self.missing_repository
+            ],
+            "branch": MASTER_BRANCH,
+            "key_file": None,
+            "author_name": None,
+            "author_email": None,
+            "templates": [],
+            "files": [{"src": self.source, "dest": NEW_FILE_1}],
+            "subrepos": []
+        }
+
+    def test_shard(self):
+        shards = list(shard(self.specification, 2))
+        self.assertEqual([2, 1], [len(unit["specification"][REPOSITORIES_PROPERTY]) for unit in shards])
+        self.assertEqual(self.specification["files"], shards[1]["specification"]["files"])
+
+    def test_shard_single_repository(self):
+        specification = {**self.specification, REPOSITORIES_PROPERTY: None}
+        self.assertEqual([{"specification": specification}], list(shard(specification, 2)))
+
+    def test_synchronise(self):
+        run = submit(self.specification, self.queue, shard_size=2)
+        worker_1_reports = Worker(self.queue, name=_WORKER_1).run()
+        self.assertEqual([], Worker(self.queue, name=_WORKER_2).run())
+        self.assertEqual(3, len(worker_1_reports))
+
+        reports = wait_for_run(self.queue, run, poll_interval=0.01)
+        self.assertEqual([(self.external_git_repository_location, MASTER_BRANCH),
+                          (self.external_git_repository_location, DEVELOP_BRANCH),
+                          (self.missing_repository, MASTER_BRANCH)],
+                         [(report.remote, report.branch) for report in reports])
+        for report in reports[0:2]:
+            self.assertTrue(report.succeeded)
+            self.assertEqual({"FileSynchronisation": 1}, report.synchronised)
+            self.assertEqual(Repo(self.external_git_repository_location).heads[report.branch].commit.hexsha,
+                             report.commit)
+        self.assertFalse(reports[2].succeeded)
+
+    def test_abandoned_units_reported_as_failed(self):
+        queue = SqliteWorkQueue(os.path.join(self.temp_directory, "abandoning.db"), max_attempts=1)
+        run = submit(self.specification, queue, shard_size=2)
+        queue.lease(_WORKER_1, 0)
+        time.sleep(0.01)
+        Worker(queue, name=_WORKER_2).run()
+
+        reports = wait_for_run(queue, run, poll_interval=0.01)
+        self.assertEqual(3, len(reports))
+        self.assertEqual([False, False, False], [report.succeeded for report in reports])
+        self.assertIn("Abandoned", reports[0].error)
+
+    def test_wait_for_unfinished_run(self):
+        run = submit(self.specification, self.queue)
+        self.assertRaises(TimeoutError, wait_for_run, self.queue, run, poll_interval=0.01, timeout=0.05)
+
+    def test_report_json(self):
+        report = RepositoryReport("remote", "branch", {"FileSynchronisation": 2}, commit="abc", duration=1.5)
+        copy = RepositoryReport.from_json(report.to_json())
+        self.assertEqual(report.to_json(), copy.to_json())
+        self.assertTrue(copy.changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
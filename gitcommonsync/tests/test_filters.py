@@ -0,0 +1,40 @@
+import unittest
+
+from gitcommonsync.filters import PathFilter
+
+
+class TestPathFilter(unittest.TestCase):
+    """
+    Tests for `PathFilter`.
+    """
+    def test_exclude(self):
+        path_filter = PathFilter(exclude=["*.pyc", "build/", "/docs/generated"])
+        self.assertTrue(path_filter.is_excluded("module.pyc", False))
+        self.assertTrue(path_filter.is_excluded("package/module.pyc", False))
+        self.assertTrue(path_filter.is_excluded("package/build", True))
+        self.assertFalse(path_filter.is_excluded("package/build", False))
+        self.assertTrue(path_filter.is_excluded("docs/generated", True))
+        self.assertFalse(path_filter.is_excluded("other/docs/generated", True))
+        self.assertFalse(path_filter.is_excluded("module.py", False))
+
+    def test_include(self):
+        path_filter = PathFilter(include=["*.md", "config/"], exclude=["private.md"])
+        self.assertTrue(path_filter.is_included("README.md"))
+        self.assertTrue(path_filter.is_included("config/nested/settings.yml"))
+        self.assertFalse(path_filter.is_included("setup.py"))
+        self.assertFalse(path_filter.is_included("private.md"))
+        self.assertTrue(PathFilter().is_included("setup.py"))
+
+    def test_is_path_excluded(self):
+        path_filter = PathFilter(exclude=["node_modules/"])
+        self.assertTrue(path_filter.is_path_excluded("node_modules"))
+        self.assertTrue(path_filter.is_path_excluded("web/node_modules/package/index.js"))
+        self.assertFalse(path_filter.is_path_excluded("web/index.js"))
+
+    def test_bool(self):
+        self.assertFalse(PathFilter())
+        self.assertTrue(PathFilter(exclude=["*"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import time
+import unittest
+from threading import Event
+from unittest.mock import patch
+
+from gitcommonsync.helpers import iterate_synchronisation_results, synchronise_repositories, \
+    RepositorySynchronisationResult, _RepositorySynchronisation, synchronise
+from gitcommonsync.models import FileSynchronisation, SubrepoSynchronisation
+from gitcommonsync.repository import GitRepository, GitCheckout
+from gitcommonsync.scheduling import HostScheduler
+from gitcommonsync.subrepo_engine import NativeSubrepoEngine
+from gitcommonsync.synchronisers import SynchronisationResult
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, DEVELOP_BRANCH, MASTER_HEAD_COMMIT
+
+
+class TestSynchroniseRepositories(TestWithGitRepository):
+    """
+    Tests for `synchronise_repositories`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+
+    def test_slow_repository_does_not_hold_back_others(self):
+        repositories = [GitRepository(self.external_git_repository_location, MASTER_BRANCH) for _ in range(10)]
+        all_taken = Event()
+        waited = []
+
+        def jobs():
+            for repository in repositories:
+                yield repository, []
+            all_taken.set()
+
+        def run(synchronisation: _RepositorySynchronisation):
+            if synchronisation.repository is repositories[0]:
+                waited.append(all_taken.wait(timeout=10))
+
+        with patch.object(_RepositorySynchronisation, "run", run):
+            results = synchronise_repositories(jobs(), parallelism=2)
+        self.assertEqual([True], waited)
+        self.assertEqual(repositories, [result.repository for result in results])
+
+
+class TestIterateSynchronisationResults(TestWithGitRepository):
+    """
+    Tests for `iterate_synchronisation_results`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.source, _ = self.create_test_file()
+
+    def test_iterate(self):
+        repositories = [GitRepository(self.external_git_repository_location, branch)
+                        for branch in (MASTER_BRANCH, DEVELOP_BRANCH)]
+        results = list(iterate_synchronisation_results(
+            [(repository, [FileSynchronisation(self.source, NEW_FILE_1)]) for repository in repositories],
+            parallelism=2))
+        repository_results = [result for result in results if isinstance(result, RepositorySynchronisationResult)]
+        synchronisation_results = [result for result in results if isinstance(result, SynchronisationResult)]
+        self.assertCountEqual(repositories, [result.repository for result in repository_results])
+        self.assertEqual(2, len(synchronisation_results))
+        for result in repository_results:
+            self.assertTrue(result.succeeded)
+            self.assertIsNotNone(result.commit)
+            self.assertGreater(result.duration, 0)
+            # The result of each synchronisation is given before that of its repository
+            synchronisation_result = next(synchronisation for synchronisation in synchronisation_results
+                                          if synchronisation.repository is result.repository)
+            self.assertLess(results.index(synchronisation_result), results.index(result))
+            self.assertEqual(result.commit, synchronisation_result.commit)
+
+    def test_stop_early(self):
+        taken = []
+
+        def jobs():
+            for i in range(10):
+                taken.append(i)
+                yield GitRepository(os.path.join(self.temp_directory, "does-not-exist"), MASTER_BRANCH), \
+                    [FileSynchronisation(self.source, NEW_FILE_1)]
+
+        results = iterate_synchronisation_results(jobs())
+        self.assertFalse(next(results).succeeded)
+        results.close()
+        self.assertLess(len(taken), 10)
+
+    def test_stop_early_when_scheduled(self):
+        started = []
+
+        def run(synchronisation: _RepositorySynchronisation):
+            if len(started) > 0:
+                time.sleep(0.1)
+            started.append(synchronisation.repository)
+            raise RuntimeError()
+
+        jobs = [(GitRepository(self.external_git_repository_location, MASTER_BRANCH), []) for _ in range(10)]
+        with patch.object(_RepositorySynchronisation, "run", run):
+            results = iterate_synchronisation_results(jobs, scheduler=HostScheduler())
+            self.assertFalse(next(results).succeeded)
+            results.close()
+        self.assertLess(len(started), 10)
+
+    def test_error_raised(self):
+        def jobs():
+            raise RuntimeError()
+            yield
+
+        self.assertRaises(RuntimeError, list, iterate_synchronisation_results(jobs()))
+
+
+class TestSynchronise(TestWithGitRepository):
+    """
+    Tests for `synchronise`.
+    """
+    def test_unpinned_subrepo(self):
+        self.git_repository.tear_down()
+        synchronisation = SubrepoSynchronisation(
+            GitCheckout(self.external_git_repository_location, MASTER_BRANCH, "subrepo"))
+        engine = NativeSubrepoEngine(os.path.join(self.temp_directory, "cache"))
+        results = []
+        try:
+            synchronised = synchronise(GitRepository(self.external_git_repository_location, MASTER_BRANCH),
+                                       [synchronisation], dry_run=True, subrepo_engine=engine, listener=results.append)
+        finally:
+            engine.close()
+        self.assertIs(synchronisation, synchronised[SubrepoSynchronisation][0])
+        self.assertIs(synchronisation, results[0].synchronisation)
+        self.assertIsNone(synchronisation.checkout.commit)
+        self.assertIn(MASTER_HEAD_COMMIT, results[0].reason)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import json
+import re
+import subprocess
+import sys
+import unittest
+from typing import Dict
+
+_HEAVY_MODULES = ["git", "gitsubrepo"]
+_LIGHTWEIGHT_MODULES = ["gitcommonsync.helpers", "gitcommonsync.synchronisers", "gitcommonsync.repository",
+                        "gitcommonsync.models"]
+_IMPORT_TIME_PATTERN = re.compile(r"^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)\s*$", re.MULTILINE)
+
+
+def get_cumulative_import_times(module: str) -> Dict[str, int]:
+    """
+    Gets the cumulative time (in microseconds) taken to import the given module and each of the modules it imports, as
+    measured in a fresh interpreter.
+    :param module: the module to import
+    :return: dictionary where the keys are module names and the values are the cumulative import times
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             stderr=subprocess.PIPE, encoding="utf-8", check=True)
+    return {name: int(time) for time, name in _IMPORT_TIME_PATTERN.findall(process.stderr)}
+
+
+class TestImports(unittest.TestCase):
+    """
+    Benchmarks of the cost of importing the package, which is paid at the start of every Ansible module run.
+    """
+    def test_heavy_modules_not_imported(self):
+        for module in _LIGHTWEIGHT_MODULES:
+            output = subprocess.check_output([
+                sys.executable, "-c",
+                f"import json, sys, {module}; print(json.dumps([name for name in {_HEAVY_MODULES} "
+                f"if name in sys.modules]))"], encoding="utf-8")
+            self.assertEqual([], json.loads(output), msg=f"Importing {module}")
+
+    def test_import_faster_than_git_python(self):
+        # Compared against the cost of importing GitPython, rather than an absolute time, so that the test is not
+        # dependent on the speed of the machine
+        package_import_time = min(get_cumulative_import_times("gitcommonsync.helpers")["gitcommonsync.helpers"]
+                                  for _ in range(3))
+        git_import_time = min(get_cumulative_import_times("git")["git"] for _ in range(3))
+        self.assertLess(package_import_time, git_import_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import unittest
+
+from gitcommonsync.helpers import synchronise_repositories
+from gitcommonsync.journal import Journal, STARTED_PHASE, PUSHED_PHASE, COMPLETED_PHASE
+from gitcommonsync.models import SubrepoSynchronisation
+from gitcommonsync.repository import GitRepository, GitCheckout
+from gitcommonsync.state import get_fingerprint
+from gitcommonsync.subrepo_engine import NativeSubrepoEngine
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_DIRECTORY_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, MASTER_HEAD_COMMIT, MASTER_OLD_COMMIT
+
+_FINGERPRINT = "fingerprint"
+
+
+class TestJournal(TestWithGitRepository):
+    """
+    Tests for `Journal`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.journal_location = os.path.join(self.temp_directory, "journal.jsonl")
+        self.repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH)
+
+    def _read_phases(self):
+        with open(self.journal_location, "r") as file:
+            return [json.loads(line)["phase"] for line in file if line.strip() != ""]
+
+    def test_resume(self):
+        journal = Journal(self.journal_location)
+        journal.record("remote", MASTER_BRANCH, STARTED_PHASE, _FINGERPRINT)
+        journal.record("remote", MASTER_BRANCH, COMPLETED_PHASE)
+        journal.close()
+
+        journal = Journal(self.journal_location, resume=True)
+        self.assertEqual((COMPLETED_PHASE, _FINGERPRINT), (journal.get("remote", MASTER_BRANCH).phase,
+                                                           journal.get("remote", MASTER_BRANCH).fingerprint))
+        journal.close()
+        journal = Journal(self.journal_location)
+        self.assertIsNone(journal.get("remote", MASTER_BRANCH))
+        journal.close()
+        journal = Journal(self.journal_location, resume=True)
+        self.assertIsNone(journal.get("remote", MASTER_BRANCH))
+        journal.close()
+
+    def test_resume_after_partial_record(self):
+        journal = Journal(self.journal_location)
+        journal.record("remote", MASTER_BRANCH, STARTED_PHASE, _FINGERPRINT)
+        journal.close()
+        with open(self.journal_location, "a") as file:
+            file.write('{"remote": "rem')
+
+        journal = Journal(self.journal_location, resume=True)
+        self.assertEqual(STARTED_PHASE, journal.get("remote", MASTER_BRANCH).phase)
+        journal.record("remote", MASTER_BRANCH, COMPLETED_PHASE)
+        journal.close()
+        journal = Journal(self.journal_location, resume=True)
+        self.assertEqual(COMPLETED_PHASE, journal.get("remote", MASTER_BRANCH).phase)
+        journal.close()
+
+    def test_is_completed(self):
+        journal = Journal(self.journal_location)
+        self.assertFalse(journal.is_completed(self.repository, _FINGERPRINT))
+        journal.record(self.repository.remote, MASTER_BRANCH, COMPLETED_PHASE, _FINGERPRINT)
+        self.assertTrue(journal.is_completed(self.repository, _FINGERPRINT))
+        self.assertFalse(journal.is_completed(self.repository, "other"))
+        journal.close()
+
+    def test_is_completed_when_pushed(self):
+        journal = Journal(self.journal_location)
+        journal.record(self.repository.remote, MASTER_BRANCH, PUSHED_PHASE, _FINGERPRINT, MASTER_OLD_COMMIT)
+        self.assertFalse(journal.is_completed(self.repository, _FINGERPRINT))
+        journal.record(self.repository.remote, MASTER_BRANCH, PUSHED_PHASE, _FINGERPRINT, MASTER_HEAD_COMMIT)
+        self.assertTrue(journal.is_completed(self.repository, _FINGERPRINT))
+        self.assertEqual(COMPLETED_PHASE, journal.get(self.repository.remote, MASTER_BRANCH).phase)
+        journal.close()
+
+    def test_synchronise_repositories(self):
+        engine = NativeSubrepoEngine(os.path.join(self.temp_directory, "cache"))
+        synchronisations = [SubrepoSynchronisation(GitCheckout(
+            self.external_git_repository_location, MASTER_BRANCH, NEW_DIRECTORY_1, commit=MASTER_OLD_COMMIT))]
+        try:
+            journal = Journal(self.journal_location)
+            result, = synchronise_repositories([(self.repository, synchronisations)], subrepo_engine=engine,
+                                               journal=journal)
+            self.assertTrue(result.changed)
+            entry = journal.get(self.repository.remote, MASTER_BRANCH)
+            self.assertEqual(get_fingerprint(synchronisations), entry.fingerprint)
+            self.assertEqual(self.repository.get_remote_head(), entry.commit)
+            journal.close()
+            self.assertEqual(["run", STARTED_PHASE, PUSHED_PHASE, COMPLETED_PHASE], self._read_phases())
+
+            journal = Journal(self.journal_location, resume=True)
+            result, = synchronise_repositories([(GitRepository(self.external_git_repository_location, MASTER_BRANCH),
+                                                 synchronisations)], subrepo_engine=engine, journal=journal)
+            journal.close()
+            self.assertTrue(result.succeeded)
+            self.assertFalse(result.changed)
+            self.assertEqual(["run", STARTED_PHASE, PUSHED_PHASE, COMPLETED_PHASE], self._read_phases())
+        finally:
+            engine.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
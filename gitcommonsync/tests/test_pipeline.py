@@ -0,0 +1,116 @@
+import os
+import time
+import unittest
+from threading import Lock
+
+from git import Repo
+
+from gitcommonsync.helpers import synchronise_repositories, PipelineStages
+from gitcommonsync.models import FileSynchronisation
+from gitcommonsync.pipeline import Pipeline, Stage
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, DEVELOP_BRANCH
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    Tests for `Pipeline`.
+    """
+    def test_run(self):
+        processed = []
+        errors = []
+
+        def fail_on_odd(item: int) -> bool:
+            if item % 2 == 1:
+                raise ValueError(item)
+            return True
+
+        Pipeline([Stage("first", 2, fail_on_odd), Stage("second", 1, lambda item: processed.append(item) or True)]) \
+            .run(range(6), lambda item, error: errors.append(item))
+        self.assertEqual([0, 2, 4], sorted(processed))
+        self.assertEqual([1, 3, 5], sorted(errors))
+
+    def test_backpressure(self):
+        lock = Lock()
+        waiting = [0]
+        most_waiting = [0]
+
+        def produce(item: int) -> bool:
+            with lock:
+                waiting[0] += 1
+                most_waiting[0] = max(most_waiting[0], waiting[0])
+            return True
+
+        def consume(item: int) -> bool:
+            time.sleep(0.01)
+            with lock:
+                waiting[0] -= 1
+            return True
+
+        Pipeline([Stage("produce", 2, produce), Stage("consume", 1, consume)], queue_size=1) \
+            .run(range(20), lambda item, error: None)
+        # Items being consumed, in the queue, and held by each producer waiting to put on the queue
+        self.assertLessEqual(most_waiting[0], 1 + 1 + 2)
+
+    def test_error_whilst_iterating(self):
+        processed = []
+
+        def items():
+            yield 1
+            raise RuntimeError()
+
+        with self.assertRaises(RuntimeError):
+            Pipeline([Stage("only", 1, lambda item: processed.append(item) or True)]) \
+                .run(items(), lambda item, error: None)
+        self.assertEqual([1], processed)
+
+
+class TestSynchroniseRepositoriesPipelined(TestWithGitRepository):
+    """
+    Tests for `synchronise_repositories` with a pipeline.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.source, _ = self.create_test_file()
+
+    def test_synchronise(self):
+        jobs = [(GitRepository(self.external_git_repository_location, branch),
+                 [FileSynchronisation(self.source, NEW_FILE_1)]) for branch in (MASTER_BRANCH, DEVELOP_BRANCH)]
+        jobs.insert(1, (GitRepository(os.path.join(self.temp_directory, "does-not-exist"), MASTER_BRANCH),
+                        [FileSynchronisation(self.source, NEW_FILE_1)]))
+        results = synchronise_repositories(jobs, pipeline=PipelineStages(2, 1, 2))
+        self.assertEqual([repository for repository, _ in jobs], [result.repository for result in results])
+        self.assertEqual([True, False, True], [result.succeeded for result in results])
+        self.assertTrue(results[0].changed)
+        for branch in (MASTER_BRANCH, DEVELOP_BRANCH):
+            self.assertIn(NEW_FILE_1, Repo(self.external_git_repository_location).heads[branch].commit.tree)
+        for repository, _ in jobs:
+            self.assertIsNone(repository.checkout_location)
+            self.assertFalse(repository.defer_pushes)
+
+    def test_cannot_be_scheduled(self):
+        from gitcommonsync.scheduling import HostScheduler
+        self.assertRaises(ValueError, synchronise_repositories, [], pipeline=PipelineStages(),
+                          scheduler=HostScheduler())
+
+
+class TestDeferredPush(TestWithGitRepository):
+    """
+    Tests for deferring the pushes of `GitRepository`.
+    """
+    def test_push_deferred(self):
+        head = Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit
+        self.git_repository.defer_pushes = True
+        self.create_test_file(directory=self.git_directory)
+        self.git_repository.commit("Test commit")
+        self.git_repository.push()
+        self.assertEqual(head, Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit)
+        self.assertTrue(self.git_repository.push_deferred())
+        self.assertNotEqual(head, Repo(self.external_git_repository_location).heads[MASTER_BRANCH].commit)
+        self.assertFalse(self.git_repository.push_deferred())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from gitcommonsync.models import FileSynchronisation, TemplateSynchronisation, SubrepoSynchronisation
+from gitcommonsync.planning import create_plan, PlanConflictError
+from gitcommonsync.repository import GitCheckout
+from gitcommonsync.synchronisers import SubrepoSynchroniser, FileSynchroniser, TemplateSynchroniser
+
+
+class TestCreatePlan(unittest.TestCase):
+    """
+    Tests for `create_plan`.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+        self.file_source = os.path.join(self.temp_directory, "file.txt")
+        with open(self.file_source, "w") as file:
+            file.write("12345")
+        self.directory_source = os.path.join(self.temp_directory, "directory")
+        os.makedirs(self.directory_source)
+        with open(os.path.join(self.directory_source, "other.txt"), "w") as file:
+            file.write("123")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def test_order(self):
+        template = TemplateSynchronisation(self.file_source, "template.txt", {})
+        file = FileSynchronisation(self.file_source, "file.txt")
+        directory = FileSynchronisation(self.directory_source, "directory")
+        subrepo = SubrepoSynchronisation(GitCheckout("url", "master", "subrepo"))
+        plan = create_plan([template, file, directory, subrepo])
+        self.assertEqual([subrepo, directory, file, template], plan.synchronisations)
+        self.assertEqual([(SubrepoSynchroniser, [subrepo]), (FileSynchroniser, [directory, file]),
+                          (TemplateSynchroniser, [template])], plan.get_batches())
+        self.assertEqual(frozenset(), plan.steps[0].dependencies)
+        self.assertEqual({plan.steps[0]}, plan.steps[1].dependencies)
+        self.assertEqual({plan.steps[1], plan.steps[2]}, plan.steps[3].dependencies)
+
+    def test_deduplicate(self):
+        plan = create_plan([FileSynchronisation(self.file_source, "file.txt"),
+                            FileSynchronisation(self.file_source, "other.txt"),
+                            FileSynchronisation(self.file_source, "file.txt")])
+        self.assertEqual(1, plan.duplicates)
+        self.assertEqual(["file.txt", "other.txt"], [step.synchronisation.destination for step in plan.steps])
+
+    def test_conflicting_destinations(self):
+        subrepo = SubrepoSynchronisation(GitCheckout("url", "master", "subrepo"))
+        for synchronisations in (
+                [FileSynchronisation(self.file_source, "file.txt"),
+                 FileSynchronisation(self.file_source, "./file.txt", overwrite=True)],
+                [subrepo, FileSynchronisation(self.file_source, "subrepo/file.txt")],
+                [FileSynchronisation(self.directory_source + os.sep, "directory"),
+                 TemplateSynchronisation(self.file_source, "directory/nested/template.txt", {})],
+                [FileSynchronisation(self.directory_source, "parent"),
+                 TemplateSynchronisation(self.file_source, "parent/directory/template.txt", {})]):
+            with self.assertRaises(PlanConflictError) as context:
+                create_plan(synchronisations)
+            self.assertEqual(1, len(context.exception.conflicts))
+
+    def test_non_conflicting_siblings(self):
+        plan = create_plan([FileSynchronisation(self.file_source, "a/file.txt"),
+                            FileSynchronisation(self.file_source, "a/file.txt.bak"),
+                            FileSynchronisation(self.file_source, "ab")])
+        self.assertEqual(3, len(plan.steps))
+
+    def test_directory_without_trailing_separator(self):
+        directory = FileSynchronisation(self.directory_source, "config")
+        file = FileSynchronisation(self.file_source, "config/file.txt")
+        self.assertEqual([directory, file], create_plan([directory, file]).synchronisations)
+
+    def test_estimate_cost(self):
+        plan = create_plan([
+            FileSynchronisation(self.file_source, "file.txt"),
+            FileSynchronisation(self.directory_source, "directory"),
+            SubrepoSynchronisation(GitCheckout("url", "master", "subrepo-1")),
+            SubrepoSynchronisation(GitCheckout("url", "master", "subrepo-2")),
+        ])
+        cost = plan.estimate_cost()
+        self.assertEqual(4, cost.steps)
+        self.assertEqual(1, cost.subrepo_fetches)
+        self.assertEqual(8, cost.source_bytes)
+        self.assertEqual(3, cost.max_commits)
+
+    def test_destination_inside_excluded_directory(self):
+        directory = FileSynchronisation(self.directory_source + os.sep, "directory", exclude=["generated/"])
+        template = TemplateSynchronisation(self.file_source, "directory/generated/template.txt", {})
+        self.assertEqual([directory, template], create_plan([directory, template]).synchronisations)
+        nested = FileSynchronisation(self.directory_source, "parent", exclude=["generated/"])
+        self.assertEqual(2, len(create_plan([nested, FileSynchronisation(
+            self.file_source, "parent/directory/generated/file.txt")]).synchronisations))
+        with self.assertRaises(PlanConflictError):
+            create_plan([directory, TemplateSynchronisation(self.file_source, "directory/template.txt", {})])
+
+
+if __name__ == "__main__":
+    unittest.main()
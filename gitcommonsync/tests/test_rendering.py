@@ -0,0 +1,87 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from unittest.mock import patch
+
+from gitcommonsync.blobs import get_content_blob_id
+from gitcommonsync.rendering import RenderCache, RenderedTemplate, get_render_key, render_template
+
+
+class TestRenderTemplate(unittest.TestCase):
+    """
+    Tests for `render_template`.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+        self.template = os.path.join(self.temp_directory, "template.j2")
+        with open(self.template, "w") as file:
+            file.write("{% if name %}\nHello {{ name }}\n{% endif %}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def test_render(self):
+        self.assertEqual(b"Hello world\n", render_template(self.template, {"name": "world"}))
+
+    def test_render_with_undefined_variable(self):
+        self.assertIsNone(render_template(self.template, {}))
+
+    def test_render_with_templated_variable(self):
+        self.assertIsNone(render_template(self.template, {"name": "{{ other }}", "other": "world"}))
+        self.assertIsNone(render_template(self.template, {"name": "world", "other": [{"nested": "{% if %}"}]}))
+
+    def test_render_with_environment_override(self):
+        with open(self.template, "r+") as file:
+            content = file.read()
+            file.seek(0)
+            file.write(f"#jinja2: trim_blocks: False\n{content}")
+        self.assertIsNone(render_template(self.template, {"name": "world"}))
+
+
+class TestRenderCache(unittest.TestCase):
+    """
+    Tests for `RenderCache`.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+        self.location = os.path.join(self.temp_directory, "renders.db")
+        self.template = os.path.join(self.temp_directory, "template.j2")
+        with open(self.template, "w") as file:
+            file.write("{{ name }}")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def test_render_from_cache(self):
+        rendered = RenderCache(self.location).render(self.template, {"name": "world"})
+        self.assertEqual(b"world", rendered.content)
+        self.assertEqual(get_content_blob_id(b"world"), rendered.blob_id)
+        with patch("gitcommonsync.rendering.render_template") as render:
+            cached = RenderCache(self.location).render(self.template, {"name": "world"})
+            render.assert_not_called()
+        self.assertEqual((rendered.content, rendered.blob_id), (cached.content, cached.blob_id))
+
+    def test_key_changes(self):
+        key = get_render_key(self.template, {"name": "world", "other": [1, 2]})
+        self.assertEqual(key, get_render_key(self.template, {"other": [1, 2], "name": "world"}))
+        self.assertNotEqual(key, get_render_key(self.template, {"name": "other", "other": [1, 2]}))
+        with open(self.template, "a") as file:
+            file.write("changed")
+        self.assertNotEqual(key, get_render_key(self.template, {"name": "world", "other": [1, 2]}))
+
+    def test_eviction(self):
+        cache = RenderCache(self.location, max_size=10)
+        cache.set("first", RenderedTemplate(b"123456"))
+        cache.set("second", RenderedTemplate(b"123"))
+        self.assertIsNotNone(cache.get("first"))
+        cache.set("third", RenderedTemplate(b"1234"))
+        self.assertIsNotNone(cache.get("first"))
+        self.assertIsNone(cache.get("second"))
+        self.assertIsNotNone(cache.get("third"))
+        cache.set("too-large", RenderedTemplate(b"12345678901"))
+        self.assertIsNone(cache.get("too-large"))
+
+
+if __name__ == "__main__":
+    unittest.main()
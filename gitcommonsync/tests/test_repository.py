@@ -27,6 +27,13 @@ class TestAnsibleModule(TestWithGitRepository):
         assert len(repository.refs) == 0
         self._assert_usable_checkout(self.git_repository.checkout(), BRANCH_NAME_1)
 
+    def test_checkout_existing_branch(self):
+        self.git_repository.branch = DEVELOP_BRANCH
+        location = self.git_repository.checkout()
+        repository = Repo(location)
+        self.assertEqual(DEVELOP_BRANCH, repository.active_branch.name)
+        self.assertEqual(repository.remotes.origin.refs[DEVELOP_BRANCH].commit, repository.head.commit)
+
     def _assert_usable_checkout(self, location: str, branch: str):
         repository = Repo(location)
         self.assertEqual(branch, repository.active_branch.name)
@@ -0,0 +1,114 @@
+import os
+import shutil
+import time
+import unittest
+from tempfile import mkdtemp
+from threading import Thread
+from unittest.mock import patch
+
+from gitcommonsync.helpers import synchronise_repositories
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.scheduling import get_remote_host, TokenBucket, HostScheduler, HostLimits, LOCAL_HOST
+
+_REMOTE_1 = "git@example.com:repository.git"
+_REMOTE_2 = "https://example.com/other-repository.git"
+_REMOTE_3 = "ssh://git@example.org/repository.git"
+
+
+class TestGetRemoteHost(unittest.TestCase):
+    """
+    Tests for `get_remote_host`.
+    """
+    def test_get_remote_host(self):
+        self.assertEqual("example.com", get_remote_host(_REMOTE_1))
+        self.assertEqual("example.com", get_remote_host(_REMOTE_2))
+        self.assertEqual("example.org", get_remote_host(_REMOTE_3))
+        self.assertEqual(LOCAL_HOST, get_remote_host("/tmp/repository.git"))
+        self.assertEqual(LOCAL_HOST, get_remote_host("file:///tmp/repository.git"))
+
+
+class TestTokenBucket(unittest.TestCase):
+    """
+    Tests for `TokenBucket`.
+    """
+    def test_rate_limited_after_burst(self):
+        bucket = TokenBucket(20, capacity=2)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # Two taken from the burst, then four at 20 per second
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, TokenBucket, 0)
+
+
+class TestHostScheduler(unittest.TestCase):
+    """
+    Tests for `HostScheduler`.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+        self.durations_location = os.path.join(self.temp_directory, "durations.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def test_concurrency_per_host(self):
+        scheduler = HostScheduler(HostLimits(max_concurrency=1), host_limits={"example.org": HostLimits()})
+        self.assertTrue(scheduler.try_acquire(_REMOTE_1))
+        self.assertFalse(scheduler.try_acquire(_REMOTE_2))
+        self.assertTrue(scheduler.try_acquire(_REMOTE_3))
+        self.assertTrue(scheduler.try_acquire(_REMOTE_3))
+        scheduler.release(_REMOTE_1)
+        self.assertTrue(scheduler.try_acquire(_REMOTE_2))
+
+    def test_get_order(self):
+        scheduler = HostScheduler(durations_location=self.durations_location)
+        scheduler.record_duration(_REMOTE_1, "master", 1.0)
+        scheduler.record_duration(_REMOTE_2, "master", 5.0)
+        repositories = [GitRepository(_REMOTE_1, "master"), GitRepository(_REMOTE_2, "master"),
+                        GitRepository(_REMOTE_3, "master")]
+        self.assertEqual([2, 1, 0], scheduler.get_order(repositories))
+        self.assertEqual([2, 1, 0], HostScheduler(durations_location=self.durations_location).get_order(repositories))
+
+    def test_synchronise_repositories(self):
+        scheduler = HostScheduler(HostLimits(max_concurrency=1, fetch_rate=100, push_rate=100),
+                                  durations_location=self.durations_location)
+        jobs = [(GitRepository(os.path.join(self.temp_directory, str(i)), "master"), []) for i in range(4)]
+        results = synchronise_repositories(jobs, parallelism=4, scheduler=scheduler)
+        self.assertEqual([repository for repository, _ in jobs], [result.repository for result in results])
+        self.assertTrue(all(result.succeeded for result in results))
+        for repository, _ in jobs:
+            self.assertIsNone(repository.scheduler)
+            self.assertIsNotNone(scheduler.get_duration(repository.remote, repository.branch))
+
+    def test_synchronise_repositories_when_host_busy(self):
+        scheduler = HostScheduler(HostLimits(max_concurrency=1))
+        jobs = [(GitRepository(os.path.join(self.temp_directory, "repository"), "master"), [])]
+        self.assertTrue(scheduler.try_acquire(jobs[0][0].remote))
+        results = []
+        with patch.object(scheduler, "wait_for_release", wraps=scheduler.wait_for_release) as wait_for_release:
+            thread = Thread(target=lambda: results.extend(synchronise_repositories(jobs, scheduler=scheduler)))
+            thread.start()
+            time.sleep(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertLessEqual(wait_for_release.call_count, 2)
+            scheduler.release(jobs[0][0].remote)
+            thread.join(10)
+        self.assertEqual(1, len(results))
+        self.assertTrue(results[0].succeeded)
+
+    def test_corrupt_durations_ignored(self):
+        with open(self.durations_location, "w") as file:
+            file.write('{"%s": {"master": 1' % _REMOTE_1)
+        scheduler = HostScheduler(durations_location=self.durations_location)
+        self.assertIsNone(scheduler.get_duration(_REMOTE_1, "master"))
+        scheduler.record_duration(_REMOTE_1, "master", 1.0)
+        scheduler = HostScheduler(durations_location=self.durations_location)
+        self.assertEqual(1.0, scheduler.get_duration(_REMOTE_1, "master"))
+        self.assertEqual(["durations.json"], os.listdir(self.temp_directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+from tempfile import mkdtemp
+
+from git import Repo
+
+from gitcommonsync._common import get_size
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.scratch import ScratchSpacePolicy
+from gitcommonsync.tests._common import TestWithGitRepository
+from gitcommonsync.tests.resources.information import MASTER_BRANCH
+
+
+class TestScratchSpacePolicy(TestWithGitRepository):
+    """
+    Tests for `ScratchSpacePolicy` and its use by `GitRepository`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.memory_directory = mkdtemp(dir=self.temp_directory)
+        self.disk_directory = mkdtemp(dir=self.temp_directory)
+        self.estimates_location = os.path.join(self.temp_directory, "estimates.json")
+
+    def _create_policy(self, **kwargs) -> ScratchSpacePolicy:
+        return ScratchSpacePolicy(self.memory_directory, self.disk_directory,
+                                  estimates_location=self.estimates_location, **kwargs)
+
+    def test_checkout_small_repository_in_memory(self):
+        policy = self._create_policy()
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH)
+        location = repository.checkout(scratch_space_policy=policy)
+        self.assertEqual(self.memory_directory, os.path.dirname(location))
+        self.assertGreater(policy.memory_reserved, 0)
+        repository.tear_down()
+        self.assertFalse(os.path.exists(location))
+        self.assertEqual(0, policy.memory_reserved)
+
+    def test_checkout_large_repository_on_disk(self):
+        policy = self._create_policy(size_threshold=1)
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH)
+        location = repository.checkout(scratch_space_policy=policy)
+        self.assertEqual(self.disk_directory, os.path.dirname(location))
+        self.assertEqual(0, policy.memory_reserved)
+        repository.tear_down()
+
+    def test_checkout_on_disk_when_memory_cap_reached(self):
+        policy = self._create_policy()
+        repositories = [GitRepository(self.external_git_repository_location, MASTER_BRANCH) for _ in range(2)]
+        location = repositories[0].checkout(scratch_space_policy=policy)
+        policy.memory_cap = policy.memory_reserved
+        other_location = repositories[1].checkout(scratch_space_policy=policy)
+        self.assertEqual(self.memory_directory, os.path.dirname(location))
+        self.assertEqual(self.disk_directory, os.path.dirname(other_location))
+        for repository in repositories:
+            repository.tear_down()
+
+    def test_checkout_of_unknown_size_on_disk(self):
+        policy = self._create_policy()
+        self.assertIsNone(policy.estimate_size("ssh://git@example.com/repository.git"))
+        space = policy.reserve("ssh://git@example.com/repository.git")
+        self.assertFalse(space.in_memory)
+        policy.release(space)
+
+    def test_spill_to_disk_when_larger_than_estimated(self):
+        with open(self.estimates_location, "w") as file:
+            file.write(f'{{"{self.external_git_repository_location}": 1}}')
+        policy = self._create_policy(size_threshold=2)
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH)
+        location = repository.checkout(scratch_space_policy=policy)
+        self.assertEqual(self.disk_directory, os.path.dirname(location))
+        self.assertEqual(MASTER_BRANCH, Repo(location).active_branch.name)
+        self.assertEqual(0, policy.memory_reserved)
+        self.assertEqual([], os.listdir(self.memory_directory))
+        repository.tear_down()
+
+    def test_size_estimated_from_previous_run(self):
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH)
+        location = repository.checkout(scratch_space_policy=self._create_policy())
+        size = get_size(location)
+        repository.tear_down()
+        self.assertEqual(size, self._create_policy().estimate_size(self.external_git_repository_location))
+        self.assertEqual(["estimates.json"], [name for name in os.listdir(self.temp_directory)
+                                              if name.startswith(".estimates.json") or name == "estimates.json"])
+
+    def test_corrupt_estimates_ignored(self):
+        with open(self.estimates_location, "w") as file:
+            file.write('{"git@example.com:repository.git": 1')
+        self.assertIsNone(self._create_policy().estimate_size("git@example.com:repository.git"))
+
+    def test_checkout_with_worktree_pool(self):
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH, worktree_pool=object())
+        self.assertRaises(ValueError, repository.checkout, scratch_space_policy=self._create_policy())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from git import Repo
+
+from gitcommonsync.session import GitSession
+from gitcommonsync.tests._common import TestWithGitRepository
+from gitcommonsync.tests.resources.information import FILE_1
+
+
+class TestGitSession(TestWithGitRepository):
+    """
+    Tests for `GitSession`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.session = GitSession(self.git_directory)
+
+    def tearDown(self):
+        self.session.close()
+        super().tearDown()
+
+    def test_repository_reused(self):
+        self.assertEqual(os.path.realpath(self.git_directory), os.path.realpath(self.session.repository.working_dir))
+        self.assertIs(self.session.repository, self.session.repository)
+
+    def test_get_config(self):
+        Repo(self.git_directory).git.config("gitcommonsync.test", "value")
+        self.assertEqual("value", self.session.get_config("gitcommonsync.test"))
+        Repo(self.git_directory).git.config("gitcommonsync.test", "changed")
+        self.assertEqual("value", self.session.get_config("gitcommonsync.test"))
+        self.assertIsNone(self.session.get_config("gitcommonsync.unset"))
+
+    def test_close(self):
+        repository = self.session.repository
+        self.session.close()
+        self.assertIsNot(repository, self.session.repository)
+
+
+class TestGitRepositorySession(TestWithGitRepository):
+    """
+    Tests for the session of `GitRepository`.
+    """
+    def test_session_shared_until_tear_down(self):
+        session = self.git_repository.session
+        with open(os.path.join(self.git_directory, FILE_1), "a") as file:
+            file.write("changed")
+        self.git_repository.commit("Test commit")
+        self.assertIs(session, self.git_repository.session)
+        self.assertEqual(Repo(self.git_directory).head.commit.hexsha, self.git_repository.get_head())
+        self.git_repository.tear_down()
+        self.assertRaises(NotADirectoryError, getattr, self.git_repository, "session")
+
+    def test_commit_without_changes(self):
+        head = self.git_repository.get_head()
+        self.git_repository.commit("Test commit")
+        self.assertEqual(head, self.git_repository.get_head())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from gitcommonsync.models import TemplateSynchronisation, FileSynchronisation, SubrepoSynchronisation
+from gitcommonsync.repository import GitCheckout
+from gitcommonsync.specification import iterate_jobs, parse_jobs, load_specification, InvalidSpecificationError
+
+_SPECIFICATION = """
+repositories:
+  - git@example.com:first.git
+  - repository: git@example.com:second.git
+    branch: develop
+    variables:
+      name: second
+templates:
+  - src: template.j2
+    dest: template.txt
+    variables:
+      name: default
+      other: value
+files:
+  - src: file.txt
+    dest: copied.txt
+    overwrite: true
+subrepos:
+  - src: git@example.com:subrepo.git
+    branch: master
+    dest: subrepo
+branch: main
+"""
+
+
+class TestSpecification(unittest.TestCase):
+    """
+    Tests for loading synchronisation specifications.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def _write_specification(self, content: str) -> str:
+        location = os.path.join(self.temp_directory, "specification.yml")
+        with open(location, "w") as file:
+            file.write(content)
+        return location
+
+    def test_iterate_jobs(self):
+        location = self._write_specification(_SPECIFICATION)
+        expected = parse_jobs(load_specification(location))
+        jobs = list(iterate_jobs(location))
+        self.assertEqual([(repository.remote, repository.branch) for repository, _ in expected],
+                         [(repository.remote, repository.branch) for repository, _ in jobs])
+        self.assertEqual(("git@example.com:second.git", "develop"), (jobs[1][0].remote, jobs[1][0].branch))
+        self.assertEqual("main", jobs[0][0].branch)
+        self.assertEqual([synchronisations for _, synchronisations in expected],
+                         [synchronisations for _, synchronisations in jobs])
+        self.assertEqual({"name": "second", "other": "value"}, jobs[1][1][0].variables)
+
+    def test_iterate_jobs_for_single_repository(self):
+        location = self._write_specification("repository: git@example.com:single.git\n")
+        jobs = list(iterate_jobs(location))
+        self.assertEqual(1, len(jobs))
+        self.assertEqual("git@example.com:single.git", jobs[0][0].remote)
+        self.assertEqual([], jobs[0][1])
+
+    def test_iterate_jobs_shares_variables(self):
+        location = self._write_specification(_SPECIFICATION.replace("      name: second\n", "      {}\n"))
+        (_, first), (_, second) = iterate_jobs(location)
+        self.assertIs(first[0].variables, second[0].variables)
+        self.assertIsNot(first[2].checkout, second[2].checkout)
+
+    def test_iterate_jobs_with_file_filters(self):
+        location = self._write_specification(
+            "repository: git@example.com:single.git\n"
+            "files:\n  - src: directory/\n    dest: directory\n    include: '*.md'\n    exclude:\n      - build/\n")
+        (_, (synchronisation, )), = iterate_jobs(location)
+        self.assertEqual((("*.md",), ("build/",)), (synchronisation.include, synchronisation.exclude))
+
+    def test_iterate_invalid_jobs(self):
+        for content in ("- not a mapping\n", "unknown: property\n", "templates: [\n",
+                        "repositories:\n  - branch: no-repository\n"):
+            location = self._write_specification(content)
+            self.assertRaises(InvalidSpecificationError, list, iterate_jobs(location))
+
+
+class TestSynchronisations(unittest.TestCase):
+    """
+    Tests for the synchronisation models.
+    """
+    def test_equality(self):
+        self.assertEqual(FileSynchronisation("a", "b"), FileSynchronisation("a", "b"))
+        self.assertNotEqual(FileSynchronisation("a", "b"), FileSynchronisation("a", "b", overwrite=True))
+        self.assertNotEqual(FileSynchronisation("a", "b"), TemplateSynchronisation("a", "b", {}))
+        self.assertNotEqual(FileSynchronisation("a", "b"), FileSynchronisation("a", "b", exclude=["c"]))
+        self.assertEqual(TemplateSynchronisation("a", "b", {"c": [1, {"d": 2}]}),
+                         TemplateSynchronisation("a", "b", {"c": [1, {"d": 2}]}))
+        self.assertEqual(SubrepoSynchronisation(GitCheckout("url", "master", "directory")),
+                         SubrepoSynchronisation(GitCheckout("url", "master", "directory")))
+        self.assertEqual(1, len({TemplateSynchronisation("a", "b", {"c": "d"}),
+                                 TemplateSynchronisation("a", "b", {"c": "d"})}))
+
+    def test_compact(self):
+        for synchronisation in (FileSynchronisation("a", "b"), TemplateSynchronisation("a", "b", {}),
+                                SubrepoSynchronisation(GitCheckout("url", "master", "directory"))):
+            self.assertFalse(hasattr(synchronisation, "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
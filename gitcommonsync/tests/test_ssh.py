@@ -0,0 +1,77 @@
+import os
+import unittest
+
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.ssh import SshMultiplexer, get_ssh_destination
+
+_REMOTE_1 = "ssh://git@example.com:2222/repository.git"
+_REMOTE_2 = "git@example.com:other-repository.git"
+_REMOTE_3 = "git@example.org:repository.git"
+
+
+class TestGetSshDestination(unittest.TestCase):
+    """
+    Tests for `get_ssh_destination`.
+    """
+    def test_ssh_url(self):
+        self.assertEqual(("git", "example.com", 2222), get_ssh_destination(_REMOTE_1))
+        self.assertEqual((None, "example.com", None), get_ssh_destination("git+ssh://example.com/repository.git"))
+
+    def test_scp_like(self):
+        self.assertEqual(("git", "example.com", None), get_ssh_destination(_REMOTE_2))
+        self.assertEqual((None, "example.com", None), get_ssh_destination("example.com:repository.git"))
+
+    def test_not_ssh(self):
+        for remote in ("https://example.com/repository.git", "file:///tmp/repository.git", "/tmp/repository.git",
+                       "./relative:path", "repository.git"):
+            self.assertIsNone(get_ssh_destination(remote), remote)
+
+
+class TestSshMultiplexer(unittest.TestCase):
+    """
+    Tests for `SshMultiplexer`.
+    """
+    def setUp(self):
+        self.multiplexer = SshMultiplexer(max_masters=2)
+
+    def tearDown(self):
+        self.multiplexer.close()
+
+    def test_same_master_for_same_destination(self):
+        arguments = self.multiplexer.get_ssh_arguments(_REMOTE_2)
+        self.assertIn("ControlMaster=auto", arguments)
+        self.assertEqual(arguments, self.multiplexer.get_ssh_arguments("git@example.com:another-repository.git"))
+
+    def test_different_master_for_different_key(self):
+        self.assertNotEqual(self.multiplexer.get_ssh_arguments(_REMOTE_2),
+                            self.multiplexer.get_ssh_arguments(_REMOTE_2, private_key_file="id_rsa"))
+
+    def test_control_path_in_private_directory(self):
+        arguments = self.multiplexer.get_ssh_arguments(_REMOTE_1)
+        control_path = [argument for argument in arguments if argument.startswith("ControlPath=")][0]
+        self.assertEqual(self.multiplexer.directory, os.path.dirname(control_path[len("ControlPath="):]))
+        self.assertEqual(0o700, os.stat(self.multiplexer.directory).st_mode & 0o777)
+
+    def test_not_multiplexed_when_maximum_masters_reached(self):
+        self.assertNotEqual([], self.multiplexer.get_ssh_arguments(_REMOTE_1))
+        self.assertNotEqual([], self.multiplexer.get_ssh_arguments(_REMOTE_2))
+        self.assertEqual([], self.multiplexer.get_ssh_arguments(_REMOTE_3))
+        self.assertNotEqual([], self.multiplexer.get_ssh_arguments(_REMOTE_1))
+
+    def test_not_multiplexed_when_not_ssh(self):
+        self.assertEqual([], self.multiplexer.get_ssh_arguments("/tmp/repository.git"))
+
+    def test_close(self):
+        self.multiplexer.get_ssh_arguments(_REMOTE_1)
+        self.multiplexer.close()
+        self.assertFalse(os.path.exists(self.multiplexer.directory))
+        self.assertEqual([], self.multiplexer.get_ssh_arguments(_REMOTE_1))
+
+    def test_used_by_repository(self):
+        repository = GitRepository(_REMOTE_1, "master", private_key_file="id_rsa", ssh_multiplexer=self.multiplexer)
+        self.assertIn(" ".join(self.multiplexer.get_ssh_arguments(_REMOTE_1, private_key_file="id_rsa")),
+                      repository._get_ssh_command())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from gitcommonsync.filters import PathFilter
+from gitcommonsync.helpers import synchronise
+from gitcommonsync.models import TemplateSynchronisation, FileSynchronisation, Synchronisation
+from gitcommonsync.state import SynchronisationStateStore, SynchronisationState, get_fingerprint, get_digest
+from gitcommonsync.tests._common import TestWithGitRepository, TEMPLATE, TEMPLATE_VARIABLES, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_HEAD_COMMIT, MASTER_BRANCH
+
+
+class _UnsupportedSynchronisation(Synchronisation):
+    """
+    Synchronisation of a type that cannot be fingerprinted.
+    """
+    __slots__ = ("overwrite",)
+
+    def __init__(self):
+        self.overwrite = False
+
+    def _get_key(self):
+        return ()
+
+
+class TestSynchronisationStateStore(TestWithGitRepository):
+    """
+    Tests for `SynchronisationStateStore`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.state_store = SynchronisationStateStore(os.path.join(self.temp_directory, "state.db"))
+        self.template_source, _ = self.create_test_file(contents=json.dumps(TEMPLATE))
+
+    def test_get_when_not_set(self):
+        self.assertIsNone(self.state_store.get(self.git_repository.remote, MASTER_BRANCH))
+
+    def test_set_and_get(self):
+        state = SynchronisationState(MASTER_HEAD_COMMIT, "fingerprint")
+        self.state_store.set(self.git_repository.remote, MASTER_BRANCH, state)
+        self.assertEqual(state, self.state_store.get(self.git_repository.remote, MASTER_BRANCH))
+        self.state_store.remove(self.git_repository.remote, MASTER_BRANCH)
+        self.assertIsNone(self.state_store.get(self.git_repository.remote, MASTER_BRANCH))
+
+    def test_fingerprint_changes_with_source_content(self):
+        synchronisations = [FileSynchronisation(self.template_source, NEW_FILE_1)]
+        fingerprint = get_fingerprint(synchronisations)
+        self.assertEqual(fingerprint, get_fingerprint(synchronisations))
+        with open(self.template_source, "a") as file:
+            file.write("changed")
+        self.assertNotEqual(fingerprint, get_fingerprint(synchronisations))
+
+    def test_fingerprint_of_unsupported_synchronisation(self):
+        self.assertRaises(TypeError, get_fingerprint, [_UnsupportedSynchronisation()])
+
+    def test_directory_digest_changes_with_file_names(self):
+        directory, _ = self.create_test_directory()
+        digest = get_digest(directory)
+        file = os.listdir(directory)[0]
+        os.rename(os.path.join(directory, file), os.path.join(directory, f"{file}-renamed"))
+        self.assertNotEqual(digest, get_digest(directory))
+
+    def test_directory_digest_ignores_excluded_files(self):
+        directory, _ = self.create_test_directory()
+        path_filter = PathFilter(exclude=["*.log"])
+        digest, filtered_digest = get_digest(directory), get_digest(directory, path_filter)
+        with open(os.path.join(directory, "excluded.log"), "w") as file:
+            file.write("excluded")
+        self.assertEqual(filtered_digest, get_digest(directory, path_filter))
+        self.assertNotEqual(digest, get_digest(directory))
+
+    def test_synchronise_skips_unchanged(self):
+        synchronisations = [TemplateSynchronisation(self.template_source, NEW_FILE_1, variables=TEMPLATE_VARIABLES)]
+        with patch.object(self.git_repository, "get_remote_head", wraps=self.git_repository.get_remote_head) \
+                as get_remote_head:
+            synchronised = synchronise(self.git_repository, synchronisations, state_store=self.state_store)
+        # The remote's head is only got before synchronising: the commit pushed is recorded
+        get_remote_head.assert_called_once()
+        self.assertEqual(synchronisations, sum(synchronised.values(), []))
+        state = self.state_store.get(self.git_repository.remote, MASTER_BRANCH)
+        self.assertEqual(self.external_git_repository.heads[MASTER_BRANCH].commit.hexsha, state.head)
+
+        with patch.object(self.git_repository, "checkout", side_effect=AssertionError("Should not checkout")):
+            synchronised = synchronise(self.git_repository, synchronisations, state_store=self.state_store)
+        self.assertEqual([], sum(synchronised.values(), []))
+
+    def test_synchronise_when_remote_changed(self):
+        synchronisations = [TemplateSynchronisation(self.template_source, NEW_FILE_1, variables=TEMPLATE_VARIABLES)]
+        synchronise(self.git_repository, synchronisations, state_store=self.state_store)
+        self.external_git_repository.heads[MASTER_BRANCH].commit = MASTER_HEAD_COMMIT
+        synchronised = synchronise(self.git_repository, synchronisations, state_store=self.state_store)
+        self.assertEqual(synchronisations, sum(synchronised.values(), []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import unittest
+
+from git import Repo
+
+from gitcommonsync.models import SubrepoSynchronisation
+from gitcommonsync.repository import GitCheckout
+from gitcommonsync.subrepo_engine import NativeSubrepoEngine
+from gitcommonsync.subrepos import read_subrepo, NotASubrepoError
+from gitcommonsync.synchronisers import SubrepoSynchroniser
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_DIRECTORY_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, MASTER_HEAD_COMMIT, MASTER_OLD_COMMIT, FILE_1, \
+    DEVELOP_BRANCH
+
+_OLD_FILE = "b.txt"
+
+
+class TestNativeSubrepoEngine(TestWithGitRepository):
+    """
+    Tests for `NativeSubrepoEngine` and its use by `SubrepoSynchroniser`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.engine = NativeSubrepoEngine(os.path.join(self.temp_directory, "cache"))
+        self.synchroniser = SubrepoSynchroniser(self.git_repository, engine=self.engine)
+        self.git_checkout = GitCheckout(self.external_git_repository_location, MASTER_BRANCH, NEW_DIRECTORY_1,
+                                        commit=MASTER_OLD_COMMIT)
+        self.git_subrepo_directory = os.path.join(self.git_directory, NEW_DIRECTORY_1)
+
+    def tearDown(self):
+        self.engine.close()
+        super().tearDown()
+
+    def _get_commit_count(self) -> int:
+        return len(list(Repo(self.git_directory).iter_commits()))
+
+    def test_sync_new_subrepo(self):
+        commit_count = self._get_commit_count()
+        synchronisations = [SubrepoSynchronisation(self.git_checkout)]
+        self.assertEqual(synchronisations, self.synchroniser.synchronise(synchronisations))
+        self.assertEqual(commit_count + 1, self._get_commit_count())
+        self.assertTrue(os.path.exists(os.path.join(self.git_subrepo_directory, _OLD_FILE)))
+        subrepo = read_subrepo(self.git_subrepo_directory)
+        self.assertEqual((self.external_git_repository_location, MASTER_BRANCH, MASTER_OLD_COMMIT),
+                         (subrepo.url, subrepo.branch, subrepo.commit))
+        self.assertEqual([], Repo(self.git_directory).index.diff(None))
+
+    def test_sync_up_to_date_subrepo(self):
+        self.synchroniser.synchronise([SubrepoSynchronisation(self.git_checkout)])
+        commit_count = self._get_commit_count()
+        self.assertEqual([], self.synchroniser.synchronise([SubrepoSynchronisation(self.git_checkout, overwrite=True)]))
+        self.assertEqual(commit_count, self._get_commit_count())
+
+    def test_sync_out_of_date_subrepo_in_place(self):
+        # Not pushed, so the head of the subrepo's remote does not change
+        self.synchroniser.synchronise([SubrepoSynchronisation(self.git_checkout)], dry_run=True)
+        commit_count = self._get_commit_count()
+        self.git_checkout.commit = None
+        synchronisations = [SubrepoSynchronisation(self.git_checkout, overwrite=True)]
+        self.assertEqual(synchronisations, self.synchroniser.synchronise(synchronisations))
+        self.assertEqual(commit_count + 1, self._get_commit_count())
+        self.assertFalse(os.path.exists(os.path.join(self.git_subrepo_directory, _OLD_FILE)))
+        self.assertTrue(os.path.exists(os.path.join(self.git_subrepo_directory, FILE_1)))
+        self.assertEqual(MASTER_HEAD_COMMIT, read_subrepo(self.git_subrepo_directory).commit)
+        self.assertNotIn(f"{NEW_DIRECTORY_1}/{_OLD_FILE}", Repo(self.git_directory).head.commit.tree)
+
+    def test_sync_out_of_date_subrepo_no_override(self):
+        self.synchroniser.synchronise([SubrepoSynchronisation(self.git_checkout)])
+        self.git_checkout.branch = DEVELOP_BRANCH
+        self.git_checkout.commit = None
+        self.assertEqual([], self.synchroniser.synchronise([SubrepoSynchronisation(self.git_checkout)]))
+        self.assertEqual(MASTER_OLD_COMMIT, read_subrepo(self.git_subrepo_directory).commit)
+
+    def test_sync_onto_existing_non_subrepo_directory(self):
+        os.makedirs(self.git_subrepo_directory)
+        self.assertRaises(NotASubrepoError, self.synchroniser.synchronise, [SubrepoSynchronisation(self.git_checkout)])
+
+
+if __name__ == "__main__":
+    unittest.main()
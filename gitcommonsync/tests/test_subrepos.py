@@ -0,0 +1,131 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from gitcommonsync.models import SubrepoSynchronisation, FileSynchronisation
+from gitcommonsync.repository import GitCheckout
+from gitcommonsync.subrepos import read_subrepo, get_subrepo_status, find_subrepos, NotASubrepoError, GITREPO_FILE, \
+    resolve_subrepo_commits, pin_subrepo_commits, is_same_commit
+from gitcommonsync.tests._common import TestWithGitRepository
+from gitcommonsync.tests.resources.information import MASTER_HEAD_COMMIT, MASTER_BRANCH, DEVELOP_BRANCH, \
+    MASTER_OLD_COMMIT
+
+_REMOTE = "git@example.com:repository.git"
+_GITREPO_CONTENT = f"""; DO NOT EDIT (unless you know what you are doing)
+;
+; This subdirectory is a git "subrepo", and this file is maintained by the
+; git-subrepo command. See https://github.com/git-commands/git-subrepo#readme
+;
+[subrepo]
+	remote = {_REMOTE}
+	branch = {MASTER_BRANCH}
+	commit = {MASTER_HEAD_COMMIT}
+	parent = e22fcb940d5356f8dc57fa99d7a6cb4ecdc04b66
+	method = merge
+	cmdver = 0.4.0
+"""
+
+
+class TestSubrepos(unittest.TestCase):
+    """
+    Tests for reading subrepo metadata.
+    """
+    def setUp(self):
+        self.temp_directory = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def _create_subrepo(self, directory: str, content: str=_GITREPO_CONTENT) -> str:
+        location = os.path.join(self.temp_directory, directory)
+        os.makedirs(location)
+        with open(os.path.join(location, GITREPO_FILE), "w") as file:
+            file.write(content)
+        return location
+
+    def test_read_subrepo(self):
+        checkout = read_subrepo(self._create_subrepo("subrepo"))
+        self.assertEqual(_REMOTE, checkout.url)
+        self.assertEqual(MASTER_BRANCH, checkout.branch)
+        self.assertEqual(MASTER_HEAD_COMMIT, checkout.commit)
+
+    def test_read_subrepo_with_quoted_values(self):
+        location = self._create_subrepo("subrepo", f'[subrepo]\n\tremote = "{_REMOTE}" ; comment\n'
+                                                   f'\tbranch = "with \\"quotes\\" " # comment\n')
+        checkout = read_subrepo(location)
+        self.assertEqual(_REMOTE, checkout.url)
+        self.assertEqual("with \"quotes\" ", checkout.branch)
+        self.assertIsNone(checkout.commit)
+
+    def test_read_non_subrepo(self):
+        self.assertRaises(NotASubrepoError, read_subrepo, self.temp_directory)
+        self.assertRaises(NotASubrepoError, read_subrepo, self._create_subrepo("invalid", "[core]\n\tbare = false\n"))
+
+    def test_get_subrepo_status(self):
+        self.assertEqual((_REMOTE, MASTER_BRANCH, MASTER_HEAD_COMMIT[0:7]),
+                         get_subrepo_status(self._create_subrepo("subrepo")))
+
+    def test_find_subrepos(self):
+        self._create_subrepo("subrepo")
+        self._create_subrepo(os.path.join("directory", "other"),
+                             _GITREPO_CONTENT.replace(MASTER_BRANCH, DEVELOP_BRANCH))
+        self._create_subrepo(os.path.join(".git", "ignored"))
+        subrepos = find_subrepos(self.temp_directory)
+        self.assertEqual({"subrepo", os.path.join("directory", "other")}, set(subrepos.keys()))
+        self.assertEqual(DEVELOP_BRANCH, subrepos[os.path.join("directory", "other")].branch)
+        self.assertEqual(os.path.join("directory", "other"), subrepos[os.path.join("directory", "other")].directory)
+
+    def test_is_same_commit(self):
+        self.assertTrue(is_same_commit(MASTER_HEAD_COMMIT, MASTER_HEAD_COMMIT[0:7]))
+        self.assertTrue(is_same_commit(MASTER_HEAD_COMMIT[0:7], MASTER_HEAD_COMMIT))
+        self.assertFalse(is_same_commit(MASTER_HEAD_COMMIT, MASTER_OLD_COMMIT[0:7]))
+        self.assertFalse(is_same_commit(None, MASTER_HEAD_COMMIT))
+
+
+class TestResolveSubrepoCommits(TestWithGitRepository):
+    """
+    Tests for `resolve_subrepo_commits` and `pin_subrepo_commits`.
+    """
+    def test_resolve(self):
+        synchronisations = [
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, MASTER_BRANCH, "a")),
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, MASTER_BRANCH, "b")),
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, DEVELOP_BRANCH, "c",
+                                               commit=MASTER_OLD_COMMIT)),
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, "does-not-exist", "d")),
+            FileSynchronisation("source", "destination")
+        ]
+        commits = resolve_subrepo_commits(synchronisations)
+        self.assertEqual({(self.external_git_repository_location, MASTER_BRANCH): MASTER_HEAD_COMMIT,
+                          (self.external_git_repository_location, "does-not-exist"): None}, commits)
+        self.assertEqual([None, None, MASTER_OLD_COMMIT, None],
+                         [synchronisation.checkout.commit for synchronisation in synchronisations[0:4]])
+
+    def test_resolve_unreachable_remote(self):
+        synchronisation = SubrepoSynchronisation(
+            GitCheckout(os.path.join(self.temp_directory, "does-not-exist"), MASTER_BRANCH, "a"))
+        self.assertEqual({(synchronisation.checkout.url, MASTER_BRANCH): None},
+                         resolve_subrepo_commits([synchronisation]))
+
+    def test_pin(self):
+        synchronisations = [
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, MASTER_BRANCH, "a"),
+                                   overwrite=True),
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, DEVELOP_BRANCH, "b",
+                                               commit=MASTER_OLD_COMMIT)),
+            SubrepoSynchronisation(GitCheckout(self.external_git_repository_location, "does-not-exist", "c")),
+            FileSynchronisation("source", "destination")
+        ]
+        indexed = {synchronisation: None for synchronisation in synchronisations}
+        pinned = pin_subrepo_commits(synchronisations, resolve_subrepo_commits(synchronisations))
+        self.assertEqual(SubrepoSynchronisation(GitCheckout(
+            self.external_git_repository_location, MASTER_BRANCH, "a", commit=MASTER_HEAD_COMMIT), overwrite=True),
+            pinned[0])
+        self.assertEqual(synchronisations[1:], pinned[1:])
+        self.assertIsNone(synchronisations[0].checkout.commit)
+        self.assertTrue(all(synchronisation in indexed for synchronisation in synchronisations))
+
+
+if __name__ == "__main__":
+    unittest.main()
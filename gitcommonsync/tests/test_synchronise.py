@@ -6,6 +6,7 @@ import unittest
 from abc import abstractmethod, ABCMeta
 from pathlib import Path
 from typing import Generic, TypeVar, Dict
+from unittest.mock import patch
 
 import gitsubrepo
 from git import Repo
@@ -13,6 +14,7 @@ from gitsubrepo.exceptions import NotAGitSubrepoException
 
 from gitcommonsync._ansible_runner import ANSIBLE_TEMPLATE_MODULE_NAME, run_ansible
 from gitcommonsync.models import FileSynchronisation, SubrepoSynchronisation, TemplateSynchronisation
+from gitcommonsync.rendering import RenderCache, get_render_key
 from gitcommonsync.repository import GitRepository, GitCheckout
 from gitcommonsync.synchronisers import Synchroniser, SubrepoSynchroniser, FileSynchroniser, TemplateSynchroniser
 from gitcommonsync.tests._common import get_md5, is_accessible, TestWithGitRepository, NEW_FILE_1, NEW_DIRECTORY_1, \
@@ -109,8 +111,9 @@ class TestSubrepoSynchroniser(_TestSynchroniser[SubrepoSynchroniser]):
 
     def test_sync_out_of_date_subrepo_to_intermediate_commit(self):
         self.git_checkout.commit = MASTER_HEAD_COMMIT
-        gitsubrepo.clone(self.git_checkout.url, self.git_subrepo_directory, branch=MASTER_BRANCH)
-        # Push the clone commit
+        gitsubrepo.clone(self.git_checkout.url, self.git_subrepo_directory, branch=MASTER_BRANCH,
+                         commit=MASTER_OLD_COMMIT)
+        # Push the clone commit, so the required commit is no longer the head of the branch
         self.git_repository.push()
         synchronisations = [SubrepoSynchronisation(self.git_checkout, overwrite=True)]
         synchronised = self.synchroniser.synchronise(synchronisations)
@@ -159,6 +162,31 @@ class TestFileSynchroniser(_TestFileBasedSynchroniser[FileSynchroniser]):
         synchronised = self.synchroniser.synchronise(synchronisations)
         self.assertEqual(0, len(synchronised))
 
+    def test_sync_up_to_date_file_not_rewritten(self):
+        destination = os.path.join(self.git_directory, FILE_1)
+        source, _ = self.create_test_file()
+        shutil.copy(destination, source)
+        inode = os.stat(destination).st_ino
+        with patch("gitcommonsync.copying.filecmp.cmp") as compare:
+            synchronised = self.synchroniser.synchronise([FileSynchronisation(source, destination, overwrite=True)])
+            compare.assert_not_called()
+        self.assertEqual(0, len(synchronised))
+        self.assertEqual(inode, os.stat(destination).st_ino)
+
+    def test_sync_reports_results(self):
+        results = []
+        new_source, _ = self.create_test_file()
+        up_to_date_source, _ = self.create_test_file()
+        shutil.copy(os.path.join(self.git_directory, FILE_1), up_to_date_source)
+        synchronisations = [FileSynchronisation(new_source, os.path.join(self.git_directory, NEW_FILE_1)),
+                            FileSynchronisation(up_to_date_source, os.path.join(self.git_directory, FILE_1),
+                                                overwrite=True)]
+        self.synchroniser.synchronise(synchronisations, listener=results.append)
+        self.assertEqual(synchronisations, [result.synchronisation for result in results])
+        self.assertEqual([True, False], [result.synchronised for result in results])
+        self.assertEqual([Repo(self.git_directory).head.commit.hexsha, None], [result.commit for result in results])
+        self.assertTrue(all(result.duration >= 0 and result.reason != "" for result in results))
+
     def test_sync_up_to_date_directory(self):
         source = os.path.join(self.temp_directory, DIRECTORY_1) + os.path.sep
         destination = os.path.join(self.git_directory, DIRECTORY_1)
@@ -272,6 +300,26 @@ class TestTemplateSynchroniser(_TestFileBasedSynchroniser[TemplateSynchroniser])
         synchronised = self.synchroniser.synchronise(synchronisations)
         self.assertEqual([], synchronised)
 
+    def test_sync_up_to_date_committed_template(self):
+        self._write_template()
+        Repo(self.git_directory).git.add(A=True)
+        synchronisations = [TemplateSynchronisation(
+            self.template_source, self.template_destination, variables=TEMPLATE_VARIABLES, overwrite=True)]
+        with patch("gitcommonsync.synchronisers.run_ansible") as ansible:
+            self.assertEqual([], self.synchroniser.synchronise(synchronisations))
+            ansible.assert_not_called()
+
+    def test_sync_with_render_cache(self):
+        render_cache = RenderCache(os.path.join(self.temp_directory, "renders.db"))
+        synchroniser = TemplateSynchroniser(self.git_repository, render_cache=render_cache)
+        synchronisations = [TemplateSynchronisation(
+            self.template_source, self.template_destination, variables=TEMPLATE_VARIABLES)]
+        self.assertEqual(synchronisations, synchroniser.synchronise(synchronisations))
+        self.assertIsNotNone(render_cache.get(get_render_key(self.template_source, TEMPLATE_VARIABLES)))
+        with patch("gitcommonsync.synchronisers.run_ansible") as ansible:
+            self.assertEqual([], synchroniser.synchronise(synchronisations))
+            ansible.assert_not_called()
+
     def test_sync_out_of_date_date_template_without_overwrite(self):
         self._write_template()
         altered_variables = {key: f"{value}-2" for key, value in TEMPLATE_VARIABLES.items()}
@@ -0,0 +1,97 @@
+import json
+import os
+import unittest
+from queue import Queue, Empty
+from threading import Thread
+
+from gitcommonsync.models import FileSynchronisation, TemplateSynchronisation
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.tests._common import TestWithGitRepository, TEMPLATE, TEMPLATE_VARIABLES, NEW_FILE_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH
+from gitcommonsync.watching import SourceWatcher, _InotifyMonitor, _PollingMonitor
+
+_TIMEOUT = 30
+
+
+class TestSourceWatcher(TestWithGitRepository):
+    """
+    Tests for `SourceWatcher`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.template_source, _ = self.create_test_file(contents=json.dumps(TEMPLATE))
+        self.directory_source, _ = self.create_test_directory()
+
+    def test_get_affected(self):
+        template_synchronisation = TemplateSynchronisation(self.template_source, NEW_FILE_1, TEMPLATE_VARIABLES)
+        directory_synchronisation = FileSynchronisation(self.directory_source + os.path.sep, NEW_FILE_1)
+        other_repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH)
+        watcher = SourceWatcher([(self.git_repository, [template_synchronisation, directory_synchronisation]),
+                                 (other_repository, [directory_synchronisation])])
+
+        file_in_directory = os.path.join(self.directory_source, os.listdir(self.directory_source)[0])
+        self.assertEqual({0: [directory_synchronisation], 1: [directory_synchronisation]},
+                         watcher.get_affected([file_in_directory]))
+        self.assertEqual({0: [template_synchronisation]}, watcher.get_affected([self.template_source]))
+        self.assertEqual({}, watcher.get_affected([f"{self.directory_source}-other"]))
+
+    @unittest.skipIf(not _InotifyMonitor.is_supported(), "inotify not supported")
+    def test_inotify_monitor(self):
+        self._assert_monitor_detects_changes(_InotifyMonitor([self.template_source, self.directory_source]))
+
+    def test_polling_monitor(self):
+        self._assert_monitor_detects_changes(_PollingMonitor([self.template_source, self.directory_source], 0.01))
+
+    def test_synchronise_on_change(self):
+        results = Queue()
+        synchronisation = TemplateSynchronisation(self.template_source, NEW_FILE_1, TEMPLATE_VARIABLES)
+        watcher = SourceWatcher([(self.git_repository, [synchronisation])], debounce=0.1, result_handler=results.put)
+        thread = Thread(target=watcher.run)
+        thread.start()
+        try:
+            # Changes may be missed until the watcher has started monitoring, so keep changing the source until it
+            # is synchronised
+            result = None
+            for _ in range(_TIMEOUT):
+                with open(self.template_source, "w") as file:
+                    json.dump({**TEMPLATE, "changed": "true"}, file)
+                try:
+                    result = results.get(timeout=1)
+                    break
+                except Empty:
+                    pass
+        finally:
+            watcher.stop()
+            thread.join(_TIMEOUT)
+
+        self.assertIsNotNone(result)
+        self.assertTrue(result.succeeded, msg=result.error)
+        self.assertEqual([synchronisation], result.synchronised[TemplateSynchronisation])
+        tree = self.external_git_repository.heads[MASTER_BRANCH].commit.tree
+        self.assertEqual({**TEMPLATE_VARIABLES, "changed": "true"}, json.loads(tree[NEW_FILE_1].data_stream.read()))
+
+    def _assert_monitor_detects_changes(self, monitor):
+        """
+        Asserts that the given monitor of the template source and directory source detects changes to them.
+        :param monitor: the monitor
+        """
+        try:
+            self.assertEqual(set(), monitor.wait(0.1))
+            with open(self.template_source, "a") as file:
+                file.write("changed")
+            self.assertIn(self.template_source, monitor.wait(_TIMEOUT))
+
+            new_directory = os.path.join(self.directory_source, "new")
+            os.mkdir(new_directory)
+            self.assertIn(new_directory, monitor.wait(_TIMEOUT))
+            new_file = os.path.join(new_directory, NEW_FILE_1)
+            with open(new_file, "w") as file:
+                file.write("new")
+            self.assertIn(new_file, monitor.wait(_TIMEOUT) | monitor.wait(0.1))
+        finally:
+            monitor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
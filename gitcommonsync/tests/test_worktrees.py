@@ -0,0 +1,85 @@
+import os
+import unittest
+from pathlib import Path
+
+from git import Repo
+
+from gitcommonsync._common import get_size
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.tests._common import TestWithGitRepository, NEW_FILE_1, BRANCH_NAME_1
+from gitcommonsync.tests.resources.information import MASTER_BRANCH, DEVELOP_BRANCH, MASTER_OLD_COMMIT
+from gitcommonsync.worktrees import WorktreePool
+
+
+class TestWorktreePool(TestWithGitRepository):
+    """
+    Tests for `WorktreePool` and its use by `GitRepository`.
+    """
+    def setUp(self):
+        super().setUp()
+        self.git_repository.tear_down()
+        self.pool = WorktreePool(os.path.join(self.temp_directory, "pool"))
+
+    def tearDown(self):
+        self.pool.close()
+        super().tearDown()
+
+    def test_reuse(self):
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH, worktree_pool=self.pool)
+        location = repository.checkout()
+        Path(os.path.join(location, NEW_FILE_1)).touch()
+        repository.commit("Unpushed")
+        repository.tear_down()
+        self.assertTrue(os.path.exists(location))
+
+        self.external_git_repository.heads[MASTER_BRANCH].commit = MASTER_OLD_COMMIT
+        self.assertEqual(location, repository.checkout())
+        self.assertFalse(os.path.exists(os.path.join(location, NEW_FILE_1)))
+        self.assertEqual(MASTER_OLD_COMMIT, Repo(location).head.commit.hexsha)
+        repository.tear_down()
+
+    def test_reuse_with_new_branch(self):
+        repository = GitRepository(self.external_git_repository_location, BRANCH_NAME_1, worktree_pool=self.pool)
+        for _ in range(2):
+            location = repository.checkout()
+            self.assertEqual(BRANCH_NAME_1, Repo(location).active_branch.name)
+            self.assertEqual(self.external_git_repository.heads[MASTER_BRANCH].commit, Repo(location).head.commit)
+            Path(os.path.join(location, NEW_FILE_1)).touch()
+            repository.commit("Not pushed")
+            repository.tear_down()
+
+    def test_push_from_pool(self):
+        repository = GitRepository(self.external_git_repository_location, DEVELOP_BRANCH, worktree_pool=self.pool)
+        location = repository.checkout()
+        Path(os.path.join(location, NEW_FILE_1)).touch()
+        repository.commit("Pushed")
+        repository.push()
+        repository.tear_down()
+        self.assertIn(NEW_FILE_1, self.external_git_repository.heads[DEVELOP_BRANCH].commit.tree)
+
+    def test_eviction(self):
+        locations = []
+        for branch in (MASTER_BRANCH, DEVELOP_BRANCH):
+            repository = GitRepository(self.external_git_repository_location, branch, worktree_pool=self.pool)
+            locations.append(repository.checkout())
+            repository.tear_down()
+
+        # Only the most recently used working tree fits
+        self.pool.evict(get_size(locations[1]))
+        self.pool.close()
+        self.assertFalse(os.path.exists(locations[0]))
+        self.assertTrue(os.path.exists(locations[1]))
+        self.assertEqual([], os.listdir(os.path.join(self.pool.directory, "trash")))
+
+    def test_eviction_skips_in_use(self):
+        repository = GitRepository(self.external_git_repository_location, MASTER_BRANCH, worktree_pool=self.pool)
+        location = repository.checkout()
+        repository.tear_down()
+        repository.checkout()
+        self.pool.evict(0)
+        self.assertTrue(os.path.exists(location))
+        repository.tear_down()
+
+
+if __name__ == "__main__":
+    unittest.main()
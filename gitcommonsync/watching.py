@@ -0,0 +1,364 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+from typing import List, Tuple, Dict, Set, Callable, Iterable, Optional
+
+from gitcommonsync.copying import StagingArea
+from gitcommonsync.helpers import synchronise_repositories, RepositorySynchronisationResult
+from gitcommonsync.journal import Journal
+from gitcommonsync.models import Synchronisation, FileSynchronisation
+from gitcommonsync.rendering import RenderCache
+from gitcommonsync.repository import GitRepository
+from gitcommonsync.scheduling import HostScheduler
+from gitcommonsync.scratch import ScratchSpacePolicy
+from gitcommonsync.state import SynchronisationStateStore
+from gitcommonsync.subrepo_engine import NativeSubrepoEngine
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_DEBOUNCE = 1.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE \
+              | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+Job = Tuple[GitRepository, List[Synchronisation]]
+
+
+class _Monitor(metaclass=ABCMeta):
+    """
+    Monitor of changes to files.
+    """
+    @abstractmethod
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        Waits for changes to the monitored files.
+        :param timeout: maximum time to wait for a change (in seconds)
+        :return: paths that have changed, which is empty if the timeout was reached. Includes all monitored locations if
+        changes may have been missed
+        """
+
+    @abstractmethod
+    def close(self):
+        """
+        Stops monitoring and releases any resources.
+        """
+
+
+class _InotifyMonitor(_Monitor):
+    """
+    Monitor of changes to files and (recursively) directories, using Linux's inotify.
+    """
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        Whether inotify is supported on this system.
+        :return: whether inotify is supported
+        """
+        return hasattr(_InotifyMonitor._load_libc(), "inotify_init1")
+
+    @staticmethod
+    def _load_libc() -> ctypes.CDLL:
+        return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+    def __init__(self, locations: Iterable[str]):
+        """
+        Constructor.
+        :param locations: the files and directories to monitor
+        """
+        self.locations = set(locations)
+        self._libc = _InotifyMonitor._load_libc()
+        self._file_descriptor = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._file_descriptor < 0:
+            raise OSError(ctypes.get_errno(), "Could not initialise inotify")
+        self._watched_directories: Dict[int, str] = {}
+        for location in self.locations:
+            if os.path.isdir(location):
+                self._watch_tree(location)
+            else:
+                # Watching the parent directory captures files that are replaced (e.g. by an editor moving a new file
+                # into place) as well as modified
+                self._watch(os.path.dirname(location))
+
+    def wait(self, timeout: float) -> Set[str]:
+        readable, _, _ = select.select([self._file_descriptor], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._file_descriptor, _READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                watch_descriptor, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_length].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + name_length
+
+                if mask & _IN_Q_OVERFLOW:
+                    _logger.warning("inotify event queue overflowed: assuming all locations have changed")
+                    changed.update(self.locations)
+                    continue
+                if mask & _IN_IGNORED:
+                    self._watched_directories.pop(watch_descriptor, None)
+                    continue
+                directory = self._watched_directories.get(watch_descriptor)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name)) if len(name) > 0 else directory
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._watch_tree(path)
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._file_descriptor)
+
+    def _watch_tree(self, directory: str):
+        """
+        Watches the given directory and all directories within it.
+        :param directory: the directory to watch
+        """
+        self._watch(directory)
+        for parent, directory_names, _ in os.walk(directory):
+            for name in directory_names:
+                self._watch(os.path.join(parent, name))
+
+    def _watch(self, directory: str):
+        """
+        Watches the given directory (not recursively).
+        :param directory: the directory to watch
+        """
+        watch_descriptor = self._libc.inotify_add_watch(self._file_descriptor, os.fsencode(directory), _WATCH_MASK)
+        if watch_descriptor < 0:
+            _logger.warning(f"Could not watch {directory}: {os.strerror(ctypes.get_errno())}")
+        else:
+            self._watched_directories[watch_descriptor] = directory
+
+
+class _PollingMonitor(_Monitor):
+    """
+    Monitor of changes to files and (recursively) directories, which compares the status of each file at an interval.
+    """
+    def __init__(self, locations: Iterable[str], interval: float=DEFAULT_POLL_INTERVAL):
+        """
+        Constructor.
+        :param locations: the files and directories to monitor
+        :param interval: time between checking for changes (in seconds)
+        """
+        self.locations = set(locations)
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def wait(self, timeout: float) -> Set[str]:
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._take_snapshot()
+            changed = {path for path in set(snapshot.keys()) | set(self._snapshot.keys())
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            remaining = deadline - time.monotonic()
+            if len(changed) > 0 or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        """
+        Gets the status of every monitored file.
+        :return: dictionary where the keys are file paths and the values are tuples of the modification time, size and
+        mode of the file
+        """
+        snapshot = {}
+        for location in self.locations:
+            paths = [location]
+            if os.path.isdir(location):
+                paths += [os.path.join(directory, name) for directory, directory_names, file_names in os.walk(location)
+                          for name in directory_names + file_names]
+            for path in paths:
+                try:
+                    status = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (status.st_mtime_ns, status.st_size, status.st_mode)
+        return snapshot
+
+
+class SourceWatcher:
+    """
+    Watches the sources of file and template synchronisations and, when they change, applies only the synchronisations
+    that use them to only the repositories that they are applied to.
+    """
+    def __init__(self, jobs: List[Job], *, parallelism: int=1, debounce: float=DEFAULT_DEBOUNCE, dry_run: bool=False,
+                 state_store: SynchronisationStateStore=None, scratch_space_policy: ScratchSpacePolicy=None,
+                 subrepo_engine: NativeSubrepoEngine=None, scheduler: HostScheduler=None, journal: Journal=None,
+                 staging_area: StagingArea=None, render_cache: RenderCache=None,
+                 result_handler: Callable[[RepositorySynchronisationResult], None]=lambda result: None,
+                 use_inotify: bool=None):
+        """
+        Constructor.
+        :param jobs: pairs where the first element is the git repository and the second is the synchronisations that
+        are applied to it
+        :param parallelism: the maximum number of repositories to synchronise at the same time
+        :param debounce: time (in seconds) to wait for changes to stop before synchronising, so that a burst of changes
+        (e.g. a `git pull` of the sources) is synchronised together
+        :param dry_run: does not push changes back if set to True
+        :param state_store: see `helpers.synchronise_repositories`
+        :param scratch_space_policy: see `helpers.synchronise_repositories`
+        :param subrepo_engine: see `helpers.synchronise_repositories`
+        :param scheduler: see `helpers.synchronise_repositories`
+        :param journal: see `helpers.synchronise_repositories`
+        :param staging_area: see `helpers.synchronise_repositories`
+        :param render_cache: see `helpers.synchronise_repositories`
+        :param result_handler: called with the result each time a repository is synchronised
+        :param use_inotify: whether to use inotify (polls for changes if `False`). Defaults to using inotify if it is
+        supported
+        """
+        if parallelism < 1:
+            raise ValueError(f"Parallelism must be at least 1: {parallelism}")
+        self.jobs = jobs
+        self.parallelism = parallelism
+        self.debounce = debounce
+        self.dry_run = dry_run
+        self.state_store = state_store
+        self.scratch_space_policy = scratch_space_policy
+        self.subrepo_engine = subrepo_engine
+        self.scheduler = scheduler
+        self.journal = journal
+        self.staging_area = staging_area
+        self.render_cache = render_cache
+        self.result_handler = result_handler
+        self.use_inotify = use_inotify if use_inotify is not None else _InotifyMonitor.is_supported()
+
+        self._source_index: Dict[str, List[Tuple[int, Synchronisation]]] = {}
+        for job_index, (_, synchronisations) in enumerate(jobs):
+            for synchronisation in synchronisations:
+                if isinstance(synchronisation, FileSynchronisation):
+                    source = os.path.normpath(synchronisation.source)
+                    self._source_index.setdefault(source, []).append((job_index, synchronisation))
+
+        self._stop = Event()
+        self._lock = Lock()
+        self._running: Set[int] = set()
+        self._pending: Dict[int, List[Synchronisation]] = {}
+
+    def get_affected(self, paths: Iterable[str]) -> Dict[int, List[Synchronisation]]:
+        """
+        Gets the synchronisations affected by changes to the given paths.
+        :param paths: the paths that have changed
+        :return: dictionary where the keys are the index of the job and the values are the synchronisations in that job
+        that use a changed path as (or within) their source
+        """
+        affected: Dict[int, List[Synchronisation]] = {}
+        for path in paths:
+            path = os.path.normpath(path)
+            for source, references in self._source_index.items():
+                if path == source or path.startswith(source + os.path.sep):
+                    for job_index, synchronisation in references:
+                        job_affected = affected.setdefault(job_index, [])
+                        if synchronisation not in job_affected:
+                            job_affected.append(synchronisation)
+        return affected
+
+    def run(self):
+        """
+        Watches for changes until `stop` is called.
+        """
+        self._stop.clear()
+        monitor = self._create_monitor()
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+                while not self._stop.is_set():
+                    changed = monitor.wait(self.debounce)
+                    if len(changed) == 0:
+                        continue
+                    while not self._stop.is_set():
+                        more_changed = monitor.wait(self.debounce)
+                        if len(more_changed) == 0:
+                            break
+                        changed |= more_changed
+
+                    _logger.info(f"Detected changes to {len(changed)} path(s)")
+                    for job_index, synchronisations in self.get_affected(changed).items():
+                        self._schedule(executor, job_index, synchronisations)
+        finally:
+            monitor.close()
+
+    def stop(self):
+        """
+        Stops watching for changes. Synchronisations that are in progress are completed.
+        """
+        self._stop.set()
+
+    def _create_monitor(self) -> _Monitor:
+        """
+        Creates a monitor of all of the watched sources.
+        :return: the monitor
+        """
+        locations = self._source_index.keys()
+        return _InotifyMonitor(locations) if self.use_inotify else _PollingMonitor(locations)
+
+    def _schedule(self, executor: ThreadPoolExecutor, job_index: int, synchronisations: List[Synchronisation]):
+        """
+        Schedules the given synchronisations of the repository in the given job. If the repository is already being
+        synchronised, the synchronisations are applied once it has finished.
+        :param executor: the executor of the synchronisations
+        :param job_index: the index of the job with the repository to synchronise
+        :param synchronisations: the synchronisations to apply
+        """
+        with self._lock:
+            if job_index in self._running:
+                pending = self._pending.setdefault(job_index, [])
+                pending.extend(synchronisation for synchronisation in synchronisations
+                               if synchronisation not in pending)
+                return
+            self._running.add(job_index)
+        executor.submit(self._synchronise, job_index, synchronisations)
+
+    def _synchronise(self, job_index: int, synchronisations: Optional[List[Synchronisation]]):
+        """
+        Applies the given synchronisations to the repository in the given job, followed by any that become pending in
+        the meantime.
+        :param job_index: the index of the job with the repository to synchronise
+        :param synchronisations: the synchronisations to apply
+        """
+        repository = self.jobs[job_index][0]
+        while synchronisations is not None:
+            result = synchronise_repositories(
+                [(repository, synchronisations)], dry_run=self.dry_run, state_store=self.state_store,
+                scratch_space_policy=self.scratch_space_policy, subrepo_engine=self.subrepo_engine,
+                scheduler=self.scheduler, journal=self.journal, staging_area=self.staging_area,
+                render_cache=self.render_cache)[0]
+            if not result.succeeded:
+                _logger.error(f"Failed to synchronise {repository.remote} ({repository.branch})", exc_info=result.error)
+            self.result_handler(result)
+
+            with self._lock:
+                synchronisations = self._pending.pop(job_index, None)
+                if synchronisations is None:
+                    self._running.remove(job_index)
@@ -0,0 +1,224 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Tuple
+from uuid import uuid4
+
+from gitcommonsync._common import get_size
+
+_logger = logging.getLogger(__name__)
+
+_TREES_DIRECTORY = "trees"
+_LOCKS_DIRECTORY = "locks"
+_TRASH_DIRECTORY = "trash"
+_POOL_LOCK_FILE = "pool.lock"
+_METADATA_SUFFIX = ".json"
+_LOCK_SUFFIX = ".lock"
+
+_REMOTE_METADATA_PROPERTY = "remote"
+_BRANCH_METADATA_PROPERTY = "branch"
+_SIZE_METADATA_PROPERTY = "size"
+_LAST_USED_METADATA_PROPERTY = "last_used"
+
+
+class WorktreePool:
+    """
+    Pool of working trees, kept between runs so that repositories do not have to be cloned (and deleted) each time they
+    are synchronised.
+
+    A working tree is kept for each remote and branch. It is refreshed each time it is acquired and is locked whilst in
+    use, so the pool can be shared between threads and processes. Least recently used working trees are evicted once the
+    size of the pool exceeds its quota. Evicted working trees are deleted in the background.
+    """
+    def __init__(self, directory: str, quota: int=None):
+        """
+        Constructor.
+        :param directory: the directory in which the working trees are kept, which is created if it does not exist
+        :param quota: the size (in bytes) that the working trees that are not in use may occupy, beyond which the least
+        recently used are evicted. Unlimited if `None`
+        """
+        self.directory = directory
+        self.quota = quota
+        self._lock_files: Dict[str, int] = {}
+        self._lock_files_lock = Lock()
+        self._deleter = ThreadPoolExecutor(max_workers=1)
+
+        for subdirectory in (_TREES_DIRECTORY, _LOCKS_DIRECTORY, _TRASH_DIRECTORY):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+        # Deletes anything left behind by previous runs
+        for name in os.listdir(os.path.join(directory, _TRASH_DIRECTORY)):
+            self._deleter.submit(shutil.rmtree, os.path.join(directory, _TRASH_DIRECTORY, name), ignore_errors=True)
+
+    def acquire(self, remote: str, branch: str, environment: Dict[str, str]=None) -> Tuple[str, bool]:
+        """
+        Acquires the working tree for the given remote and branch, waiting if it is in use.
+
+        An existing working tree is refreshed from the remote and any local changes (including untracked files and
+        unpushed commits) are discarded; otherwise, the remote is cloned.
+        :param remote: url of the remote
+        :param branch: the branch of interest, which is not checked out (see `GitRepository.checkout`)
+        :param environment: environment variables to set when calling git (e.g. `GIT_SSH_COMMAND`)
+        :return: tuple where the first element is the location of the working tree and the second is whether it was
+        reused
+        """
+        from git import Repo, GitCommandError
+
+        key = WorktreePool._get_key(remote, branch)
+        location = self._get_tree_location(key)
+        self._lock(key)
+        try:
+            if os.path.exists(location):
+                try:
+                    repository = Repo(location)
+                    repository.git.update_environment(**(environment or {}))
+                    repository.git.fetch("origin", prune=True)
+                    if len(repository.git.for_each_ref("refs/remotes/origin")) == 0:
+                        raise GitCommandError("fetch", "remote has no branches to refresh from")
+                    repository.git.reset(hard=True)
+                    repository.git.clean(f=True, d=True, x=True, ff=True)
+                    return location, True
+                except GitCommandError as e:
+                    _logger.warning(f"Could not refresh working tree for {remote} ({branch}) so re-cloning: {e}")
+                    self._delete(location)
+
+            try:
+                Repo.clone_from(url=remote, to_path=location, env=environment)
+            except Exception:
+                if os.path.exists(location):
+                    self._delete(location)
+                raise
+            return location, False
+        except Exception:
+            self._unlock(key)
+            raise
+
+    def release(self, location: str, remote: str, branch: str):
+        """
+        Releases the given working tree, acquired using `acquire`, so that it can be used again.
+        :param location: the location of the working tree
+        :param remote: the remote the working tree was acquired for
+        :param branch: the branch the working tree was acquired for
+        """
+        key = WorktreePool._get_key(remote, branch)
+        assert location == self._get_tree_location(key)
+        with open(self._get_tree_location(key) + _METADATA_SUFFIX, "w") as file:
+            json.dump({
+                _REMOTE_METADATA_PROPERTY: remote,
+                _BRANCH_METADATA_PROPERTY: branch,
+                _SIZE_METADATA_PROPERTY: get_size(location),
+                _LAST_USED_METADATA_PROPERTY: time.time()
+            }, file)
+        self._unlock(key)
+        if self.quota is not None:
+            self.evict(self.quota)
+
+    def evict(self, quota: int):
+        """
+        Evicts least recently used working trees that are not in use until those remaining fit in the given quota.
+        :param quota: the size (in bytes) that the remaining working trees may occupy
+        """
+        pool_lock_file = os.open(os.path.join(self.directory, _POOL_LOCK_FILE), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(pool_lock_file, fcntl.LOCK_EX)
+            trees = self._get_released_trees()
+            total_size = sum(size for _, size, _ in trees)
+            for key, size, _ in sorted(trees, key=lambda tree: tree[2]):
+                if total_size <= quota:
+                    break
+                if not self._lock(key, blocking=False):
+                    # In use, so does not count towards the quota
+                    total_size -= size
+                    continue
+                try:
+                    _logger.info(f"Evicting working tree {key} ({size} bytes)")
+                    self._delete(self._get_tree_location(key))
+                    os.remove(self._get_tree_location(key) + _METADATA_SUFFIX)
+                    total_size -= size
+                finally:
+                    self._unlock(key)
+        finally:
+            os.close(pool_lock_file)
+
+    def close(self):
+        """
+        Waits for the deletion of evicted working trees to complete.
+        """
+        self._deleter.shutdown(wait=True)
+
+    def _get_released_trees(self) -> List[Tuple[str, int, float]]:
+        """
+        Gets the working trees that have been released.
+        :return: list of tuples of the key, size and time of last use of each working tree
+        """
+        trees = []
+        trees_directory = os.path.join(self.directory, _TREES_DIRECTORY)
+        for name in os.listdir(trees_directory):
+            if name.endswith(_METADATA_SUFFIX):
+                try:
+                    with open(os.path.join(trees_directory, name), "r") as file:
+                        metadata = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                trees.append((name[:-len(_METADATA_SUFFIX)], metadata[_SIZE_METADATA_PROPERTY],
+                              metadata[_LAST_USED_METADATA_PROPERTY]))
+        return trees
+
+    def _delete(self, location: str):
+        """
+        Deletes the given working tree in the background, after moving it out of the pool.
+        :param location: location of the working tree
+        """
+        trash_location = os.path.join(self.directory, _TRASH_DIRECTORY, f"{os.path.basename(location)}-{uuid4()}")
+        os.rename(location, trash_location)
+        self._deleter.submit(shutil.rmtree, trash_location, ignore_errors=True)
+
+    def _lock(self, key: str, blocking: bool=True) -> bool:
+        """
+        Locks the working tree with the given key.
+        :param key: the working tree's key
+        :param blocking: whether to wait for the lock if the working tree is locked
+        :return: whether the lock was acquired
+        """
+        lock_file = os.open(os.path.join(self.directory, _LOCKS_DIRECTORY, f"{key}{_LOCK_SUFFIX}"),
+                            os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_file)
+            return False
+        with self._lock_files_lock:
+            self._lock_files[key] = lock_file
+        return True
+
+    def _unlock(self, key: str):
+        """
+        Unlocks the working tree with the given key.
+        :param key: the working tree's key
+        """
+        with self._lock_files_lock:
+            lock_file = self._lock_files.pop(key)
+        os.close(lock_file)
+
+    def _get_tree_location(self, key: str) -> str:
+        """
+        Gets the location of the working tree with the given key.
+        :param key: the working tree's key
+        :return: the location of the working tree
+        """
+        return os.path.join(self.directory, _TREES_DIRECTORY, key)
+
+    @staticmethod
+    def _get_key(remote: str, branch: str) -> str:
+        """
+        Gets the key that identifies the working tree for the given remote and branch.
+        :param remote: url of the remote
+        :param branch: the branch
+        :return: the key
+        """
+        return hashlib.sha256(f"{remote}\0{branch}".encode()).hexdigest()[:32]
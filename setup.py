@@ -17,5 +17,10 @@ setup(
     license="MIT",
     description="A tool to synchronise common files between Git repositories",
     long_description=read_markdown("README.md"),
+    entry_points={
+        "console_scripts": [
+            "gitcommonsync=gitcommonsync.cli:main"
+        ]
+    },
     zip_safe=True
 )